@@ -0,0 +1 @@
+# The benchmarks package seeds synthetic datasets and measures the API under load. See `python -m app.cli seed --help` and `python -m app.cli bench --help`.
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import platform
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+from httpx import AsyncClient
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+
+SAMPLE_POINTS = 256
+
+class Scenario(NamedTuple):
+    """
+    A request to benchmark.
+
+    Attributes:
+        name (str): The name of the scenario in the report.
+        method (str): The HTTP method.
+        path (Callable): Builds the path from the random generator and the dataset bounds.
+        body (Optional[Callable]): Builds the JSON body from the random generator and the dataset bounds.
+        write (bool): Whether the request changes the data.
+        requests (Optional[int]): The number of requests to send, overriding the run default (used for exports).
+    """
+    name: str
+    method: str
+    path: Callable[[random.Random, dict], str]
+    body: Optional[Callable[[random.Random, dict], Any]] = None
+    write: bool = False
+    requests: Optional[int] = None
+
+def _id(rng: random.Random, bounds: dict, table: str) -> int:
+    low, high = bounds[table]
+    return rng.randint(low, high) if high else 1
+
+def _point(rng: random.Random, bounds: dict) -> tuple:
+    return rng.choice(bounds["points"]) if bounds["points"] else (0.0, 0.0)
+
+def _nearby(rng: random.Random, bounds: dict) -> str:
+    latitude, longitude = _point(rng, bounds)
+    return f"/locations/nearby?latitude={latitude}&longitude={longitude}&k=10"
+
+def _viewport(rng: random.Random, bounds: dict, span: float, zoom: int) -> str:
+    latitude, longitude = _point(rng, bounds)
+    south, north = max(-90.0, latitude - span / 2), min(90.0, latitude + span / 2)
+    west, east = ((longitude - span + 180) % 360 - 180, (longitude + span + 180) % 360 - 180) if span < 180 else (-180.0, 180.0)
+    return (f"/locations/viewport?min_latitude={south}&max_latitude={north}"
+            f"&min_longitude={west}&max_longitude={east}&zoom={zoom}")
+
+def _new_location(rng: random.Random, bounds: dict) -> dict:
+    latitude, longitude = _point(rng, bounds)
+    return {"latitude": latitude + rng.uniform(-0.01, 0.01), "longitude": longitude + rng.uniform(-0.01, 0.01)}
+
+def _relation(rng: random.Random, bounds: dict) -> dict:
+    return {"location_id": _id(rng, bounds, "locations"), "category_id": _id(rng, bounds, "categories")}
+
+SCENARIOS = [
+    Scenario("locations.list", "GET", lambda rng, bounds: "/locations/?limit=100"),
+    Scenario("locations.list_1000", "GET", lambda rng, bounds: "/locations/?limit=1000"),
+    Scenario("locations.detail", "GET", lambda rng, bounds: f"/locations/{_id(rng, bounds, 'locations')}"),
+    Scenario("locations.nearby", "GET", _nearby),
+    Scenario("locations.viewport_city", "GET", lambda rng, bounds: _viewport(rng, bounds, 0.2, 12)),
+    Scenario("locations.viewport_continent", "GET", lambda rng, bounds: _viewport(rng, bounds, 60.0, 4)),
+    Scenario("locations.viewport_world", "GET", lambda rng, bounds: _viewport(rng, bounds, 360.0, 1)),
+    Scenario("tiles.heatmap", "GET", lambda rng, bounds: "/tiles/?precision=3"),
+    Scenario("locations.export", "GET", lambda rng, bounds: "/locations/export", requests=1),
+    Scenario("categories.list", "GET", lambda rng, bounds: "/categories/?limit=100"),
+    Scenario("categories.list_1000", "GET", lambda rng, bounds: "/categories/?limit=1000"),
+    Scenario("categories.detail", "GET", lambda rng, bounds: f"/categories/{_id(rng, bounds, 'categories')}"),
+    Scenario("categories.export", "GET", lambda rng, bounds: "/categories/export", requests=1),
+    Scenario("recommendations.fresh", "GET", lambda rng, bounds: "/recommendations/fresh/?limit=100"),
+    Scenario("recommendations.fresh_1000", "GET", lambda rng, bounds: "/recommendations/fresh/?limit=1000"),
+    Scenario("recommendations.never_reviewed", "GET", lambda rng, bounds: "/recommendations/never-reviewed/?limit=100"),
+    Scenario("recommendations.detail", "GET", lambda rng, bounds: f"/recommendations/{_id(rng, bounds, 'relations')}"),
+    Scenario("recommendations.history", "GET", lambda rng, bounds: f"/recommendations/{_id(rng, bounds, 'relations')}/reviews"),
+    Scenario("recommendations.export", "GET", lambda rng, bounds: "/recommendations/export", requests=1),
+    Scenario("locations.create", "POST", lambda rng, bounds: "/locations/", _new_location, write=True),
+    Scenario("locations.bulk", "POST", lambda rng, bounds: "/locations/bulk",
+             lambda rng, bounds: [_new_location(rng, bounds) for _ in range(100)], write=True),
+    Scenario("categories.create", "POST", lambda rng, bounds: "/categories/",
+             lambda rng, bounds: {"name": f"Benchmark {uuid.uuid4().hex}"}, write=True),
+    Scenario("recommendations.create", "POST", lambda rng, bounds: "/recommendations/", _relation, write=True),
+    Scenario("recommendations.with_review", "POST", lambda rng, bounds: "/recommendations/with-review/", _relation, write=True),
+    Scenario("recommendations.review", "POST", lambda rng, bounds: f"/recommendations/{_id(rng, bounds, 'relations')}/review", write=True),
+    Scenario("recommendations.review_bulk", "POST", lambda rng, bounds: "/recommendations/review/bulk",
+             lambda rng, bounds: [{"id": _id(rng, bounds, "relations")} for _ in range(50)], write=True),
+]
+
+async def dataset_bounds(db: AsyncSession, seed: int = 0) -> dict:
+    """
+    Reads the ID ranges and size of each table, and a sample of location coordinates, to build requests.
+
+    Args:
+        db (AsyncSession): The database session.
+        seed (int): The seed used to pick the sampled locations. Default is 0.
+
+    Returns:
+        dict: The (min, max) IDs of "locations", "categories" and "relations", the row count of each table
+        under "counts", and the sampled (latitude, longitude) pairs under "points".
+    """
+    bounds = {"counts": {}}
+    for name, model in (("locations", models.Location), ("categories", models.Category),
+                        ("relations", models.LocationCategoryReviewed), ("reviews", models.Review)):
+        low, high, count = (await db.execute(select(func.min(model.id), func.max(model.id), func.count(model.id)))).one()
+        bounds[name] = (low or 0, high or 0)
+        bounds["counts"][name] = count
+    rng = random.Random(seed)
+    low, high = bounds["locations"]
+    ids = {rng.randint(low, high) for _ in range(SAMPLE_POINTS)} if high else set()
+    result = await db.execute(select(models.Location.latitude, models.Location.longitude).filter(models.Location.id.in_(ids)))
+    bounds["points"] = [tuple(row) for row in result.all()]
+    return bounds
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Returns a percentile of sorted values, using the nearest-rank method.
+
+    Args:
+        values (List[float]): The values, in ascending order.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+async def run_scenario(client: AsyncClient, scenario: Scenario, bounds: dict, requests: int, concurrency: int,
+                       rng: random.Random) -> dict:
+    """
+    Sends the requests of a scenario with a fixed number of concurrent workers.
+
+    Args:
+        client (AsyncClient): The client, usually bound to the application through an ASGI transport.
+        scenario (Scenario): The scenario.
+        bounds (dict): The dataset bounds, as returned by dataset_bounds.
+        requests (int): The number of requests to send, unless the scenario sets its own.
+        concurrency (int): The number of concurrent workers.
+        rng (random.Random): The random generator used to build the requests.
+
+    Returns:
+        dict: The request count, errors (5xx responses and transport failures), status codes,
+        throughput in requests per second and latency percentiles in milliseconds.
+    """
+    total = scenario.requests or requests
+    # Build the requests up front so the random generator stays out of the timed section.
+    prepared = [(scenario.path(rng, bounds), scenario.body(rng, bounds) if scenario.body else None) for _ in range(total)]
+    pending = iter(prepared)
+    latencies, statuses = [], Counter()
+
+    async def worker():
+        for path, body in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, path, json=body)
+                status = str(response.status_code)
+            except Exception:
+                status = "error"
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        "requests": total,
+        "errors": sum(count for status, count in statuses.items() if status == "error" or status.startswith("5")),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(milliseconds) / len(milliseconds), 3) if milliseconds else 0.0,
+            "p50": round(percentile(milliseconds, 50), 3),
+            "p95": round(percentile(milliseconds, 95), 3),
+            "p99": round(percentile(milliseconds, 99), 3),
+            "max": round(milliseconds[-1], 3) if milliseconds else 0.0,
+        },
+    }
+
+async def run(client: AsyncClient, bounds: dict, scenarios: Iterable[Scenario] = SCENARIOS, requests: int = 200,
+              concurrency: int = 16, seed: int = 0, read_only: bool = False,
+              on_progress: Optional[Callable[[str, dict], None]] = None) -> dict:
+    """
+    Runs the benchmark scenarios one after another and builds the report.
+
+    Args:
+        client (AsyncClient): The client, usually bound to the application through an ASGI transport.
+        bounds (dict): The dataset bounds, as returned by dataset_bounds.
+        scenarios (Iterable[Scenario]): The scenarios to run. Default is SCENARIOS.
+        requests (int): The number of requests per scenario. Default is 200.
+        concurrency (int): The number of concurrent requests. Default is 16.
+        seed (int): The seed of the random generator, so runs send the same requests. Default is 0.
+        read_only (bool): Whether to skip the scenarios that change the data. Default is False.
+        on_progress (Optional[Callable[[str, dict], None]]): Called with the name and result of each scenario.
+
+    Returns:
+        dict: The report, with the run settings, the dataset size and the result of each scenario.
+    """
+    rng = random.Random(seed)
+    results = {}
+    for scenario in scenarios:
+        if read_only and scenario.write:
+            continue
+        results[scenario.name] = await run_scenario(client, scenario, bounds, requests, concurrency, rng)
+        if on_progress:
+            on_progress(scenario.name, results[scenario.name])
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {"requests": requests, "concurrency": concurrency, "seed": seed, "read_only": read_only},
+        "dataset": bounds["counts"],
+        "scenarios": results,
+    }
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2, metric: str = "p95") -> List[str]:
+    """
+    Lists the regressions of a report against a baseline report.
+
+    A scenario regresses when its latency percentile grows by more than the tolerance, or when it has
+    errors the baseline did not have. Scenarios missing from either report are ignored.
+
+    Args:
+        report (dict): The new report.
+        baseline (dict): The baseline report.
+        tolerance (float): The accepted relative growth of the latency. Default is 0.2 (20%).
+        metric (str): The latency percentile compared: "p50", "p95" or "p99". Default is "p95".
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        old, new = before["latency_ms"][metric], result["latency_ms"][metric]
+        if new > old * (1 + tolerance):
+            regressions.append(f"{name}: {metric} {old:.1f} ms -> {new:.1f} ms")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+def save_report(report: dict, path: str):
+    """
+    Writes a report as indented JSON.
+
+    Args:
+        report (dict): The report.
+        path (str): The path of the file.
+    """
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
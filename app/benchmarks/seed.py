@@ -0,0 +1,148 @@
+import itertools
+import random
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import func, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+from app.services import geo, tiles
+
+# Rows written per statement (or per COPY on PostgreSQL) and per transaction.
+SEED_CHUNK_SIZE = 10000
+
+# Share of the locations spread uniformly over the map; the rest are clustered around a few cities.
+UNIFORM_SHARE = 0.1
+CITY_COUNT = 50
+CITY_SPREAD_DEGREES = 0.1
+
+# Mean age of the last review of the reviewed relations; with 30 days about a third of them are due again.
+MEAN_REVIEW_AGE_DAYS = 30
+MAX_REVIEW_AGE_DAYS = 365
+
+async def _next_id(db: AsyncSession, model) -> int:
+    result = await db.execute(select(func.coalesce(func.max(model.id), 0)))
+    return result.scalar_one() + 1
+
+async def _load(db: AsyncSession, model, columns: Sequence[str], rows: List[tuple]):
+    """
+    Writes rows with COPY on asyncpg, or with a multi-row INSERT on other drivers, and commits them.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: The ORM model to write to.
+        columns (Sequence[str]): The names of the columns, in the order of the row values.
+        rows (List[tuple]): The rows.
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.driver == "asyncpg":
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(model.__tablename__, records=rows, columns=list(columns))
+    else:
+        await db.execute(insert(model.__table__), [dict(zip(columns, row)) for row in rows])
+    await db.commit()
+
+async def _load_all(db: AsyncSession, model, columns: Sequence[str], rows: Iterator[tuple], chunk_size: int,
+                    on_progress: Optional[Callable[[str, int], None]]) -> int:
+    total = 0
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        await _load(db, model, columns, chunk)
+        total += len(chunk)
+        if on_progress:
+            on_progress(model.__tablename__, total)
+    return total
+
+async def _reset_sequences(db: AsyncSession):
+    # Rows were written with explicit IDs; move the PostgreSQL sequences past them.
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for model in (models.Location, models.Category, models.LocationCategoryReviewed, models.Review):
+        table = model.__tablename__
+        await db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+    await db.commit()
+
+def _locations(rng: random.Random, first_id: int, count: int, now: datetime) -> Iterator[tuple]:
+    cities = [(rng.uniform(-55, 60), rng.uniform(-180, 180)) for _ in range(CITY_COUNT)]
+    for location_id in range(first_id, first_id + count):
+        if rng.random() < UNIFORM_SHARE:
+            latitude, longitude = rng.uniform(-85, 85), rng.uniform(-180, 180)
+        else:
+            city_latitude, city_longitude = rng.choice(cities)
+            latitude = min(90.0, max(-90.0, rng.gauss(city_latitude, CITY_SPREAD_DEGREES)))
+            longitude = (rng.gauss(city_longitude, CITY_SPREAD_DEGREES) + 180) % 360 - 180
+        yield (location_id, latitude, longitude, geo.encode(latitude, longitude), now)
+
+def _relations(rng: random.Random, first_id: int, location_ids: range, category_ids: range, count: int,
+               never_reviewed: float, now: datetime) -> Iterator[tuple]:
+    relation_id = first_id
+    per_location, remainder = divmod(count, len(location_ids)) if location_ids else (0, 0)
+    for index, location_id in enumerate(location_ids):
+        links = min(len(category_ids), per_location + (1 if index < remainder else 0))
+        for category_id in rng.sample(category_ids, links):
+            if rng.random() < never_reviewed:
+                last_reviewed = None
+            else:
+                age = min(rng.expovariate(1 / MEAN_REVIEW_AGE_DAYS), MAX_REVIEW_AGE_DAYS)
+                last_reviewed = now - timedelta(days=age)
+            yield (relation_id, location_id, category_id, last_reviewed)
+            relation_id += 1
+
+async def seed(db: AsyncSession, locations: int, categories: int, relations: int, never_reviewed: float = 0.2,
+               seed: int = 0, chunk_size: int = SEED_CHUNK_SIZE,
+               on_progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """
+    Fills the database with a synthetic dataset for benchmarks.
+
+    Locations are clustered around random cities, with a uniform background, so spatial queries see both
+    dense and empty areas. Each location is linked to the same number of distinct categories (give or take one).
+    A share of the relations is never reviewed; the others were last reviewed an exponentially distributed
+    number of days ago and get a matching row in the review history. Rows are appended after the existing ones
+    and written in chunks, with COPY on PostgreSQL. The tile counters are rebuilt at the end.
+
+    Args:
+        db (AsyncSession): The database session.
+        locations (int): The number of locations to create.
+        categories (int): The number of categories to create.
+        relations (int): The number of location-category relations to create, at most locations * categories.
+        never_reviewed (float): The share of relations that have never been reviewed. Default is 0.2.
+        seed (int): The seed of the random generator, so datasets can be reproduced. Default is 0.
+        chunk_size (int): The number of rows written per statement and transaction. Default is SEED_CHUNK_SIZE.
+        on_progress (Optional[Callable[[str, int], None]]): Called with the table name and the rows written so far.
+
+    Returns:
+        Dict[str, int]: The number of rows created in each table, and the number of tiles after the rebuild.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    first_location = await _next_id(db, models.Location)
+    first_category = await _next_id(db, models.Category)
+    first_relation = await _next_id(db, models.LocationCategoryReviewed)
+    first_review = await _next_id(db, models.Review)
+    await db.commit()
+
+    counts = {}
+    counts["locations"] = await _load_all(db, models.Location, ["id", "latitude", "longitude", "geohash", "created_at"],
+                                          _locations(rng, first_location, locations, now), chunk_size, on_progress)
+    counts["categories"] = await _load_all(db, models.Category, ["id", "name", "created_at"],
+                                           ((category_id, f"Benchmark category {category_id}", now)
+                                            for category_id in range(first_category, first_category + categories)),
+                                           chunk_size, on_progress)
+
+    review_ids = itertools.count(first_review)
+    counts["location_category_reviewed"] = counts["reviews"] = 0
+    relation_rows = _relations(rng, first_relation, range(first_location, first_location + locations),
+                               range(first_category, first_category + categories), relations, never_reviewed, now)
+    while chunk := list(itertools.islice(relation_rows, chunk_size)):
+        await _load(db, models.LocationCategoryReviewed, ["id", "location_id", "category_id", "last_reviewed"], chunk)
+        reviews = [(next(review_ids), relation_id, last_reviewed) for relation_id, _, _, last_reviewed in chunk if last_reviewed is not None]
+        await _load(db, models.Review, ["id", "relation_id", "reviewed_at"], reviews)
+        counts["location_category_reviewed"] += len(chunk)
+        counts["reviews"] += len(reviews)
+        if on_progress:
+            on_progress(models.LocationCategoryReviewed.__tablename__, counts["location_category_reviewed"])
+
+    await _reset_sequences(db)
+    counts["tiles"] = await tiles.rebuild(db)
+    return counts
@@ -0,0 +1,72 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from app import migrations
+from app.config.database import Base
+from app.services import category_search, recommendation_queue
+
+# Modules whose cold import is measured, each in a fresh interpreter: the API and the maintenance CLI.
+MODULES = ["app.main", "app.cli"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _import_seconds(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def _summary(samples: List[float]) -> dict:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+async def _time(run: Callable[[], Awaitable], repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await run()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def measure(engine: AsyncEngine, repeat: int = 5) -> Dict[str, dict]:
+    """
+    Measures the steps of a cold start of the API.
+
+    The imports are timed in new interpreters, so nothing is cached by this process. The schema check done
+    at startup is compared with the create_all it replaced, and the warm-up of the recommendation queue and
+    of the category search index is timed against the data of the database. The database must be migrated.
+
+    Args:
+        engine (AsyncEngine): The engine of the database.
+        repeat (int): The number of measurements of each step. Default is 5.
+
+    Returns:
+        Dict[str, dict]: For each step, the median, minimum and maximum milliseconds.
+    """
+    report = {}
+    for module in MODULES:
+        report[f"import {module}"] = _summary([_import_seconds(module) for _ in range(repeat)])
+
+    async def create_all():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def warm_queue():
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            await recommendation_queue.queue.warm(db)
+
+    async def warm_index():
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            await category_search.index.warm(db)
+
+    report["schema check"] = _summary(await _time(lambda: migrations.check(engine), repeat))
+    report["legacy create_all"] = _summary(await _time(create_all, repeat))
+    report["queue warm"] = _summary(await _time(warm_queue, repeat))
+    report["category index warm"] = _summary(await _time(warm_index, repeat))
+    return report
@@ -0,0 +1,323 @@
+# cli.py is the command line entry point for maintenance tasks that run outside the API, such as large imports.
+# Usage: python -m app.cli import locations ./bogota.csv
+#        python -m app.cli seed --locations 1000000 --categories 2000 --relations 10000000
+#        python -m app.cli bench --output report.json --baseline previous.json
+#        python -m app.cli bench-lists --limit 1000
+#        python -m app.cli rebuild-tiles
+#        python -m app.cli compact-locations --meters 10
+#        python -m app.cli bench-startup --repeat 5
+# Commands import what they need when they run, so the CLI starts fast.
+import argparse
+import asyncio
+import json
+import os
+import sys
+from app.config.database import SessionLocal, engine
+from app.config.settings import BULK_CHUNK_SIZE, CACHE_BACKEND_URL, LOCATION_DEDUP_METERS
+
+READ_CHUNK_SIZE = 1 << 16
+
+async def _read_file(path: str):
+    with open(path, "rb") as file:
+        while chunk := file.read(READ_CHUNK_SIZE):
+            yield chunk
+
+def _load_checkpoint(path: str, source: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path) as file:
+        checkpoint = json.load(file)
+    return checkpoint["next_offset"] if checkpoint.get("source") == os.path.abspath(source) else 0
+
+def _save_checkpoint(path: str, source: str, next_offset: int):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump({"source": os.path.abspath(source), "next_offset": next_offset}, file)
+    os.replace(temporary, path)
+
+async def run_migrate(target):
+    """
+    Applies the pending schema migrations to the database configured in DATABASE_URL.
+
+    Args:
+        target (Optional[int]): The version to migrate to, or None for the newest one.
+
+    Returns:
+        dict: The version of the database and the applied migrations.
+    """
+    from app import migrations
+
+    def on_progress(migration):
+        print(f"Applied {migration.name}: {migration.description}", file=sys.stderr)
+
+    try:
+        applied = await migrations.migrate(engine, target=target, on_progress=on_progress)
+        return {"version": await migrations.current_version(engine), "applied": [migration.name for migration in applied]}
+    finally:
+        await engine.dispose()
+
+async def run_import(kind: str, path: str, format: str, checkpoint: str, batch_size: int, dedup_meters: float = LOCATION_DEDUP_METERS):
+    """
+    Imports a CSV or NDJSON file, resuming from its checkpoint file if one exists.
+
+    Args:
+        kind (str): What the file contains, "locations" or "categories".
+        path (str): The path of the file.
+        format (str): The format of the file, "csv" or "ndjson".
+        checkpoint (str): The path of the checkpoint file, updated after every committed batch.
+        batch_size (int): The number of records written per transaction.
+        dedup_meters (float): The distance in metres under which an imported location reuses a stored one, 0 to disable it.
+
+    Returns:
+        schemas.ImportResult: The counters and item errors of the import.
+    """
+    from app.services import imports as crud_imports
+
+    offset = _load_checkpoint(checkpoint, path)
+    if offset:
+        print(f"Resuming {path} from record {offset}", file=sys.stderr)
+
+    def on_progress(result):
+        _save_checkpoint(checkpoint, path, result.next_offset)
+        print(f"{result.next_offset} records read, {result.created_locations} locations, {result.created_categories} categories, "
+              f"{result.created_relations} relations created, {result.error_count} errors", file=sys.stderr)
+
+    records = crud_imports.iter_records(crud_imports.iter_lines(_read_file(path)), format)
+    try:
+        async with SessionLocal() as db:
+            if kind == "locations":
+                return await crud_imports.import_locations(db=db, records=records, offset=offset, batch_size=batch_size,
+                                                           on_progress=on_progress, dedup_meters=dedup_meters)
+            return await crud_imports.import_categories(db=db, records=records, offset=offset, batch_size=batch_size, on_progress=on_progress)
+    finally:
+        await engine.dispose()
+
+async def run_seed(locations: int, categories: int, relations: int, never_reviewed: float, seed: int, chunk_size: int):
+    """
+    Fills the database configured in DATABASE_URL with a synthetic benchmark dataset.
+
+    Args:
+        locations (int): The number of locations to create.
+        categories (int): The number of categories to create.
+        relations (int): The number of location-category relations to create.
+        never_reviewed (float): The share of relations never reviewed.
+        seed (int): The seed of the random generator.
+        chunk_size (int): The number of rows written per statement and transaction.
+
+    Returns:
+        Dict[str, int]: The number of rows created in each table.
+    """
+    from app import migrations
+    from app.benchmarks import seed as benchmark_seed
+
+    def on_progress(table, rows):
+        print(f"{table}: {rows} rows", file=sys.stderr)
+
+    try:
+        await migrations.migrate(engine)
+        async with SessionLocal() as db:
+            return await benchmark_seed.seed(db, locations, categories, relations, never_reviewed=never_reviewed,
+                                             seed=seed, chunk_size=chunk_size, on_progress=on_progress)
+    finally:
+        await engine.dispose()
+
+async def run_bench(scenarios, requests: int, concurrency: int, seed: int, read_only: bool):
+    """
+    Benchmarks the API against the database configured in DATABASE_URL, through an in-process ASGI transport.
+
+    Args:
+        scenarios (Optional[List[str]]): The names of the scenarios to run, or None for all of them.
+        requests (int): The number of requests per scenario.
+        concurrency (int): The number of concurrent requests.
+        seed (int): The seed of the random generator.
+        read_only (bool): Whether to skip the scenarios that change the data.
+
+    Returns:
+        dict: The benchmark report.
+    """
+    from asgi_lifespan import LifespanManager
+    from httpx import ASGITransport, AsyncClient
+    from app.benchmarks import runner
+    from app.main import app
+
+    selected = [scenario for scenario in runner.SCENARIOS if not scenarios or scenario.name in scenarios]
+
+    def on_progress(name, result):
+        latency = result["latency_ms"]
+        print(f"{name}: {result['throughput_rps']} req/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+              f"p99 {latency['p99']} ms, {result['errors']} errors", file=sys.stderr)
+
+    async with LifespanManager(app):
+        async with SessionLocal() as db:
+            bounds = await runner.dataset_bounds(db, seed)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark/api/", timeout=None) as client:
+            return await runner.run(client, bounds, selected, requests=requests, concurrency=concurrency, seed=seed,
+                                    read_only=read_only, on_progress=on_progress)
+
+async def run_bench_lists(limit: int, repeat: int):
+    """
+    Compares the list serialization paths against the database configured in DATABASE_URL.
+
+    Args:
+        limit (int): The page size.
+        repeat (int): The number of pages read by each path.
+
+    Returns:
+        Dict[str, dict]: The timings of each list.
+    """
+    from app.benchmarks import serialization as benchmark_serialization
+
+    try:
+        async with SessionLocal() as db:
+            return await benchmark_serialization.compare_lists(db, limit=limit, repeat=repeat)
+    finally:
+        await engine.dispose()
+
+async def run_rebuild_tiles():
+    """
+    Recomputes the tile counters of the database configured in DATABASE_URL from the base tables.
+
+    Returns:
+        int: The number of tiles.
+    """
+    from app.services import tiles
+
+    try:
+        async with SessionLocal() as db:
+            return await tiles.rebuild(db)
+    finally:
+        await engine.dispose()
+
+async def run_compact_locations(meters: float):
+    """
+    Merges the locations of the database configured in DATABASE_URL that are within a distance of an older one,
+    telling the API workers about it through the shared cache backend.
+
+    Args:
+        meters (float): The distance in metres under which two locations are the same place.
+
+    Returns:
+        Dict[str, int]: The number of merged locations, of relations merged into another one and of relations moved.
+    """
+    from app.services import cache, dedup
+
+    await cache.connect()
+    try:
+        async with SessionLocal() as db:
+            return await dedup.compact_locations(db, meters)
+    finally:
+        await cache.close()
+        await engine.dispose()
+
+async def run_bench_startup(repeat: int):
+    """
+    Measures the cold start of the API against the database configured in DATABASE_URL.
+
+    Args:
+        repeat (int): The number of measurements of each step.
+
+    Returns:
+        Dict[str, dict]: The timings of each step.
+    """
+    from app.benchmarks import startup as benchmark_startup
+
+    try:
+        return await benchmark_startup.measure(engine, repeat=repeat)
+    finally:
+        await engine.dispose()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Map My World maintenance commands")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subcommands.add_parser("migrate", help="Apply the pending schema migrations")
+    migrate_parser.add_argument("--target", type=int, help="Version to migrate to. Defaults to the newest one")
+
+    import_parser = subcommands.add_parser("import", help="Import locations or categories from a CSV or NDJSON file")
+    import_parser.add_argument("kind", choices=["locations", "categories"])
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    import_parser.add_argument("--checkpoint", help="Checkpoint file used to resume the import. Defaults to <path>.checkpoint")
+    import_parser.add_argument("--batch-size", type=int, default=BULK_CHUNK_SIZE)
+    import_parser.add_argument("--dedup-meters", type=float, default=LOCATION_DEDUP_METERS,
+                               help="Reuse the stored location within this many metres instead of creating one; 0 disables it")
+
+    seed_parser = subcommands.add_parser("seed", help="Fill the database with a synthetic benchmark dataset")
+    seed_parser.add_argument("--locations", type=int, default=100000)
+    seed_parser.add_argument("--categories", type=int, default=1000)
+    seed_parser.add_argument("--relations", type=int, default=1000000)
+    seed_parser.add_argument("--never-reviewed", type=float, default=0.2, help="Share of relations never reviewed")
+    seed_parser.add_argument("--seed", type=int, default=0)
+    seed_parser.add_argument("--chunk-size", type=int, default=10000)
+
+    bench_parser = subcommands.add_parser("bench", help="Measure throughput and latency of every endpoint")
+    bench_parser.add_argument("--scenario", action="append", help="Scenario to run; repeat to run several. Defaults to all")
+    bench_parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    bench_parser.add_argument("--concurrency", type=int, default=16)
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.add_argument("--read-only", action="store_true", help="Skip the scenarios that change the data")
+    bench_parser.add_argument("--output", help="Path of the JSON report")
+    bench_parser.add_argument("--baseline", help="Report to compare with; exits with status 1 on regressions")
+    bench_parser.add_argument("--tolerance", type=float, default=0.2, help="Accepted relative growth of the p95 latency")
+
+    lists_parser = subcommands.add_parser("bench-lists", help="Compare the serialization cost of the list endpoints before and after the fast path")
+    lists_parser.add_argument("--limit", type=int, default=1000, help="Page size")
+    lists_parser.add_argument("--repeat", type=int, default=50, help="Pages read by each path")
+
+    subcommands.add_parser("rebuild-tiles", help="Recompute the tile counters used by the heatmaps from the base tables")
+
+    compact_parser = subcommands.add_parser("compact-locations", help="Merge the locations closer than a distance to an older one, with their relations")
+    compact_parser.add_argument("--meters", type=float, default=LOCATION_DEDUP_METERS, help="Defaults to LOCATION_DEDUP_METERS")
+    compact_parser.add_argument("--without-shared-cache", action="store_true",
+                                help="Run with an in-process CACHE_BACKEND_URL; the API workers must then be restarted")
+
+    startup_parser = subcommands.add_parser("bench-startup", help="Measure the cold start of the API: imports, schema check and queue warm-up")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Measurements of each step")
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        print(json.dumps(asyncio.run(run_migrate(args.target)), indent=2))
+    elif args.command == "import":
+        format = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+        result = asyncio.run(run_import(args.kind, args.path, format, args.checkpoint or args.path + ".checkpoint", args.batch_size,
+                                        args.dedup_meters))
+        print(result.model_dump_json(indent=2))
+        if result.failure:
+            sys.exit(1)
+    elif args.command == "seed":
+        counts = asyncio.run(run_seed(args.locations, args.categories, args.relations, args.never_reviewed, args.seed, args.chunk_size))
+        print(json.dumps(counts, indent=2))
+    elif args.command == "bench":
+        from app.benchmarks import runner
+        report = asyncio.run(run_bench(args.scenario, args.requests, args.concurrency, args.seed, args.read_only))
+        if args.output:
+            runner.save_report(report, args.output)
+        else:
+            print(json.dumps(report, indent=2))
+        if args.baseline:
+            with open(args.baseline) as file:
+                regressions = runner.compare(report, json.load(file), args.tolerance)
+            for regression in regressions:
+                print(f"Regression: {regression}", file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+    elif args.command == "bench-lists":
+        print(json.dumps(asyncio.run(run_bench_lists(args.limit, args.repeat)), indent=2))
+    elif args.command == "rebuild-tiles":
+        print(json.dumps({"tiles": asyncio.run(run_rebuild_tiles())}, indent=2))
+    elif args.command == "compact-locations":
+        if args.meters <= 0:
+            parser.error("compact-locations needs --meters or LOCATION_DEDUP_METERS greater than 0")
+        from app.services.cache_backends import backend_from_url
+
+        # The running workers only learn about the merged locations through a shared backend; otherwise they keep
+        # serving them from their caches and recommendation queues until restarted.
+        if not backend_from_url(CACHE_BACKEND_URL).shared and not args.without_shared_cache:
+            parser.error(f"CACHE_BACKEND_URL={CACHE_BACKEND_URL} cannot tell the API workers about the merged locations: "
+                         "configure a shared backend, or pass --without-shared-cache and restart the workers afterwards")
+        print(json.dumps(asyncio.run(run_compact_locations(args.meters)), indent=2))
+    elif args.command == "bench-startup":
+        print(json.dumps(asyncio.run(run_bench_startup(args.repeat)), indent=2))
+
+if __name__ == "__main__":
+    main()
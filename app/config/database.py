@@ -1,18 +1,70 @@
 
+import time
+# The Request fastapi re-exports, imported from starlette so the CLI does not load fastapi.
+from starlette.requests import Request
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from sqlalchemy.orm import sessionmaker
-from app.config.settings import DATABASE_URL
+from app.config.settings import DATABASE_ECHO, DATABASE_URL, READ_DATABASE_URL, READ_YOUR_WRITES_SECONDS
 
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=DATABASE_ECHO)
+read_engine = engine if READ_DATABASE_URL == DATABASE_URL else create_async_engine(READ_DATABASE_URL, echo=DATABASE_ECHO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine,class_=AsyncSession, expire_on_commit=False)
+# Sessions of the replica are marked, so that what they read (possibly behind the primary) is never cached or shared.
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, class_=AsyncSession, expire_on_commit=False,
+                                info={"replica": read_engine is not engine})
 Base = declarative_base()
 
+# Cookie set on the responses to successful writes, holding the time of the write.
+LAST_WRITE_COOKIE = "mmw_last_write"
+
 async def get_db():
     async with SessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+def is_replica(db: AsyncSession) -> bool:
+    """
+    Tells whether a session reads from the replica, whose data may lag behind the primary.
+
+    Rows read by such a session must not fill the shared caches: a read racing a write could store the
+    old row right after the write invalidated it, and clients reading their own writes from the primary
+    would then be served that old row.
+
+    Args:
+        db (AsyncSession): The database session.
+
+    Returns:
+        bool: Whether the session is bound to the replica.
+    """
+    return db.info.get("replica", False)
+
+def read_session_factory(request: Request):
+    """
+    Chooses the database a read request should use.
+
+    Reads go to the replica, except for clients that wrote within the last READ_YOUR_WRITES_SECONDS,
+    which keep reading from the primary so they always see their own writes despite replication lag.
+
+    Args:
+        request (Request): The incoming request.
+
+    Returns:
+        sessionmaker: SessionLocal or ReadSessionLocal.
+    """
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        last_write = 0
+    return SessionLocal if time.time() - last_write < READ_YOUR_WRITES_SECONDS else ReadSessionLocal
+
+async def get_read_db(request: Request):
+    async with read_session_factory(request)() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
@@ -9,7 +9,78 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
     
+# Log every SQL statement; meant for local debugging only.
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() == "true"
+
+# Replica used by the GET endpoints; defaults to the primary database.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", DATABASE_URL)
+
+if READ_DATABASE_URL.startswith("postgresql://"):
+    READ_DATABASE_URL = READ_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+
+# Seconds during which a client's reads go to the primary after one of its own writes.
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
 TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite+aiosqlite:///./test.db")
 
 if TEST_DATABASE_URL.startswith("postgresql://"):
-    TEST_DATABASE_URL = TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
\ No newline at end of file
+    TEST_DATABASE_URL = TEST_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
+
+# Apply the pending schema migrations at startup; by default they run out-of-band (python -m app.cli migrate)
+# and startup only checks the schema version.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
+
+# Maximum number of rows written per INSERT statement by the bulk endpoints.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# Number of rows fetched from the server-side cursor per batch by the export endpoints.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# Maximum number of locations a viewport query returns as points; above it they are returned as clusters.
+VIEWPORT_MAX_POINTS = int(os.getenv("VIEWPORT_MAX_POINTS", "500"))
+
+# Number of geohash characters of the map tiles whose location and review counters are maintained on every write.
+TILE_PRECISION = int(os.getenv("TILE_PRECISION", "5"))
+
+# Distance in metres under which a new location is the same place as a stored one, which is returned instead
+# of inserting a duplicate (on create, bulk create and imports); 0 disables the check.
+LOCATION_DEDUP_METERS = float(os.getenv("LOCATION_DEDUP_METERS", "0"))
+
+# Serve fresh and never-reviewed recommendations from an in-memory queue loaded at startup.
+RECOMMENDATION_QUEUE_ENABLED = os.getenv("RECOMMENDATION_QUEUE_ENABLED", "true").lower() == "true"
+
+# Seconds a reviewer holds the recommendations it claims, unless it renews the lease; and the longest lease allowed.
+RECOMMENDATION_LEASE_SECONDS = int(os.getenv("RECOMMENDATION_LEASE_SECONDS", "300"))
+RECOMMENDATION_MAX_LEASE_SECONDS = int(os.getenv("RECOMMENDATION_MAX_LEASE_SECONDS", "3600"))
+
+# Minimum share (0 to 1) of the query's trigrams a name must contain to be a fuzzy match of the category search.
+CATEGORY_SEARCH_MIN_SIMILARITY = float(os.getenv("CATEGORY_SEARCH_MIN_SIMILARITY", "0.5"))
+
+# Capacity and time to live of the in-process entity caches.
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+
+# Store shared by the workers behind their entity caches: "memory://" keeps each worker on its own,
+# "redis://[user:password@]host[:port][/db]" shares entries and change messages through Redis.
+CACHE_BACKEND_URL = os.getenv("CACHE_BACKEND_URL", "memory://")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "map-my-world:")
+CACHE_CHANNEL = os.getenv("CACHE_CHANNEL", "map-my-world:changes")
+CACHE_REDIS_POOL_SIZE = int(os.getenv("CACHE_REDIS_POOL_SIZE", "8"))
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "0.5"))
+
+# Seconds the result of a coalesced read (fresh recommendations, category lists) is shared with later identical requests; 0 only shares it with concurrent ones.
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "0"))
+COALESCE_MAX_ENTRIES = int(os.getenv("COALESCE_MAX_ENTRIES", "256"))
+
+# Collect request, database and pool metrics and expose them at /metrics.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Add X-DB-Queries, X-DB-Time-Ms and X-DB-Repeated-Queries headers to every response; meant for debugging.
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "false").lower() == "true"
+
+# Number of runs of the same statement within a request from which it is reported as repeated (N+1).
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
+
+# Log the statements slower than this many seconds (0 disables the log), with their plan if SLOW_QUERY_EXPLAIN is set.
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
@@ -1,12 +1,15 @@
 # main.py is the entry point of the application. It creates the FastAPI instance and includes the routers for locations, categories, and recommendations.
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import locations, categories, recommendations
-from app.config.database import engine
-from app.models import models
+from app.routers import locations, categories, recommendations, imports, tiles
+from app.config.database import LAST_WRITE_COOKIE, SessionLocal, engine, read_engine
+from app.config.settings import AUTO_MIGRATE, METRICS_ENABLED, QUERY_DEBUG_HEADERS, READ_YOUR_WRITES_SECONDS
+from app.services import cache, category_search, metrics, queries, recommendation_queue, singleflight
+from app import migrations
 import asyncio
+import time
 
 load_dotenv()
 
@@ -17,7 +20,9 @@ app = FastAPI(
     openapi_tags=[
         {"name": "Locations", "description": "Operations with locations"},
         {"name": "Categories", "description": "Operations with categories"},
-        {"name": "Recommendations", "description": "Get location-category recommendations"}
+        {"name": "Recommendations", "description": "Get location-category recommendations"},
+        {"name": "Imports", "description": "Bulk import of locations and categories from files"},
+        {"name": "Tiles", "description": "Location and review counters per map tile, for heatmaps"}
     ]
 )
 
@@ -27,24 +32,92 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-DB-Queries", "X-DB-Time-Ms", "X-DB-Repeated-Queries"],
 )
 
+@app.middleware("http")
+async def mark_writes(request: Request, call_next):
+    # Remember the client's last successful write so its next reads are served by the primary.
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(LAST_WRITE_COOKIE, str(time.time()), max_age=max(1, int(READ_YOUR_WRITES_SECONDS)), httponly=True, samesite="lax")
+    return response
+
+queries.install()
+
+if QUERY_DEBUG_HEADERS:
+    @app.middleware("http")
+    async def add_query_headers(request: Request, call_next):
+        # Report the queries of the request, to spot N+1 patterns and query budget regressions.
+        with queries.recording() as recorder:
+            response = await call_next(request)
+        response.headers["X-DB-Queries"] = str(recorder.count)
+        response.headers["X-DB-Time-Ms"] = f"{recorder.duration * 1000:.2f}"
+        response.headers["X-DB-Repeated-Queries"] = str(len(recorder.repeated()))
+        return response
+
+if METRICS_ENABLED:
+    metrics.register_pool("primary", engine)
+    if read_engine is not engine:
+        metrics.register_pool("replica", read_engine)
+
+    @app.middleware("http")
+    async def record_metrics(request: Request, call_next):
+        # Time the request and count its queries; streamed bodies are timed until their headers are sent.
+        metrics.http_requests_in_progress.inc()
+        start = time.perf_counter()
+        status_code = 500
+        with queries.recording() as recorder:
+            try:
+                response = await call_next(request)
+                status_code = response.status_code
+                return response
+            finally:
+                elapsed = time.perf_counter() - start
+                metrics.http_requests_in_progress.dec()
+                route = metrics.route_of(request)
+                metrics.http_request_duration.observe(request.method, route, value=elapsed)
+                metrics.http_responses.inc(request.method, route, str(status_code))
+                metrics.http_request_db_queries.observe(request.method, route, value=recorder.count)
+                metrics.http_request_db_duration.observe(request.method, route, value=recorder.duration)
+
 app.include_router(locations.router, prefix="/api", tags=["Locations"])
 app.include_router(categories.router, prefix="/api", tags=["Categories"])
 app.include_router(recommendations.router, prefix="/api", tags=["Recommendations"])
+app.include_router(imports.router, prefix="/api", tags=["Imports"])
+app.include_router(tiles.router, prefix="/api", tags=["Tiles"])
 
 
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to Map My World API"}
 
+@app.get("/cache/stats", tags=["Root"])
+def read_cache_stats():
+    return cache.stats()
+
+@app.get("/metrics", tags=["Root"], include_in_schema=False)
+def read_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 
 async def startup_event():
-    async with engine.begin() as conn:
-        await conn.run_sync(models.Base.metadata.create_all)
+    # The schema is migrated out-of-band; startup only reads the version row, unless AUTO_MIGRATE is set.
+    if AUTO_MIGRATE:
+        await migrations.migrate(engine)
+    else:
+        await migrations.check(engine)
+    await cache.connect()
+    cache.clear()
+    singleflight.clear()
+    async with SessionLocal() as db:
+        await recommendation_queue.warm(db)
+        await category_search.warm(db)
 
 async def shutdown_event():
+    await cache.close()
     await engine.dispose()
+    await read_engine.dispose()
 
 app.add_event_handler("startup", startup_event)
 app.add_event_handler("shutdown", shutdown_event)
@@ -0,0 +1,145 @@
+# The migrations package holds the versioned schema changes of the database and applies them.
+# Migrations run out-of-band (`python -m app.cli migrate`) or at startup with AUTO_MIGRATE=true;
+# otherwise the API only checks, with one query, that the database is at the version it needs.
+import importlib
+import pkgutil
+from datetime import datetime
+from typing import Awaitable, Callable, List, NamedTuple, Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, insert, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from app.migrations import versions
+
+schema_version = Table(
+    "schema_version", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+class Migration(NamedTuple):
+    """
+    A versioned schema change, defined by a module app.migrations.versions.vNNNN_<name>.
+
+    Attributes:
+        version (int): The version the migration brings the database to.
+        name (str): The name of the module.
+        description (str): What the migration changes.
+        upgrade (Callable[[AsyncConnection], Awaitable]): Applies the change inside the given transaction.
+    """
+    version: int
+    name: str
+    description: str
+    upgrade: Callable[[AsyncConnection], Awaitable]
+
+class SchemaVersionError(Exception):
+    """
+    Raised at startup when the database has not been migrated to the version the code needs.
+    """
+
+def _version_names() -> List[tuple]:
+    names = sorted((int(module.name[1:5]), module.name) for module in pkgutil.iter_modules(versions.__path__)
+                   if module.name.startswith("v") and module.name[1:5].isdigit())
+    if [version for version, _ in names] != list(range(1, len(names) + 1)):
+        raise RuntimeError(f"Migration versions must be consecutive from 1: {[name for _, name in names]}")
+    return names
+
+def latest_version() -> int:
+    """
+    Returns the version of the newest migration, without importing the migrations.
+
+    Returns:
+        int: The version the code needs.
+    """
+    names = _version_names()
+    return names[-1][0] if names else 0
+
+def discover() -> List[Migration]:
+    """
+    Imports every migration, in version order.
+
+    Returns:
+        List[Migration]: The migrations.
+    """
+    migrations = []
+    for version, name in _version_names():
+        module = importlib.import_module(f"{versions.__name__}.{name}")
+        migrations.append(Migration(version, name, module.DESCRIPTION, module.upgrade))
+    return migrations
+
+async def current_version(engine: AsyncEngine) -> Optional[int]:
+    """
+    Reads the schema version of the database with a single query.
+
+    Args:
+        engine (AsyncEngine): The engine of the database.
+
+    Returns:
+        Optional[int]: The version, or None if the database has never been migrated.
+    """
+    async with engine.connect() as conn:
+        try:
+            return (await conn.execute(select(schema_version.c.version).where(schema_version.c.id == 1))).scalar()
+        except DBAPIError:
+            return None
+
+async def check(engine: AsyncEngine) -> int:
+    """
+    Checks that the database is at least at the version of the newest migration.
+
+    A newer database is accepted, so workers running the previous release keep serving during a rolling
+    deploy, as long as migrations only add to the schema.
+
+    Args:
+        engine (AsyncEngine): The engine of the database.
+
+    Returns:
+        int: The version of the database.
+
+    Raises:
+        SchemaVersionError: If the database is older than the code.
+    """
+    version = await current_version(engine)
+    latest = latest_version()
+    if version is None or version < latest:
+        raise SchemaVersionError(f"The database schema is at version {version or 0} but this code needs version {latest}: "
+                                 "run `python -m app.cli migrate` or start with AUTO_MIGRATE=true")
+    return version
+
+async def migrate(engine: AsyncEngine, target: Optional[int] = None,
+                  on_progress: Optional[Callable[[Migration], None]] = None) -> List[Migration]:
+    """
+    Applies the pending migrations, each in its own transaction together with the new version number.
+
+    The version row is locked while a migration runs (on PostgreSQL), so workers started at the same time
+    with AUTO_MIGRATE apply each migration once. Migrations are idempotent, so databases created before
+    versioning by create_all are brought to the same schema as new ones.
+
+    Args:
+        engine (AsyncEngine): The engine of the database.
+        target (Optional[int]): The version to migrate to. Default is the newest one.
+        on_progress (Optional[Callable[[Migration], None]]): Called after each applied migration.
+
+    Returns:
+        List[Migration]: The applied migrations.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(schema_version.metadata.create_all)
+        if (await conn.execute(select(schema_version.c.id))).first() is None:
+            await conn.execute(insert(schema_version).values(id=1, version=0, applied_at=datetime.utcnow()))
+
+    applied = []
+    for migration in discover():
+        if target is not None and migration.version > target:
+            break
+        async with engine.begin() as conn:
+            version = (await conn.execute(select(schema_version.c.version).where(schema_version.c.id == 1).with_for_update())).scalar_one()
+            if version >= migration.version:
+                continue
+            await migration.upgrade(conn)
+            await conn.execute(update(schema_version).where(schema_version.c.id == 1)
+                               .values(version=migration.version, applied_at=datetime.utcnow()))
+        applied.append(migration)
+        if on_progress is not None:
+            on_progress(migration)
+    return applied
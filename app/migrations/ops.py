@@ -0,0 +1,62 @@
+from typing import Iterable
+from sqlalchemy import Column, Index, Table, inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Helpers for the migrations. Every operation checks the live schema first, so a migration can run on
+# a database that already has the change (for example one created by create_all before versioning).
+
+async def has_table(conn: AsyncConnection, table: str) -> bool:
+    """
+    Tells whether a table exists.
+    """
+    return await conn.run_sync(lambda sync: inspect(sync).has_table(table))
+
+async def has_column(conn: AsyncConnection, table: str, column: str) -> bool:
+    """
+    Tells whether a table has a column.
+    """
+    return await conn.run_sync(lambda sync: any(existing["name"] == column for existing in inspect(sync).get_columns(table)))
+
+async def has_unique(conn: AsyncConnection, table: str, columns: Iterable[str]) -> bool:
+    """
+    Tells whether a unique constraint or unique index covers exactly the given columns.
+    """
+    columns = list(columns)
+
+    def find(sync) -> bool:
+        inspector = inspect(sync)
+        constraints = [constraint["column_names"] for constraint in inspector.get_unique_constraints(table)]
+        indexes = [index["column_names"] for index in inspector.get_indexes(table) if index.get("unique")]
+        return columns in constraints + indexes
+    return await conn.run_sync(find)
+
+async def create_table(conn: AsyncConnection, table: Table) -> bool:
+    """
+    Creates a table and its indexes if the table does not exist.
+
+    Returns:
+        bool: Whether the table was created.
+    """
+    if await has_table(conn, table.name):
+        return False
+    await conn.run_sync(lambda sync: table.create(sync))
+    return True
+
+async def create_index(conn: AsyncConnection, index: Index):
+    """
+    Creates an index if no index of that name exists.
+    """
+    await conn.run_sync(lambda sync: index.create(sync, checkfirst=True))
+
+async def add_column(conn: AsyncConnection, table: str, column: Column) -> bool:
+    """
+    Adds a nullable column to a table if it does not have it.
+
+    Returns:
+        bool: Whether the column was added.
+    """
+    if await has_column(conn, table, column.name):
+        return False
+    column_type = column.type.compile(dialect=conn.dialect)
+    await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+    return True
@@ -0,0 +1 @@
+# One module per schema version, named vNNNN_<name>, defining DESCRIPTION and `async def upgrade(conn)`.
@@ -0,0 +1,35 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import ops
+
+DESCRIPTION = "Create the locations, categories and location_category_reviewed tables"
+
+metadata = MetaData()
+
+locations = Table(
+    "locations", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("latitude", Float, nullable=False),
+    Column("longitude", Float, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+
+categories = Table(
+    "categories", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, unique=True, index=True, nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow),
+)
+
+location_category_reviewed = Table(
+    "location_category_reviewed", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("location_id", Integer, ForeignKey("locations.id"), nullable=False),
+    Column("category_id", Integer, ForeignKey("categories.id"), nullable=False),
+    Column("last_reviewed", DateTime, default=None),
+)
+
+async def upgrade(conn: AsyncConnection):
+    for table in (locations, categories, location_category_reviewed):
+        await ops.create_table(conn, table)
@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Index, MetaData, String, Table, bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import ops
+from app.services import geo
+
+DESCRIPTION = "Add the indexed geohash column of the locations and fill it"
+
+BATCH_SIZE = 10000
+
+metadata = MetaData()
+
+locations = Table(
+    "locations", metadata,
+    Column("id"),
+    Column("latitude"),
+    Column("longitude"),
+    Column("geohash", String(12)),
+)
+
+async def upgrade(conn: AsyncConnection):
+    await ops.add_column(conn, "locations", Column("geohash", String(12)))
+    await ops.create_index(conn, Index("ix_locations_geohash", locations.c.geohash))
+
+    # Fill the locations created before the column, by ascending ID so each batch starts where the last one ended.
+    statement = update(locations).where(locations.c.id == bindparam("location_id")).values(geohash=bindparam("geohash"))
+    last_id = 0
+    while True:
+        result = await conn.execute(select(locations.c.id, locations.c.latitude, locations.c.longitude)
+                                    .where(locations.c.geohash.is_(None), locations.c.id > last_id)
+                                    .order_by(locations.c.id).limit(BATCH_SIZE))
+        rows = result.all()
+        if not rows:
+            break
+        await conn.execute(statement, [{"location_id": location_id, "geohash": geo.encode(latitude, longitude)}
+                                       for location_id, latitude, longitude in rows])
+        last_id = rows[-1][0]
@@ -0,0 +1,72 @@
+from datetime import datetime
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, Table, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import ops
+
+DESCRIPTION = "Merge duplicated relations, make (location_id, category_id) unique and add the reviews history"
+
+metadata = MetaData()
+
+location_category_reviewed = Table(
+    "location_category_reviewed", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("location_id", Integer),
+    Column("category_id", Integer),
+    Column("last_reviewed", DateTime),
+)
+
+reviews = Table(
+    "reviews", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("relation_id", Integer, ForeignKey("location_category_reviewed.id", ondelete="CASCADE"), nullable=False),
+    Column("reviewed_at", DateTime, nullable=False, default=datetime.utcnow),
+    Index("ix_reviews_relation_id_reviewed_at", "relation_id", "reviewed_at"),
+)
+
+INDEXES = [
+    Index("ix_location_category_reviewed_category_id", location_category_reviewed.c.category_id),
+    Index("ix_location_category_reviewed_last_reviewed_id", location_category_reviewed.c.last_reviewed, location_category_reviewed.c.id),
+    Index("ix_location_category_reviewed_never_reviewed", location_category_reviewed.c.id,
+          postgresql_where=location_category_reviewed.c.last_reviewed.is_(None),
+          sqlite_where=location_category_reviewed.c.last_reviewed.is_(None)),
+]
+
+# Each duplicated (location_id, category_id) pair keeps its oldest row, with the latest review of the pair.
+KEEP_LATEST_REVIEW = text("""
+    UPDATE location_category_reviewed
+    SET last_reviewed = (
+        SELECT max(duplicate.last_reviewed) FROM location_category_reviewed AS duplicate
+        WHERE duplicate.location_id = location_category_reviewed.location_id
+          AND duplicate.category_id = location_category_reviewed.category_id
+    )
+    WHERE id IN (SELECT min(id) FROM location_category_reviewed GROUP BY location_id, category_id HAVING count(*) > 1)
+""")
+
+DELETE_DUPLICATES = text("""
+    DELETE FROM location_category_reviewed
+    WHERE id IN (
+        SELECT duplicate.id
+        FROM location_category_reviewed AS duplicate
+        JOIN (SELECT location_id, category_id, min(id) AS keep_id FROM location_category_reviewed
+              GROUP BY location_id, category_id HAVING count(*) > 1) AS pair
+          ON pair.location_id = duplicate.location_id AND pair.category_id = duplicate.category_id
+        WHERE duplicate.id <> pair.keep_id
+    )
+""")
+
+BACKFILL_REVIEWS = text("""
+    INSERT INTO reviews (relation_id, reviewed_at)
+    SELECT id, last_reviewed FROM location_category_reviewed WHERE last_reviewed IS NOT NULL
+""")
+
+async def upgrade(conn: AsyncConnection):
+    if not await ops.has_unique(conn, "location_category_reviewed", ["location_id", "category_id"]):
+        await conn.execute(KEEP_LATEST_REVIEW)
+        await conn.execute(DELETE_DUPLICATES)
+        await ops.create_index(conn, Index("uq_location_category_reviewed_location_category",
+                                           location_category_reviewed.c.location_id, location_category_reviewed.c.category_id, unique=True))
+    for index in INDEXES:
+        await ops.create_index(conn, index)
+    if await ops.create_table(conn, reviews):
+        # The history starts with the last review known of each relation.
+        await conn.execute(BACKFILL_REVIEWS)
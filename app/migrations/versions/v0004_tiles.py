@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Date, DateTime, Integer, MetaData, String, Table, case, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import ops
+from app.config.settings import TILE_PRECISION
+
+DESCRIPTION = "Add the tile counters of the heatmaps and compute them"
+
+# Relations last reviewed within this many days are counted per review day, as the tiles service did when
+# this migration was written; older reviews only count as stale.
+STALE_AFTER_DAYS = 30
+
+metadata = MetaData()
+
+tiles_table = Table(
+    "tiles", metadata,
+    Column("geohash", String(12), primary_key=True),
+    Column("locations", Integer, nullable=False, default=0),
+    Column("relations", Integer, nullable=False, default=0),
+    Column("never_reviewed", Integer, nullable=False, default=0),
+)
+
+tile_reviews = Table(
+    "tile_reviews", metadata,
+    Column("geohash", String(12), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("relations", Integer, nullable=False, default=0),
+)
+
+# The columns of the base tables the backfill reads, as they are at this version.
+locations = Table(
+    "locations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("geohash", String(12)),
+)
+
+relations = Table(
+    "location_category_reviewed", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("location_id", Integer),
+    Column("last_reviewed", DateTime),
+)
+
+async def upgrade(conn: AsyncConnection):
+    created = await ops.create_table(conn, tiles_table)
+    await ops.create_table(conn, tile_reviews)
+    if created:
+        await _backfill(conn)
+
+async def _backfill(conn: AsyncConnection):
+    tile = func.substr(locations.c.geohash, 1, TILE_PRECISION).label("geohash")
+    await conn.execute(insert(tiles_table).from_select(
+        ["geohash", "locations", "relations", "never_reviewed"],
+        select(tile, func.count(func.distinct(locations.c.id)), func.count(relations.c.id),
+               func.coalesce(func.sum(case(((relations.c.id.is_not(None)) & relations.c.last_reviewed.is_(None), 1), else_=0)), 0))
+        .select_from(locations.outerjoin(relations, relations.c.location_id == locations.c.id))
+        .where(locations.c.geohash.is_not(None))
+        .group_by(tile)))
+
+    first_day = datetime.utcnow().date() - timedelta(days=STALE_AFTER_DAYS - 1)
+    day = func.date(relations.c.last_reviewed, type_=Date).label("day")
+    await conn.execute(insert(tile_reviews).from_select(
+        ["geohash", "day", "relations"],
+        select(tile, day, func.count())
+        .select_from(locations.join(relations, relations.c.location_id == locations.c.id))
+        .where(locations.c.geohash.is_not(None), relations.c.last_reviewed >= datetime.combine(first_day, datetime.min.time()))
+        .group_by(tile, day)))
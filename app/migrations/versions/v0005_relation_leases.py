@@ -0,0 +1,9 @@
+from sqlalchemy import Column, DateTime, String
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import ops
+
+DESCRIPTION = "Add the reviewer lease columns of the relations"
+
+async def upgrade(conn: AsyncConnection):
+    await ops.add_column(conn, "location_category_reviewed", Column("leased_by", String(64)))
+    await ops.add_column(conn, "location_category_reviewed", Column("leased_until", DateTime))
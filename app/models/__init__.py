@@ -1 +1 @@
-from .models import Location, Category, LocationCategoryReviewed
+from .models import Location, Category, LocationCategoryReviewed, Review, Tile, TileReview
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.config.database import Base
@@ -11,12 +11,14 @@ class Location(Base):
         id (int): The unique identifier of the location.
         latitude (float): The latitude of the location.
         longitude (float): The longitude of the location.
+        geohash (str): The geohash of the cell containing the location, used as a spatial index.
         created_at (datetime): The timestamp when the location was created.
     """
     __tablename__ = "locations"
     id = Column(Integer, primary_key=True, index=True)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    geohash = Column(String(12), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Category(Base):
@@ -35,21 +37,90 @@ class Category(Base):
 
 class LocationCategoryReviewed(Base):
     """
-    Model representing the reviewed relationship between a location and a category.
+    Model representing the link between a location and a category, and its review state.
+
+    Each (location, category) pair is stored once. The review history lives in the reviews table;
+    last_reviewed is a denormalized copy of the latest review, kept for fast reads.
 
     Attributes:
         id (int): The unique identifier of the reviewed relationship.
         location_id (int): The ID of the related location.
         category_id (int): The ID of the related category.
         last_reviewed (datetime): The timestamp when the relationship was last reviewed.
+        leased_by (str): The reviewer currently holding the relationship for review, if any.
+        leased_until (datetime): The expiry of that lease; an expired lease can be claimed by anyone.
         location (Location): The related location object.
         category (Category): The related category object.
+        reviews (List[Review]): The reviews of the relationship.
     """
     __tablename__ = "location_category_reviewed"
+    __table_args__ = (
+        UniqueConstraint("location_id", "category_id", name="uq_location_category_reviewed_location_category"),
+        Index("ix_location_category_reviewed_category_id", "category_id"),
+        Index("ix_location_category_reviewed_last_reviewed_id", "last_reviewed", "id"),
+        Index("ix_location_category_reviewed_never_reviewed", "id",
+              postgresql_where=Column("last_reviewed").is_(None), sqlite_where=Column("last_reviewed").is_(None)),
+    )
     id = Column(Integer, primary_key=True, index=True)
     location_id = Column(Integer, ForeignKey('locations.id'), nullable=False)
     category_id = Column(Integer, ForeignKey('categories.id'), nullable=False)
     last_reviewed = Column(DateTime, default=None)
+    leased_by = Column(String(64), default=None)
+    leased_until = Column(DateTime, default=None)
 
     location = relationship("Location")
     category = relationship("Category")
+    reviews = relationship("Review", back_populates="relation", passive_deletes=True)
+
+class Review(Base):
+    """
+    Model representing a review of a location-category relationship. Reviews are only ever appended.
+
+    Attributes:
+        id (int): The unique identifier of the review.
+        relation_id (int): The ID of the reviewed location-category relationship.
+        reviewed_at (datetime): The timestamp of the review.
+        relation (LocationCategoryReviewed): The reviewed relationship object.
+    """
+    __tablename__ = "reviews"
+    __table_args__ = (
+        Index("ix_reviews_relation_id_reviewed_at", "relation_id", "reviewed_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    relation_id = Column(Integer, ForeignKey('location_category_reviewed.id', ondelete="CASCADE"), nullable=False)
+    reviewed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    relation = relationship("LocationCategoryReviewed", back_populates="reviews")
+
+class Tile(Base):
+    """
+    Model representing the counters of a map tile (a geohash cell), kept up to date by every write.
+
+    Attributes:
+        geohash (str): The geohash of the tile, at TILE_PRECISION characters.
+        locations (int): The number of locations in the tile.
+        relations (int): The number of location-category relations of those locations.
+        never_reviewed (int): The number of those relations that have never been reviewed.
+    """
+    __tablename__ = "tiles"
+    geohash = Column(String(12), primary_key=True)
+    locations = Column(Integer, nullable=False, default=0)
+    relations = Column(Integer, nullable=False, default=0)
+    never_reviewed = Column(Integer, nullable=False, default=0)
+
+class TileReview(Base):
+    """
+    Model representing the number of relations of a tile last reviewed on a given day.
+
+    Only the days inside the staleness window are maintained; the relations of a tile that are neither
+    never reviewed nor counted here for a recent day are stale.
+
+    Attributes:
+        geohash (str): The geohash of the tile.
+        day (date): The day of the last review.
+        relations (int): The number of relations of the tile last reviewed that day.
+    """
+    __tablename__ = "tile_reviews"
+    geohash = Column(String(12), primary_key=True)
+    day = Column(Date, primary_key=True)
+    relations = Column(Integer, nullable=False, default=0)
@@ -1,3 +1,4 @@
 from .categories import router as categories_router
 from .locations import router as locations_router
-from .recommendations import router as recommendations_router
\ No newline at end of file
+from .recommendations import router as recommendations_router
+from .imports import router as imports_router
\ No newline at end of file
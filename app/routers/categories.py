@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import categories as crud_categories
+from app.services import etags, exports, pagination, serialization, singleflight
 from sqlalchemy.exc import IntegrityError  # Importar IntegrityError
 from app.schemas import schemas
-from app.config.database import get_db
+from app.config.database import get_db, get_read_db, is_replica
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
 
@@ -29,34 +35,136 @@ async def create_category(category: schemas.CategoryCreate, db: AsyncSession = D
     except IntegrityError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Category name must be unique")
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred " + str(e))
+        logger.exception("Could not create the category")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.post("/bulk", response_model=schemas.CategoryBulkResult, summary="Create many categories", description="Create many categories in a single request.", response_description="The created categories and the rejected ones")
+async def create_categories(categories: list[schemas.CategoryCreate], db: AsyncSession = Depends(get_db)):
+    """
+    Create many categories.
+
+    This endpoint creates all the given categories using one multi-row insert per chunk.
+    Categories that cannot be created, such as duplicated names, are reported in `errors` without aborting the rest of the batch.
+
+    Parameters:
+    - **categories** (List[schemas.CategoryCreate]): The categories to create.
+
+    Returns:
+    - **schemas.CategoryBulkResult**: The created categories and the errors of the rejected ones.
+
+    Raises:
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        created, errors = await crud_categories.create_categories(db=db, categories=categories)
+        return schemas.CategoryBulkResult(created=created, errors=[schemas.BulkItemError(index=index, detail=detail) for index, detail in errors])
+    except Exception as e:
+        logger.exception("Could not create the categories")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+async def _read_categories_page(db: AsyncSession, skip: int, limit: int, cursor: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    categories = await crud_categories.get_categories(db=db, skip=skip, limit=limit, cursor=cursor)
+    return serialization.categories.dump_json(categories), pagination.next_cursor(categories, limit, lambda category: {"id": category.id})
 
 @router.get("/", response_model=list[schemas.Category], summary="Retrieve a list of categories", description="Retrieve a list of categories from the database, allowing for pagination.",
             response_description="A list of categories", status_code=status.HTTP_200_OK)
-async def read_categories(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+async def read_categories(request: Request, response: Response, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                          ids: Optional[str] = Query(None, pattern=r"^\d+(,\d+)*$"), db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a list of categories.
 
     This endpoint returns a list of categories from the database, allowing for pagination.
+    When more categories may follow, the cursor of the next page is returned in the `X-Next-Cursor` header.
 
     Parameters:
-    - **skip** (int, optional): The number of categories to skip. Defaults to 0.
-    - **limit** (int, optional): The maximum number of categories to return. Defaults to 100.
+    - **skip** (int, optional): The number of categories to skip. Defaults to 0. Ignored when a cursor is given.
+    - **limit** (int, optional): The maximum number of categories to return, up to 1000. Defaults to 100.
+    - **cursor** (str, optional): The `X-Next-Cursor` value of the previous page.
+    - **ids** (str, optional): Comma-separated IDs, such as `3,1,2`. When given, only these categories are returned, in the
+      order given and skipping the ones not found, and the pagination parameters are ignored.
 
     Returns:
     - **List[schemas.Category]**: A list of categories.
 
+    Raises:
+    - **HTTPException**: If the cursor is invalid or more than `MAX_IDS` IDs are given.
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        if ids is not None:
+            requested = pagination.parse_ids(ids)
+            if len(requested) > pagination.MAX_IDS:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {pagination.MAX_IDS} IDs can be requested")
+            if not_modified := etags.not_modified(request, response, "categories", "ids", requested):
+                return not_modified
+            found = await crud_categories.get_categories_by_ids(db, requested)
+            return [found[category_id] for category_id in requested if category_id in found]
+        if not_modified := etags.not_modified(request, response, "categories", skip, limit, cursor):
+            return not_modified
+        # Identical concurrent requests share one query and one serialized body; reads of the replica are
+        # never shared with reads of the primary, which must see the latest writes.
+        body, next_cursor = await singleflight.category_lists.do((etags.version("categories"), is_replica(db), skip, limit, cursor),
+                                                                 lambda: _read_categories_page(db, skip, limit, cursor))
+        if next_cursor is not None:
+            response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+        return serialization.json_response(body, response)
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.exception("Could not read the categories")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.get("/search", response_model=list[schemas.Category], summary="Search categories by name", description="Autocomplete categories by name, tolerating case, accents and typos.",
+            response_description="The matching categories, best matches first", status_code=status.HTTP_200_OK)
+async def search_categories(request: Request, response: Response, q: str = Query(..., min_length=1, max_length=100),
+                            limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_read_db)):
+    """
+    Search categories by name.
+
+    This endpoint serves autocomplete from an in-memory index of the category names, without querying the database.
+    Matching ignores case and accents: first come the names starting with the query, then the names with a word
+    starting with it, then the names similar to it (for queries of at least 3 characters), so typos still find results.
+
+    Parameters:
+    - **q** (str): The text typed so far.
+    - **limit** (int, optional): The maximum number of categories to return, up to 100. Defaults to 10.
+
+    Returns:
+    - **List[schemas.Category]**: The matching categories, best matches first.
+
     Raises:
     - **HTTPException**: If an unexpected error occurs.
     """
     try:
-        categories = await crud_categories.get_categories(db=db, skip=skip, limit=limit)
-        return categories
+        if not_modified := etags.not_modified(request, response, "categories", q, limit):
+            return not_modified
+        categories = await crud_categories.search_categories(db=db, query=q, limit=limit)
+        return serialization.categories.response(categories, response)
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred" + str(e))
+        logger.exception("Could not search the categories")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_categories(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), db: AsyncSession = Depends(get_read_db)):
+    """
+    Export all categories.
+
+    This endpoint streams every category as NDJSON (one JSON object per line) or CSV,
+    reading from a server-side cursor so that exports of any size use bounded memory.
+
+    Parameters:
+    - **format** (str, optional): The output format, `ndjson` or `csv`. Defaults to `ndjson`.
+
+    Returns:
+    - **StreamingResponse**: The exported categories.
+    """
+    return StreamingResponse(exports.stream_export(db=db, table="categories", format=format), media_type=exports.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="categories.{format}"'})
 
 @router.get("/{category_id}", response_model=schemas.Category)
-async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
+async def read_category(request: Request, response: Response, category_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a category by ID.
 
@@ -72,6 +180,8 @@ async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
     - **HTTPException**: If the category with the given ID is not found.
     """
     try:
+        if not_modified := etags.not_modified(request, response, "categories"):
+            return not_modified
         db_category = await crud_categories.get_category(db=db, category_id=category_id)
         if db_category is None:
             raise HTTPException(status_code=404, detail="Category not found")
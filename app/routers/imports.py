@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services import imports as crud_imports
+from app.schemas import schemas
+from app.config.database import get_db
+
+router = APIRouter(prefix="/imports", tags=["Imports"])
+
+@router.post("/locations", response_model=schemas.ImportResult)
+async def import_locations(request: Request, format: str = Query("ndjson", pattern="^(ndjson|csv)$"), offset: int = Query(0, ge=0),
+                           db: AsyncSession = Depends(get_db)):
+    """
+    Import locations from a CSV or NDJSON upload.
+
+    This endpoint reads the raw request body incrementally and creates the locations it contains in batches.
+    Each record holds `latitude`, `longitude` and optionally `categories` (a list of names, or names separated
+    by `|` in CSV files); unknown category names are created and linked to the location.
+
+    Parameters:
+    - **format** (str, optional): The format of the body, `ndjson` or `csv` (with a header row). Defaults to `ndjson`.
+    - **offset** (int, optional): The number of leading records to skip, to resume an interrupted import. Defaults to 0.
+
+    Returns:
+    - **schemas.ImportResult**: The counters of the import, the rejected records and the offset to resume from.
+
+    Raises:
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        records = crud_imports.iter_records(crud_imports.iter_lines(request.stream()), format)
+        return await crud_imports.import_locations(db=db, records=records, offset=offset)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.post("/categories", response_model=schemas.ImportResult)
+async def import_categories(request: Request, format: str = Query("ndjson", pattern="^(ndjson|csv)$"), offset: int = Query(0, ge=0),
+                            db: AsyncSession = Depends(get_db)):
+    """
+    Import categories from a CSV or NDJSON upload.
+
+    This endpoint reads the raw request body incrementally and creates the categories it contains in batches.
+    Each record holds a `name`; names that already exist are reported as errors.
+
+    Parameters:
+    - **format** (str, optional): The format of the body, `ndjson` or `csv` (with a header row). Defaults to `ndjson`.
+    - **offset** (int, optional): The number of leading records to skip, to resume an interrupted import. Defaults to 0.
+
+    Returns:
+    - **schemas.ImportResult**: The counters of the import, the rejected records and the offset to resume from.
+
+    Raises:
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        records = crud_imports.iter_records(crud_imports.iter_lines(request.stream()), format)
+        return await crud_imports.import_categories(db=db, records=records, offset=offset)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
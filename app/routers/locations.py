@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import locations as crud_locations
+from app.services import etags, exports, pagination, serialization
 from app.schemas import schemas
-from app.config.database import SessionLocal, get_db
+from app.config.database import get_db, get_read_db
+from app.config.settings import VIEWPORT_MAX_POINTS
 
 router = APIRouter(prefix="/locations", tags=["Locations"])
 
 @router.post("/", response_model=schemas.Location, status_code=status.HTTP_201_CREATED)
-async def create_location(location: schemas.LocationCreate, db: AsyncSession = Depends(get_db)):
+async def create_location(location: schemas.LocationCreate, response: Response, db: AsyncSession = Depends(get_db)):
     """
     Create a location.
     
     This endpoint creates a new location with the provided latitude and longitude.
+    When `LOCATION_DEDUP_METERS` is set and a stored location is that close, the stored location is
+    returned with status 200 instead of creating a duplicate.
 
     Parameters:
     - **location** (schemas.LocationCreate): The location data to create, including latitude and longitude.
@@ -23,34 +29,178 @@ async def create_location(location: schemas.LocationCreate, db: AsyncSession = D
     - **HTTPException**: If an unexpected error occurs.
     """
     try:
-        return await crud_locations.create_location(db=db, location=location)
+        db_location, created = await crud_locations.create_location(db=db, location=location)
+        if not created:
+            response.status_code = status.HTTP_200_OK
+        return db_location
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.post("/bulk", response_model=schemas.LocationBulkResult)
+async def create_locations(locations: list[schemas.LocationCreate], db: AsyncSession = Depends(get_db)):
+    """
+    Create many locations.
+
+    This endpoint creates all the given locations using one multi-row insert per chunk.
+    Locations that cannot be created are reported in `errors` without aborting the rest of the batch.
+    When `LOCATION_DEDUP_METERS` is set, the locations that close to a stored one, or to an earlier one of the
+    request, are answered with that location and their indexes are listed in `merged`.
+
+    Parameters:
+    - **locations** (List[schemas.LocationCreate]): The locations to create.
+
+    Returns:
+    - **schemas.LocationBulkResult**: The created or matching locations, the merged ones and the errors of the rejected ones.
+
+    Raises:
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        created, merged, errors = await crud_locations.create_locations(db=db, locations=locations)
+        return schemas.LocationBulkResult(created=created, merged=merged, errors=[schemas.BulkItemError(index=index, detail=detail) for index, detail in errors])
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
 @router.get("/", response_model=list[schemas.Location])
-async def read_locations(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+async def read_locations(request: Request, response: Response, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                         ids: Optional[str] = Query(None, pattern=r"^\d+(,\d+)*$"), db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve locations.
 
     This endpoint returns a list of locations from the database, allowing for pagination.
+    When more locations may follow, the cursor of the next page is returned in the `X-Next-Cursor` header.
 
     Parameters:
-    - **skip** (int, optional): The number of locations to skip. Defaults to 0.
-    - **limit** (int, optional): The maximum number of locations to return. Defaults to 100.
+    - **skip** (int, optional): The number of locations to skip. Defaults to 0. Ignored when a cursor is given.
+    - **limit** (int, optional): The maximum number of locations to return, up to 1000. Defaults to 100.
+    - **cursor** (str, optional): The `X-Next-Cursor` value of the previous page.
+    - **ids** (str, optional): Comma-separated IDs, such as `3,1,2`. When given, only these locations are returned, in the
+      order given and skipping the ones not found, and the pagination parameters are ignored.
 
     Returns:
     - **List[schemas.Location]**: A list of locations.
 
     Raises:
+    - **HTTPException**: If the cursor is invalid or more than `MAX_IDS` IDs are given.
     - **HTTPException**: If an unexpected error occurs.
     """
     try:
-        return await crud_locations.get_locations(db=db, skip=skip, limit=limit)
+        if ids is not None:
+            requested = pagination.parse_ids(ids)
+            if len(requested) > pagination.MAX_IDS:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {pagination.MAX_IDS} IDs can be requested")
+            if not_modified := etags.not_modified(request, response, "locations", "ids", requested):
+                return not_modified
+            found = await crud_locations.get_locations_by_ids(db, requested)
+            return [found[location_id] for location_id in requested if location_id in found]
+        if not_modified := etags.not_modified(request, response, "locations", skip, limit, cursor):
+            return not_modified
+        locations = await crud_locations.get_locations(db=db, skip=skip, limit=limit, cursor=cursor)
+        next_cursor = pagination.next_cursor(locations, limit, lambda location: {"id": location.id})
+        if next_cursor is not None:
+            response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+        return serialization.locations.response(locations, response)
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_locations(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), db: AsyncSession = Depends(get_read_db)):
+    """
+    Export all locations.
+
+    This endpoint streams every location as NDJSON (one JSON object per line) or CSV,
+    reading from a server-side cursor so that exports of any size use bounded memory.
+
+    Parameters:
+    - **format** (str, optional): The output format, `ndjson` or `csv`. Defaults to `ndjson`.
+
+    Returns:
+    - **StreamingResponse**: The exported locations.
+    """
+    return StreamingResponse(exports.stream_export(db=db, table="locations", format=format), media_type=exports.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="locations.{format}"'})
+
+@router.get("/nearby", response_model=list[schemas.LocationDistance])
+async def read_nearby_locations(request: Request, response: Response, latitude: float = Query(ge=-90, le=90), longitude: float = Query(ge=-180, le=180),
+                                k: int = Query(10, ge=1, le=1000), radius_km: Optional[float] = Query(None, gt=0),
+                                db: AsyncSession = Depends(get_read_db)):
+    """
+    Retrieve the locations nearest to a point.
+
+    This endpoint returns the k locations nearest to the given coordinates, optionally limited to those within a radius.
+
+    Parameters:
+    - **latitude** (float): The latitude of the point.
+    - **longitude** (float): The longitude of the point.
+    - **k** (int, optional): The maximum number of locations to return, up to 1000. Defaults to 10.
+    - **radius_km** (float, optional): The maximum distance in kilometers. Defaults to no limit.
+
+    Returns:
+    - **List[schemas.LocationDistance]**: The locations with their distance in kilometers, nearest first.
+
+    Raises:
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        if not_modified := etags.not_modified(request, response, "locations", latitude, longitude, k, radius_km):
+            return not_modified
+        nearby = await crud_locations.get_nearby_locations(db=db, latitude=latitude, longitude=longitude, k=k, radius_km=radius_km)
+        return [schemas.LocationDistance(**schemas.Location.model_validate(location).model_dump(), distance_km=distance)
+                for location, distance in nearby]
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.get("/viewport", response_model=schemas.Viewport)
+async def read_viewport(request: Request, response: Response, min_latitude: float = Query(ge=-90, le=90), max_latitude: float = Query(ge=-90, le=90),
+                        min_longitude: float = Query(ge=-180, le=180), max_longitude: float = Query(ge=-180, le=180),
+                        zoom: int = Query(ge=0, le=22), category_id: Optional[int] = None, by_category: bool = False,
+                        max_points: int = Query(VIEWPORT_MAX_POINTS, ge=0, le=5000), db: AsyncSession = Depends(get_read_db)):
+    """
+    Retrieve the locations visible in a map viewport.
+
+    This endpoint returns the locations inside the bounding box as points when there are at most `max_points` of them,
+    and otherwise as clusters (count and centroid) of the geohash cells matching the zoom level.
+    A viewport crossing the antimeridian is given with `min_longitude` greater than `max_longitude`.
+
+    Parameters:
+    - **min_latitude** (float): The southern edge of the viewport.
+    - **max_latitude** (float): The northern edge of the viewport.
+    - **min_longitude** (float): The western edge of the viewport.
+    - **max_longitude** (float): The eastern edge of the viewport.
+    - **zoom** (int): The zoom level of the map, from 0 to 22.
+    - **category_id** (int, optional): Only include the locations related to this category.
+    - **by_category** (bool, optional): Split the clusters by category. Defaults to false.
+    - **max_points** (int, optional): The maximum number of locations returned as points. Defaults to `VIEWPORT_MAX_POINTS`.
+
+    Returns:
+    - **schemas.Viewport**: The points or the clusters of the viewport.
+
+    Raises:
+    - **HTTPException**: If min_latitude is greater than max_latitude.
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        if min_latitude > max_latitude:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_latitude must not be greater than max_latitude")
+        parts = (min_latitude, max_latitude, min_longitude, max_longitude, zoom, category_id, by_category, max_points)
+        if category_id is not None or by_category:
+            parts += (etags.version("relations"),)
+        if not_modified := etags.not_modified(request, response, "locations", *parts):
+            return not_modified
+        return await crud_locations.get_viewport(db=db, min_latitude=min_latitude, max_latitude=max_latitude, min_longitude=min_longitude,
+                                                 max_longitude=max_longitude, zoom=zoom, category_id=category_id,
+                                                 by_category=by_category, max_points=max_points)
+    except HTTPException as e:
+        raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
 @router.get("/{location_id}", response_model=schemas.Location)
-async def read_location(location_id: int, db: AsyncSession = Depends(get_db)):
+async def read_location(request: Request, response: Response, location_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a location by ID.
 
@@ -67,6 +217,8 @@ async def read_location(location_id: int, db: AsyncSession = Depends(get_db)):
     - **HTTPException**: If an unexpected error occurs.
     """
     try:
+        if not_modified := etags.not_modified(request, response, "locations"):
+            return not_modified
         db_location = await crud_locations.get_location(db=db, location_id=location_id)
         if db_location is None:
             raise HTTPException(status_code=404, detail="Location not found")
@@ -1,43 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import recommendations as crud_recommendations
+from app.services import etags, exports, pagination, serialization, singleflight
 from app.schemas import schemas
-from app.config.database import get_db
-from typing import List
+from app.config.database import get_db, get_read_db, is_replica
+from app.config.settings import RECOMMENDATION_LEASE_SECONDS, RECOMMENDATION_MAX_LEASE_SECONDS
+from typing import List, Optional, Tuple
 
 router = APIRouter(prefix="/recommendations", tags=["Recommendations"])
 
+async def _read_fresh_page(db: AsyncSession, limit: int, cursor: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    recommendations = await crud_recommendations.get_fresh_recommendations(db=db, limit=limit, cursor=cursor)
+    next_cursor = pagination.next_cursor(recommendations, limit, lambda relation: {
+        "last_reviewed": relation.last_reviewed.isoformat() if relation.last_reviewed else None,
+        "id": relation.id,
+    })
+    return serialization.relations.dump_json(recommendations), next_cursor
+
 @router.get("/fresh/", response_model=List[schemas.LocationCategoryReviewed], summary="Get fresh recommendations", description="Get fresh recommendations.", response_description="A list of recommended location-category relationships.")
-async def get_fresh_recommendations(db: AsyncSession = Depends(get_db)):
+async def get_fresh_recommendations(request: Request, response: Response, limit: int = Query(10, ge=1, le=1000), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
     """
     Get fresh recommendations.
 
-    This endpoint returns a list of 10 location-category combinations that have not been reviewed in the last 30 days,
-    prioritizing those that have never been reviewed.
+    This endpoint returns a list of location-category combinations that have not been reviewed in the last 30 days,
+    prioritizing those that have never been reviewed and then the ones reviewed longest ago.
+    When more recommendations may follow, the cursor of the next page is returned in the `X-Next-Cursor` header.
+
+    Parameters:
+    - **limit** (int, optional): The maximum number of recommendations to return, up to 1000. Defaults to 10.
+    - **cursor** (str, optional): The `X-Next-Cursor` value of the previous page.
 
     Returns:
     - **List[schemas.LocationCategoryReviewed]**: A list of recommended location-category relationships.
 
     Raises:
+    - **HTTPException**: If the cursor is invalid.
     - **HTTPException**: If an unexpected error occurs.
     """
     try:
-        return await crud_recommendations.get_fresh_recommendations(db=db)
+        if not_modified := etags.not_modified(request, response, "relations", limit, cursor):
+            return not_modified
+        # Every client asks for the first page at app open: identical concurrent requests share one read and one serialized
+        # body. Reads of the replica are never shared with reads of the primary, which must see the latest writes.
+        body, next_cursor = await singleflight.fresh_recommendations.do((etags.version("relations"), is_replica(db), limit, cursor),
+                                                                        lambda: _read_fresh_page(db, limit, cursor))
+        if next_cursor is not None:
+            response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+        return serialization.json_response(body, response)
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
 @router.get("/never-reviewed/", response_model=List[schemas.LocationCategoryReviewed])
-async def get_never_reviewed_recommendations(db: AsyncSession = Depends(get_db)):
+async def get_never_reviewed_recommendations(request: Request, response: Response, limit: int = Query(10, ge=1, le=1000), cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
     """
     Get never reviewed recommendations.
 
     This endpoint returns a list of recommendations that have never been reviewed.
+    When more recommendations may follow, the cursor of the next page is returned in the `X-Next-Cursor` header.
+
+    Args:
+        limit (int, optional): The maximum number of recommendations to return, up to 1000. Defaults to 10.
+        cursor (str, optional): The `X-Next-Cursor` value of the previous page.
 
     Returns:
         List[schemas.LocationCategoryReviewed]: A list of never reviewed recommendations
+
+    Raises:
+        HTTPException: If the cursor is invalid.
     """
     try:
-        return await crud_recommendations.get_never_reviewed_recommendations(db=db)
+        if not_modified := etags.not_modified(request, response, "relations", limit, cursor):
+            return not_modified
+        recommendations = await crud_recommendations.get_never_reviewed_recommendations(db=db, limit=limit, cursor=cursor)
+        next_cursor = pagination.next_cursor(recommendations, limit, lambda relation: {"id": relation.id})
+        if next_cursor is not None:
+            response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+        return serialization.relations.response(recommendations, response)
+    except pagination.InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
@@ -59,6 +102,125 @@ async def create_relation(review: schemas.LocationCategoryReviewedCreate, db: As
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
     
+@router.post("/bulk", response_model=schemas.LocationCategoryReviewedBulkResult, summary="Create many relations", description="Create many relations in a single request.", response_description="The created relations and the rejected ones")
+async def create_relations(relations: List[schemas.LocationCategoryReviewedCreate], db: AsyncSession = Depends(get_db)):
+    """
+    Create many relations.
+
+    This endpoint creates all the given relations using one multi-row insert per chunk.
+    Relations that cannot be created, such as those pointing to a missing location or category,
+    are reported in `errors` without aborting the rest of the batch.
+
+    Args:
+        relations (List[schemas.LocationCategoryReviewedCreate]): The relations to create.
+
+    Returns:
+        schemas.LocationCategoryReviewedBulkResult: The created relations and the errors of the rejected ones.
+    """
+    try:
+        created, errors = await crud_recommendations.create_relations(db=db, relations=relations)
+        return schemas.LocationCategoryReviewedBulkResult(created=created, errors=[schemas.BulkItemError(index=index, detail=detail) for index, detail in errors])
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+    
+@router.post("/review/bulk", response_model=schemas.BulkReviewResult, summary="Review many relations", description="Mark many relations as reviewed in a single request.", response_description="The reviewed relations and the missing IDs")
+async def create_reviews(reviews: List[schemas.BulkReviewItem], db: AsyncSession = Depends(get_db)):
+    """
+    Review many relations.
+
+    This endpoint marks all the given relations as reviewed with one set-based update per chunk.
+    Each item may carry the time the review was done; otherwise the time of the request is used.
+
+    Args:
+        reviews (List[schemas.BulkReviewItem]): The IDs of the relations to review, with optional timestamps.
+
+    Returns:
+        schemas.BulkReviewResult: The reviewed relations and the requested IDs that do not exist.
+    """
+    try:
+        reviewed, missing = await crud_recommendations.create_reviews(db=db, reviews=reviews)
+        return schemas.BulkReviewResult(reviewed=reviewed, missing=missing)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+def _lease_seconds(lease_seconds: Optional[int]) -> int:
+    if lease_seconds is None:
+        return RECOMMENDATION_LEASE_SECONDS
+    if lease_seconds > RECOMMENDATION_MAX_LEASE_SECONDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"lease_seconds must not exceed {RECOMMENDATION_MAX_LEASE_SECONDS}")
+    return lease_seconds
+
+@router.post("/claim", response_model=List[schemas.RecommendationLease], summary="Claim recommendations", description="Lease distinct due relations to a reviewer.", response_description="The leased relations")
+async def claim_recommendations(claim: schemas.RecommendationClaim, db: AsyncSession = Depends(get_db)):
+    """
+    Claim recommendations to review.
+
+    This endpoint leases up to `limit` relations due for review to the reviewer, in the order of the fresh recommendations.
+    Concurrent reviewers always get distinct relations, and leased relations are hidden from the fresh and never-reviewed
+    lists until they are reviewed, released, or their lease expires.
+
+    Args:
+        claim (schemas.RecommendationClaim): The reviewer, the number of relations and the duration of the lease.
+
+    Returns:
+        List[schemas.RecommendationLease]: The leased relations, with the expiry of the lease.
+
+    Raises:
+        HTTPException: If the lease is longer than RECOMMENDATION_MAX_LEASE_SECONDS.
+        HTTPException: If an unexpected error occurs.
+    """
+    try:
+        return await crud_recommendations.claim_recommendations(db=db, reviewer=claim.reviewer, limit=claim.limit,
+                                                                lease_seconds=_lease_seconds(claim.lease_seconds))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.post("/leases/renew", response_model=List[schemas.RecommendationLease], summary="Renew leases", description="Extend the leases a reviewer holds.", response_description="The relations whose lease was renewed")
+async def renew_leases(leases: schemas.LeaseUpdate, db: AsyncSession = Depends(get_db)):
+    """
+    Renew leases.
+
+    This endpoint extends the leases the reviewer still holds on the given relations. Expired leases are not renewed.
+
+    Args:
+        leases (schemas.LeaseUpdate): The reviewer, the IDs of the relations and the new duration of the lease.
+
+    Returns:
+        List[schemas.RecommendationLease]: The relations whose lease was renewed.
+
+    Raises:
+        HTTPException: If the lease is longer than RECOMMENDATION_MAX_LEASE_SECONDS.
+        HTTPException: If an unexpected error occurs.
+    """
+    try:
+        return await crud_recommendations.renew_leases(db=db, reviewer=leases.reviewer, relation_ids=leases.ids,
+                                                       lease_seconds=_lease_seconds(leases.lease_seconds))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
+@router.post("/leases/release", response_model=List[schemas.RecommendationLease], summary="Release leases", description="Give back leased relations without reviewing them.", response_description="The released relations")
+async def release_leases(leases: schemas.LeaseUpdate, db: AsyncSession = Depends(get_db)):
+    """
+    Release leases.
+
+    This endpoint ends the reviewer's leases on the given relations without reviewing them, so other reviewers can claim them.
+    Reviewing a relation also ends its lease.
+
+    Args:
+        leases (schemas.LeaseUpdate): The reviewer and the IDs of the relations.
+
+    Returns:
+        List[schemas.RecommendationLease]: The released relations.
+    """
+    try:
+        return await crud_recommendations.release_leases(db=db, reviewer=leases.reviewer, relation_ids=leases.ids)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
 @router.post("/{review_id}/review", response_model=schemas.LocationCategoryReviewed, status_code=status.HTTP_201_CREATED)
 async def create_review(review_id: int, db: AsyncSession = Depends(get_db)):
     """
@@ -76,7 +238,10 @@ async def create_review(review_id: int, db: AsyncSession = Depends(get_db)):
         HTTPException: If the review with the given ID is not found.
     """
     try:
-        return await crud_recommendations.create_review(db=db, review_id=review_id)
+        db_review = await crud_recommendations.create_review(db=db, review_id=review_id)
+        if db_review is None:
+            raise HTTPException(status_code=404, detail="Review not found")
+        return db_review
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -100,8 +265,53 @@ async def create_relation_with_review(review: schemas.LocationCategoryReviewedCr
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_relations(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), db: AsyncSession = Depends(get_read_db)):
+    """
+    Export all relations.
+
+    This endpoint streams every location-category relation as NDJSON (one JSON object per line) or CSV,
+    reading from a server-side cursor so that exports of any size use bounded memory.
+
+    Args:
+        format (str, optional): The output format, "ndjson" or "csv". Defaults to "ndjson".
+
+    Returns:
+        StreamingResponse: The exported relations.
+    """
+    return StreamingResponse(exports.stream_export(db=db, table="relations", format=format), media_type=exports.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="relations.{format}"'})
+
+@router.get("/{review_id}/reviews", response_model=List[schemas.Review])
+async def get_review_history(request: Request, response: Response, review_id: int, limit: int = Query(100, ge=1, le=1000), db: AsyncSession = Depends(get_read_db)):
+    """
+    Retrieve the review history of a relation.
+
+    This endpoint returns the reviews of a specific relation, most recent first.
+
+    Args:
+        review_id (int): The ID of the relation.
+        limit (int, optional): The maximum number of reviews to return, up to 1000. Defaults to 100.
+
+    Returns:
+        List[schemas.Review]: The reviews of the relation.
+
+    Raises:
+        HTTPException: If the relation with the given ID is not found.
+    """
+    try:
+        if not_modified := etags.not_modified(request, response, "relations", limit):
+            return not_modified
+        if await crud_recommendations.get_review(db=db, review_id=review_id) is None:
+            raise HTTPException(status_code=404, detail="Review not found")
+        return await crud_recommendations.get_review_history(db=db, review_id=review_id, limit=limit)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
+
 @router.get("/{review_id}", response_model=schemas.LocationCategoryReviewed)
-async def get_review(review_id: int, db: AsyncSession = Depends(get_db)):
+async def get_review(request: Request, response: Response, review_id: int, db: AsyncSession = Depends(get_read_db)):
     """
     Retrieve a review by ID.
 
@@ -117,6 +327,8 @@ async def get_review(review_id: int, db: AsyncSession = Depends(get_db)):
         HTTPException: If the review with the given ID is not found.
     """
     try:
+        if not_modified := etags.not_modified(request, response, "relations"):
+            return not_modified
         review = await crud_recommendations.get_review(db=db, review_id=review_id)
         if review is None:
             raise HTTPException(status_code=404, detail="Review not found")
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services import tiles as crud_tiles
+from app.services import etags
+from app.schemas import schemas
+from app.config.database import get_read_db
+from app.config.settings import TILE_PRECISION
+
+router = APIRouter(prefix="/tiles", tags=["Tiles"])
+
+@router.get("/", response_model=list[schemas.Tile])
+async def read_tiles(request: Request, response: Response, precision: int = Query(3, ge=1, le=TILE_PRECISION),
+                     prefix: Optional[str] = Query(None, pattern="^[0-9b-hjkmnp-z]+$"),
+                     min_latitude: Optional[float] = Query(None, ge=-90, le=90), max_latitude: Optional[float] = Query(None, ge=-90, le=90),
+                     min_longitude: Optional[float] = Query(None, ge=-180, le=180), max_longitude: Optional[float] = Query(None, ge=-180, le=180),
+                     db: AsyncSession = Depends(get_read_db)):
+    """
+    Retrieve the heatmap counters of the map.
+
+    This endpoint returns, for each geohash cell of the given precision, the number of locations, of location-category
+    relations, and of relations never reviewed or stale (last reviewed more than 30 days ago). The counters are
+    maintained on every write, so no location or relation is read.
+
+    Parameters:
+    - **precision** (int, optional): The geohash precision of the cells, up to `TILE_PRECISION`. Defaults to 3.
+    - **prefix** (str, optional): Only return the cells inside this geohash cell.
+    - **min_latitude**, **max_latitude**, **min_longitude**, **max_longitude** (float, optional): Only return the cells
+      intersecting this box; all four must be given. The box crosses the antimeridian if `min_longitude` is greater than `max_longitude`.
+
+    Returns:
+    - **List[schemas.Tile]**: The counters of the non-empty cells, ordered by geohash.
+
+    Raises:
+    - **HTTPException**: If the prefix is longer than the precision or the box is incomplete or inverted.
+    - **HTTPException**: If an unexpected error occurs.
+    """
+    try:
+        bbox = (min_latitude, max_latitude, min_longitude, max_longitude)
+        if all(value is None for value in bbox):
+            bbox = None
+        elif any(value is None for value in bbox) or min_latitude > max_latitude:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The bounding box must give all four edges, with min_latitude not greater than max_latitude")
+        if prefix and len(prefix) > precision:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The prefix must not be longer than the precision")
+        today = datetime.utcnow().date()
+        if not_modified := etags.not_modified(request, response, "locations", precision, prefix, bbox, today, etags.version("relations")):
+            return not_modified
+        return await crud_tiles.get_tiles(db=db, precision=precision, prefix=prefix, bbox=bbox, today=today)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred")
@@ -1,8 +1,23 @@
 from .schemas import (
     Location, 
     LocationCreate, 
+    LocationDistance, 
+    LocationCluster, 
+    Viewport, 
+    Tile, 
     Category, 
     CategoryCreate, 
     LocationCategoryReviewed, 
-    LocationCategoryReviewedCreate
+    LocationCategoryReviewedCreate, 
+    RecommendationLease, 
+    RecommendationClaim, 
+    LeaseUpdate, 
+    Review, 
+    BulkItemError, 
+    LocationBulkResult, 
+    CategoryBulkResult, 
+    LocationCategoryReviewedBulkResult, 
+    BulkReviewItem, 
+    BulkReviewResult, 
+    ImportResult
 )
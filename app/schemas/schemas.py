@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import List, Optional
 
@@ -33,6 +33,66 @@ class Location(LocationBase):
 
     model_config = ConfigDict(from_attributes=True)  # Updated to use ConfigDict
 
+class LocationDistance(Location):
+    """
+    Model representing a location returned by a nearby search.
+    
+    Attributes:
+        distance_km (float): The great-circle distance from the searched point, in kilometers.
+    """
+    distance_km: float
+
+class LocationCluster(BaseModel):
+    """
+    Model representing the locations of a viewport grouped in one geohash cell.
+    
+    Attributes:
+        geohash (str): The geohash of the cell.
+        count (int): The number of locations in the cell (or of relations, when clusters are split by category).
+        latitude (float): The mean latitude of the locations in the cell.
+        longitude (float): The mean longitude of the locations in the cell.
+        category_id (Optional[int]): The category of the locations, when clusters are split by category.
+    """
+    geohash: str
+    count: int
+    latitude: float
+    longitude: float
+    category_id: Optional[int] = None
+
+class Viewport(BaseModel):
+    """
+    Model representing the locations visible in a map viewport, either as points or as clusters.
+    
+    Attributes:
+        zoom (int): The zoom level of the map.
+        precision (int): The geohash precision of the clusters at that zoom level.
+        total (int): The number of locations returned as points, or the sum of the cluster counts.
+        points (List[Location]): The visible locations, when there are few of them.
+        clusters (List[LocationCluster]): The clusters of visible locations, when there are many of them.
+    """
+    zoom: int
+    precision: int
+    total: int
+    points: List[Location] = []
+    clusters: List[LocationCluster] = []
+
+class Tile(BaseModel):
+    """
+    Model representing the location and review counters of a geohash cell of the map.
+    
+    Attributes:
+        geohash (str): The geohash of the cell.
+        locations (int): The number of locations in the cell.
+        relations (int): The number of location-category relations of those locations.
+        never_reviewed (int): The number of relations that have never been reviewed.
+        stale (int): The number of relations last reviewed more than 30 days ago.
+    """
+    geohash: str
+    locations: int
+    relations: int
+    never_reviewed: int
+    stale: int
+
 class CategoryBase(BaseModel):
     """
     Base model for category data.
@@ -92,3 +152,149 @@ class LocationCategoryReviewed(LocationCategoryReviewedBase):
     last_reviewed: Optional[datetime] = None
 
     model_config = ConfigDict(from_attributes=True)  # Updated to use ConfigDict
+
+class RecommendationLease(LocationCategoryReviewed):
+    """
+    Model representing a location-category relationship leased to a reviewer.
+    
+    Attributes:
+        leased_by (Optional[str]): The reviewer holding the lease.
+        leased_until (Optional[datetime]): The expiry of the lease.
+    """
+    leased_by: Optional[str] = None
+    leased_until: Optional[datetime] = None
+
+class RecommendationClaim(BaseModel):
+    """
+    Model for claiming recommendations to review.
+    
+    Attributes:
+        reviewer (str): The reviewer claiming the recommendations.
+        limit (int): The maximum number of recommendations to claim.
+        lease_seconds (Optional[int]): The duration of the lease. Defaults to RECOMMENDATION_LEASE_SECONDS.
+    """
+    reviewer: str = Field(min_length=1, max_length=64)
+    limit: int = Field(10, ge=1, le=1000)
+    lease_seconds: Optional[int] = Field(None, ge=1)
+
+class LeaseUpdate(BaseModel):
+    """
+    Model for renewing or releasing the leases of a reviewer.
+    
+    Attributes:
+        reviewer (str): The reviewer holding the leases.
+        ids (List[int]): The IDs of the leased relationships.
+        lease_seconds (Optional[int]): The new duration of the lease, when renewing. Defaults to RECOMMENDATION_LEASE_SECONDS.
+    """
+    reviewer: str = Field(min_length=1, max_length=64)
+    ids: List[int]
+    lease_seconds: Optional[int] = Field(None, ge=1)
+
+class Review(BaseModel):
+    """
+    Model representing a review of a location-category relationship in the database.
+    
+    Attributes:
+        id (int): The unique identifier of the review.
+        relation_id (int): The ID of the reviewed relationship.
+        reviewed_at (datetime): The timestamp of the review.
+    """
+    id: int
+    relation_id: int
+    reviewed_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class BulkItemError(BaseModel):
+    """
+    Model describing an item of a bulk request that could not be processed.
+    
+    Attributes:
+        index (int): The position of the item in the request.
+        detail (str): The reason why the item was rejected.
+    """
+    index: int
+    detail: str
+
+class LocationBulkResult(BaseModel):
+    """
+    Model representing the outcome of a bulk location creation.
+    
+    Attributes:
+        created (List[Location]): The created locations, in request order; a merged item holds the location it matched.
+        merged (List[int]): The indexes of the items matched with an existing location instead of being created.
+        errors (List[BulkItemError]): The items that could not be created.
+    """
+    created: List[Location]
+    merged: List[int] = []
+    errors: List[BulkItemError] = []
+
+class CategoryBulkResult(BaseModel):
+    """
+    Model representing the outcome of a bulk category creation.
+    
+    Attributes:
+        created (List[Category]): The created categories, in request order.
+        errors (List[BulkItemError]): The items that could not be created.
+    """
+    created: List[Category]
+    errors: List[BulkItemError] = []
+
+class LocationCategoryReviewedBulkResult(BaseModel):
+    """
+    Model representing the outcome of a bulk relation creation.
+    
+    Attributes:
+        created (List[LocationCategoryReviewed]): The created relations, in request order.
+        errors (List[BulkItemError]): The items that could not be created.
+    """
+    created: List[LocationCategoryReviewed]
+    errors: List[BulkItemError] = []
+
+class BulkReviewItem(BaseModel):
+    """
+    Model for reviewing a location-category relationship as part of a bulk review.
+    
+    Attributes:
+        id (int): The ID of the relationship to review.
+        reviewed_at (Optional[datetime]): When the review was done, in UTC unless an offset is given. Defaults to
+            the time of the request; times in the future are taken as the time of the request.
+    """
+    id: int
+    reviewed_at: Optional[datetime] = None
+
+class BulkReviewResult(BaseModel):
+    """
+    Model representing the outcome of a bulk review.
+    
+    Attributes:
+        reviewed (List[LocationCategoryReviewed]): The reviewed relationships.
+        missing (List[int]): The requested IDs that do not exist.
+    """
+    reviewed: List[LocationCategoryReviewed]
+    missing: List[int] = []
+
+class ImportResult(BaseModel):
+    """
+    Model representing the progress and outcome of an import.
+    
+    Attributes:
+        processed (int): The number of records read in this run, including rejected ones.
+        next_offset (int): The offset to resume the import from.
+        created_locations (int): The number of locations created.
+        created_categories (int): The number of categories created.
+        created_relations (int): The number of location-category relations created.
+        merged_locations (int): The number of records matched with an existing location instead of creating one.
+        error_count (int): The number of rejected records.
+        errors (List[BulkItemError]): The first rejected records, indexed by their position in the file.
+        failure (Optional[str]): Why the import stopped before the end of the file, if it did.
+    """
+    processed: int = 0
+    next_offset: int = 0
+    created_locations: int = 0
+    created_categories: int = 0
+    created_relations: int = 0
+    merged_locations: int = 0
+    error_count: int = 0
+    errors: List[BulkItemError] = []
+    failure: Optional[str] = None
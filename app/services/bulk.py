@@ -0,0 +1,92 @@
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+def chunked(items: Sequence[T], size: int) -> Iterator[Tuple[int, Sequence[T]]]:
+    """
+    Splits a sequence into consecutive chunks.
+
+    Args:
+        items (Sequence[T]): The items to split.
+        size (int): The maximum size of each chunk.
+
+    Yields:
+        Tuple[int, Sequence[T]]: The index of the first item of the chunk and the chunk itself.
+    """
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+async def insert_returning(db: AsyncSession, model, rows: Iterable[dict]) -> List:
+    """
+    Inserts many rows with a single multi-row INSERT ... RETURNING statement.
+
+    The caller owns the transaction; nothing is committed here.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: The ORM model to insert into.
+        rows (Iterable[dict]): The column values of each row.
+
+    Returns:
+        List: The inserted ORM objects, in the same order as the rows.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    result = await db.scalars(insert(model).returning(model, sort_by_parameter_order=True), rows)
+    return result.all()
+
+async def execute_returning(db: AsyncSession, statement, schema) -> List:
+    """
+    Runs an INSERT, UPDATE or DELETE statement with RETURNING and maps the affected rows to a schema.
+
+    The rows are read straight from the statement, so no refresh or extra SELECT is needed.
+    The caller owns the transaction; nothing is committed here.
+
+    Args:
+        db (AsyncSession): The database session.
+        statement: The INSERT, UPDATE or DELETE statement, without a RETURNING clause.
+        schema: The Pydantic schema of the affected rows.
+
+    Returns:
+        List: The affected rows, as schema instances.
+    """
+    result = await db.execute(statement.returning(*statement.table.columns))
+    return [schema.model_validate(row) for row in result]
+
+def insert_on_conflict(db: AsyncSession, model, values: Union[dict, List[dict]], index_elements: List[str],
+                       update: Optional[List[str]] = None, increment: Optional[List[str]] = None):
+    """
+    Builds an INSERT ... ON CONFLICT statement for the dialect of the session.
+
+    Args:
+        db (AsyncSession): The database session.
+        model: The ORM model to insert into.
+        values (Union[dict, List[dict]]): The column values of the row, or of each row of a multi-row insert.
+            A multi-row insert must not hold the same conflicting key twice.
+        index_elements (List[str]): The columns of the unique constraint that may conflict.
+        update (Optional[List[str]]): The columns overwritten with the new values on conflict.
+        increment (Optional[List[str]]): The columns incremented by the new values on conflict, for counters.
+            Default is None for both, which leaves the existing row untouched.
+
+    Returns:
+        Insert: The statement.
+
+    Raises:
+        NotImplementedError: If the database is neither PostgreSQL nor SQLite.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(model.__table__).values(values)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(model.__table__).values(values)
+    else:
+        raise NotImplementedError(f"INSERT ... ON CONFLICT is not supported for {dialect}")
+    set_ = {column: statement.excluded[column] for column in update or []}
+    set_.update({column: model.__table__.c[column] + statement.excluded[column] for column in increment or []})
+    if set_:
+        return statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    return statement.on_conflict_do_nothing(index_elements=index_elements)
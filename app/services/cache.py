@@ -0,0 +1,426 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Type
+from pydantic import BaseModel
+from app.schemas import schemas
+from app.services.cache_backends import CacheBackend, CacheBackendError, MemoryBackend, backend_from_url
+from app.config.settings import CACHE_BACKEND_URL, CACHE_CHANNEL, CACHE_KEY_PREFIX, CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+class LRUCache:
+    """
+    In-process cache with least-recently-used eviction and a time to live per entry.
+
+    Attributes:
+        name (str): The name of the cache, used in the statistics.
+        maxsize (int): The maximum number of entries.
+        ttl (float): The number of seconds an entry stays valid.
+        hits (int): The number of lookups that found a valid entry.
+        misses (int): The number of lookups that found no valid entry.
+        evictions (int): The number of entries dropped to respect maxsize.
+    """
+
+    def __init__(self, name: str, maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Returns the cached value of a key and marks it as recently used.
+
+        Args:
+            key (Hashable): The key to look up.
+            default (Any): The value returned when the key is missing or expired. Default is MISSING.
+
+        Returns:
+            Any: The cached value, or default.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self._clock():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): The key to store.
+            value (Any): The value to store.
+        """
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """
+        Removes a key from the cache.
+
+        Args:
+            key (Hashable): The key to remove.
+        """
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache. The counters are kept.
+        """
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            Dict[str, Any]: The size, capacity, hits, misses, evictions and hit ratio of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+class SharedCache:
+    """
+    Entity cache of a worker in front of the shared backend.
+
+    Reads look up the in-process LRUCache first and then the backend, whose hits are copied into the
+    LRUCache; writes and deletes go to both. With the in-process backend this is just the LRUCache.
+    Entries are stored in the backend as the JSON of their schema.
+
+    Attributes:
+        name (str): The name of the cache, used in the keys and the statistics.
+        schema (Type[BaseModel]): The schema of the entries.
+        local (LRUCache): The in-process cache.
+        shared_hits (int): The number of lookups missed by the in-process cache and found in the backend.
+    """
+
+    def __init__(self, name: str, schema: Type[BaseModel], maxsize: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS):
+        self.name = name
+        self.schema = schema
+        self.local = LRUCache(name, maxsize=maxsize, ttl=ttl)
+        self.shared_hits = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{CACHE_KEY_PREFIX}{self.name}:{key}"
+
+    async def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """
+        Returns the cached value of a key.
+
+        Args:
+            key (Hashable): The key to look up.
+            default (Any): The value returned when the key is missing. Default is MISSING.
+
+        Returns:
+            Any: The cached value, or default.
+        """
+        return (await self.get_many([key])).get(key, default)
+
+    async def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """
+        Returns the cached values of many keys, reading the ones missing in this worker from the backend in one round trip.
+
+        Args:
+            keys (Iterable[Hashable]): The keys to look up.
+
+        Returns:
+            Dict[Hashable, Any]: The values found, by key.
+        """
+        values, missing = {}, []
+        for key in keys:
+            value = self.local.get(key)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing and backend.shared:
+            try:
+                raws = await backend.get_many([self._key(key) for key in missing])
+            except CacheBackendError:
+                logger.warning("Could not read the shared %s cache", self.name, exc_info=True)
+                return values
+            for key, raw in zip(missing, raws):
+                if raw is not None:
+                    value = self.schema.model_validate_json(raw)
+                    self.local.set(key, value)
+                    values[key] = value
+                    self.shared_hits += 1
+        return values
+
+    async def set(self, key: Hashable, value: BaseModel):
+        """
+        Stores a value in this worker and in the backend.
+
+        Args:
+            key (Hashable): The key to store.
+            value (BaseModel): The value to store.
+        """
+        await self.set_many({key: value})
+
+    async def set_many(self, values: Dict[Hashable, BaseModel]):
+        """
+        Stores many values in this worker and, in one round trip, in the backend.
+
+        Args:
+            values (Dict[Hashable, BaseModel]): The values by key.
+        """
+        for key, value in values.items():
+            self.local.set(key, value)
+        if values and backend.shared:
+            try:
+                await backend.set_many({self._key(key): value.model_dump_json().encode() for key, value in values.items()}, self.local.ttl)
+            except CacheBackendError:
+                logger.warning("Could not write the shared %s cache", self.name, exc_info=True)
+
+    async def delete(self, key: Hashable):
+        """
+        Removes a key from this worker and from the backend. Other workers are told by the caller, see invalidate_location.
+
+        Args:
+            key (Hashable): The key to remove.
+        """
+        self.local.delete(key)
+        if backend.shared:
+            try:
+                await backend.delete([self._key(key)])
+            except CacheBackendError:
+                logger.warning("Could not delete from the shared %s cache", self.name, exc_info=True)
+
+    def clear(self):
+        """
+        Removes every entry from this worker. The backend keeps its entries until they expire.
+        """
+        self.local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            Dict[str, Any]: The counters of the in-process cache, plus the hits of the backend.
+        """
+        return {**self.local.stats(), "shared_hits": self.shared_hits}
+
+locations = SharedCache("locations", schemas.Location)
+categories = SharedCache("categories", schemas.Category)
+category_lists = LRUCache("category_lists", maxsize=256)
+
+CACHES = [locations, categories, category_lists]
+
+# The backend shared by the workers, set by connect; the in-process one until then.
+backend: CacheBackend = MemoryBackend()
+
+# Identifies the messages of this worker, which it ignores when they come back from the channel.
+SENDER = uuid.uuid4().hex
+
+# Seconds close waits for the pending change messages to be sent.
+FLUSH_TIMEOUT_SECONDS = 2.0
+
+# Seconds between attempts to subscribe again to the change channel.
+RECONNECT_DELAY_SECONDS = 1.0
+
+_handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+_resync_handlers: List[Callable[[], Awaitable]] = []
+_outbox: Optional[asyncio.Queue] = None
+_tasks: List[asyncio.Task] = []
+
+async def connect(url: str = CACHE_BACKEND_URL):
+    """
+    Sets up the cache backend and, for a shared one, starts publishing and listening to the change messages.
+
+    Args:
+        url (str): The backend URL, see cache_backends.backend_from_url. Default is CACHE_BACKEND_URL.
+    """
+    global backend, _outbox
+    await close()
+    backend = backend_from_url(url)
+    if backend.shared:
+        _outbox = asyncio.Queue()
+        _tasks.extend([asyncio.create_task(_publisher(_outbox)), asyncio.create_task(_listener())])
+
+async def close():
+    """
+    Sends the pending change messages (waiting at most FLUSH_TIMEOUT_SECONDS), stops the change messages and
+    closes the backend, going back to the in-process one.
+    """
+    global backend, _outbox
+    if _outbox is not None:
+        try:
+            await asyncio.wait_for(_outbox.join(), FLUSH_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Dropped %d cache messages on close", _outbox.qsize())
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    _outbox = None
+    await backend.close()
+    backend = MemoryBackend()
+
+def subscribe(kind: str, handler: Callable[[dict], None]):
+    """
+    Registers a handler for the change messages of a kind sent by other workers.
+
+    Args:
+        kind (str): The kind of message, such as "location".
+        handler (Callable[[dict], None]): Called with each message.
+    """
+    _handlers[kind].append(handler)
+
+def on_resubscribe(handler: Callable[[], Awaitable]):
+    """
+    Registers a coroutine function called when the change channel is subscribed again after an outage.
+
+    The messages sent meanwhile are lost, so the state kept up to date by them (such as the recommendation
+    queue) must be reloaded from the database.
+
+    Args:
+        handler (Callable[[], Awaitable]): Called without arguments after each resubscription.
+    """
+    _resync_handlers.append(handler)
+
+def publish(kind: str, **payload):
+    """
+    Tells the other workers about a change. Messages are sent in order by a background task, so
+    writes never wait for them; with the in-process backend nothing is sent.
+
+    Args:
+        kind (str): The kind of message.
+        **payload: The JSON-serializable content of the message.
+    """
+    if _outbox is not None:
+        _outbox.put_nowait(json.dumps({"sender": SENDER, "kind": kind, **payload}, default=str))
+
+def dispatch(message: bytes):
+    """
+    Applies a change message received from the channel, ignoring the ones sent by this worker.
+
+    Args:
+        message (bytes): The JSON message.
+    """
+    try:
+        content = json.loads(message)
+    except ValueError:
+        logger.warning("Ignoring a malformed cache message: %r", message)
+        return
+    if content.get("sender") == SENDER:
+        return
+    for handler in _handlers.get(content.get("kind"), []):
+        try:
+            handler(content)
+        except Exception:
+            logger.exception("Could not apply the cache message %r", content)
+
+async def _publisher(outbox: asyncio.Queue):
+    while True:
+        message = await outbox.get()
+        try:
+            await backend.publish(CACHE_CHANNEL, message)
+        except Exception:
+            logger.warning("Could not publish a cache message; other workers will see the change when their entries expire", exc_info=True)
+        finally:
+            outbox.task_done()
+
+async def _resync():
+    for handler in _resync_handlers:
+        try:
+            await handler()
+        except Exception:
+            logger.exception("Could not reload %r after resubscribing to the cache channel", handler)
+
+async def _listener():
+    resubscribe = False
+
+    def subscribed():
+        # Messages sent while the subscription was down are lost, so nothing cached or kept up to date by
+        # messages before it can be trusted.
+        if resubscribe:
+            clear()
+            _tasks.append(asyncio.create_task(_resync()))
+
+    while True:
+        try:
+            await backend.listen(CACHE_CHANNEL, dispatch, subscribed)
+        except Exception:
+            logger.warning("Lost the cache channel, reconnecting", exc_info=True)
+        resubscribe = True
+        await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+async def invalidate_location(location_id: int):
+    """
+    Drops a location from the caches of every worker after it changes.
+
+    Args:
+        location_id (int): The ID of the location.
+    """
+    await locations.delete(location_id)
+    publish("location", id=location_id)
+
+async def invalidate_category(category_id: int = None):
+    """
+    Drops a category and every cached category list from the caches of every worker after a category changes.
+
+    Args:
+        category_id (int): The ID of the category, or None when only the lists are affected.
+    """
+    if category_id is not None:
+        await categories.delete(category_id)
+    category_lists.clear()
+    publish("category", id=category_id)
+
+def _drop_location(message: dict):
+    locations.local.delete(message["id"])
+
+def _drop_category(message: dict):
+    if message.get("id") is not None:
+        categories.local.delete(message["id"])
+    category_lists.clear()
+
+subscribe("location", _drop_location)
+subscribe("category", _drop_category)
+
+def clear():
+    """
+    Empties every cache of this worker.
+    """
+    for cache in CACHES:
+        cache.clear()
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the counters of every cache.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The statistics of each cache by name.
+    """
+    return {cache.name: cache.stats() for cache in CACHES}
@@ -0,0 +1,201 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+from redis import asyncio as redis
+from redis.exceptions import RedisError
+from app.config.settings import CACHE_REDIS_POOL_SIZE, CACHE_REDIS_TIMEOUT
+
+class CacheBackendError(Exception):
+    """
+    Raised when the shared cache cannot be reached or rejects a command. Callers treat it as a cache miss.
+    """
+
+class CacheBackend(ABC):
+    """
+    The store shared by the workers behind their in-process caches, and the channel they use to tell
+    each other about changes.
+
+    Attributes:
+        shared (bool): Whether entries and messages reach other workers.
+    """
+
+    shared = False
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """
+        Reads many entries.
+
+        Args:
+            keys (Sequence[str]): The keys.
+
+        Returns:
+            List[Optional[bytes]]: The value of each key, or None if it is missing.
+        """
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, bytes], ttl: float):
+        """
+        Stores many entries.
+
+        Args:
+            items (Dict[str, bytes]): The values by key.
+            ttl (float): The number of seconds the entries stay valid.
+        """
+
+    @abstractmethod
+    async def delete(self, keys: Sequence[str]):
+        """
+        Removes entries.
+
+        Args:
+            keys (Sequence[str]): The keys.
+        """
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        """
+        Sends a message to every worker listening on a channel.
+
+        Args:
+            channel (str): The channel.
+            message (str): The message.
+        """
+
+    @abstractmethod
+    async def listen(self, channel: str, handler: Callable[[bytes], None], subscribed: Optional[Callable[[], None]] = None):
+        """
+        Calls a handler with every message of a channel, until the connection fails or the task is cancelled.
+
+        Args:
+            channel (str): The channel.
+            handler (Callable[[bytes], None]): Called with each message.
+            subscribed (Optional[Callable[[], None]]): Called once the subscription is active.
+        """
+
+    async def close(self):
+        """
+        Closes the connections of the backend.
+        """
+
+class MemoryBackend(CacheBackend):
+    """
+    The in-process backend: entries live only in the LRU caches of each worker and changes are not
+    announced to other workers, which see them once their own entries expire.
+    """
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [None] * len(keys)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float):
+        pass
+
+    async def delete(self, keys: Sequence[str]):
+        pass
+
+    async def publish(self, channel: str, message: str):
+        pass
+
+    async def listen(self, channel: str, handler: Callable[[bytes], None], subscribed: Optional[Callable[[], None]] = None):
+        pass
+
+class RedisBackend(CacheBackend):
+    """
+    Backend on Redis, or any server speaking its protocol, through the asyncio client of redis-py.
+
+    Commands run on a pool of at most pool_size connections, waiting up to the timeout for a free one;
+    pub/sub uses a dedicated connection without a read timeout. redis-py drops the connections that
+    fail or return an unreadable reply, and checks pooled ones before reusing them, so a server restart
+    only fails the commands running at that moment. Errors and timeouts are raised as CacheBackendError,
+    so a cache outage only costs cache misses.
+
+    Attributes:
+        url (str): The URL of the server.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, pool_size: int = CACHE_REDIS_POOL_SIZE, timeout: float = CACHE_REDIS_TIMEOUT):
+        self.url = url
+        self._timeout = timeout
+        pool = redis.BlockingConnectionPool.from_url(url, max_connections=pool_size, timeout=timeout,
+                                                     socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._client = redis.Redis(connection_pool=pool)
+
+    async def _run(self, command: Awaitable):
+        try:
+            return await command
+        except RedisError as e:
+            raise CacheBackendError(f"The cache at {self.url} failed: {e!r}") from e
+
+    async def execute(self, *commands: tuple) -> list:
+        """
+        Runs commands in one round trip.
+
+        Args:
+            *commands (tuple): The commands, such as ("GET", "key").
+
+        Returns:
+            list: The reply of each command.
+        """
+        pipeline = self._client.pipeline(transaction=False)
+        for command in commands:
+            pipeline.execute_command(*command)
+        return await self._run(pipeline.execute())
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self._run(self._client.mget(keys))
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float):
+        if items:
+            await self.execute(*(("SET", key, value, "PX", max(1, int(ttl * 1000))) for key, value in items.items()))
+
+    async def delete(self, keys: Sequence[str]):
+        if keys:
+            await self._run(self._client.delete(*keys))
+
+    async def publish(self, channel: str, message: str):
+        await self._run(self._client.publish(channel, message))
+
+    async def listen(self, channel: str, handler: Callable[[bytes], None], subscribed: Optional[Callable[[], None]] = None):
+        # Waiting for the next message is not a timeout, so the subscription has a client of its own.
+        client = redis.Redis.from_url(self.url, socket_connect_timeout=self._timeout)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            async for message in pubsub.listen():
+                if message["type"] == "subscribe" and subscribed is not None:
+                    subscribed()
+                elif message["type"] == "message":
+                    handler(message["data"])
+        except RedisError as e:
+            raise CacheBackendError(f"Lost the subscription to the cache at {self.url}: {e!r}") from e
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+    async def close(self):
+        await self._client.aclose()
+
+def backend_from_url(url: str) -> CacheBackend:
+    """
+    Creates the backend of a CACHE_BACKEND_URL.
+
+    Args:
+        url (str): "memory://" (or empty) for the in-process backend, "redis://[user:password@]host[:port][/db]"
+            (or "rediss://" for TLS) for a shared one.
+
+    Returns:
+        CacheBackend: The backend.
+
+    Raises:
+        ValueError: If the scheme is not supported.
+    """
+    scheme = urlsplit(url).scheme if url else "memory"
+    if scheme == "memory":
+        return MemoryBackend()
+    if scheme in ("redis", "rediss"):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported cache backend: {url}")
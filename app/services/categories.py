@@ -1,75 +1,213 @@
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models import models
 from app.schemas import schemas
+from app.config.database import is_replica
+from app.services import bulk, cache, etags, pagination, serialization
+from app.services.category_search import index as search_index
+from app.config.settings import BULK_CHUNK_SIZE
+
+async def _fetch_category(db: AsyncSession, category_id: int):
+    result = await db.execute(select(models.Category).filter(models.Category.id == category_id))
+    return result.scalars().first()
 
 async def get_category(db: AsyncSession, category_id: int):
     """
-    Fetches a category by its ID.
+    Fetches a category by its ID, reading through the category cache.
 
     Args:
         db (AsyncSession): The database session.
         category_id (int): The ID of the category to fetch.
 
     Returns:
-        models.Category: The category object if found, otherwise None.
+        schemas.Category: The category if found, otherwise None.
     """
-    result = await db.execute(select(models.Category).filter(models.Category.id == category_id))
-    return result.scalars().first()
+    category = await cache.categories.get(category_id)
+    if category is not cache.MISSING:
+        return category
+    db_category = await _fetch_category(db, category_id)
+    if db_category is None:
+        return None
+    category = schemas.Category.model_validate(db_category)
+    if not is_replica(db):
+        await cache.categories.set(category_id, category)
+    return category
+
+async def get_categories_by_ids(db: AsyncSession, category_ids: Iterable[int]) -> Dict[int, schemas.Category]:
+    """
+    Fetches many categories by ID, reading through the category cache and loading the misses
+    with one WHERE id IN (...) per chunk instead of one query per category.
+
+    Args:
+        db (AsyncSession): The database session.
+        category_ids (Iterable[int]): The IDs of the categories to fetch.
+
+    Returns:
+        Dict[int, schemas.Category]: The categories found, by ID.
+    """
+    category_ids = list(dict.fromkeys(category_ids))
+    categories = await cache.categories.get_many(category_ids)
+    missing = [category_id for category_id in category_ids if category_id not in categories]
+    columns = serialization.categories.columns(models.Category)
+    for _, chunk in bulk.chunked(missing, BULK_CHUNK_SIZE):
+        result = await db.execute(select(*columns).filter(models.Category.id.in_(chunk)))
+        loaded = {row.id: schemas.Category.model_validate(row._asdict()) for row in result.all()}
+        if not is_replica(db):
+            await cache.categories.set_many(loaded)
+        categories.update(loaded)
+    return categories
 
 async def create_category(db: AsyncSession, category: schemas.CategoryCreate):
     """
-    Creates a new category.
+    Creates a new category with a single INSERT ... RETURNING.
 
     Args:
         db (AsyncSession): The database session.
         category (schemas.CategoryCreate): The category data to create.
 
     Returns:
-        models.Category: The newly created category object.
+        schemas.Category: The newly created category.
     """
-    db_category = models.Category(**category.model_dump())
-    db.add(db_category)
+    [created] = await bulk.execute_returning(db, insert(models.Category.__table__).values(**category.model_dump()), schemas.Category)
     await db.commit()
-    await db.refresh(db_category)
-    return db_category
+    search_index.upsert([created])
+    await cache.invalidate_category()
+    etags.bump("categories")
+    return created
+
+async def create_categories(db: AsyncSession, categories: List[schemas.CategoryCreate]):
+    """
+    Creates many categories, one multi-row INSERT and one transaction per chunk.
+
+    Names that already exist, or that are repeated inside the batch, are reported as errors
+    without aborting the rest of the batch.
+
+    Args:
+        db (AsyncSession): The database session.
+        categories (List[schemas.CategoryCreate]): The category data to create.
 
-async def get_categories(db: AsyncSession, skip: int = 0, limit: int = 100):
+    Returns:
+        Tuple[List[models.Category], List[Tuple[int, str]]]: The created category objects, and the index
+        and error detail of every category that could not be created.
     """
-    Fetches multiple categories with pagination.
+    created, errors = [], []
+    seen = set()
+    for start, chunk in bulk.chunked(categories, BULK_CHUNK_SIZE):
+        result = await db.execute(select(models.Category.name).filter(models.Category.name.in_({category.name for category in chunk})))
+        existing = set(result.scalars().all())
+        pending = []
+        for offset, category in enumerate(chunk):
+            if category.name in existing or category.name in seen:
+                errors.append((start + offset, "Category name must be unique"))
+                continue
+            seen.add(category.name)
+            pending.append((start + offset, category))
+        try:
+            created.extend(await bulk.insert_returning(db, models.Category, [category.model_dump() for _, category in pending]))
+            await db.commit()
+        except IntegrityError:
+            # A concurrent writer took some of the names; retry row by row to isolate them.
+            await db.rollback()
+            for index, category in pending:
+                try:
+                    async with db.begin_nested():
+                        created.extend(await bulk.insert_returning(db, models.Category, [category.model_dump()]))
+                except IntegrityError:
+                    errors.append((index, "Category name must be unique"))
+            await db.commit()
+    if created:
+        search_index.upsert(created)
+        await cache.invalidate_category()
+        etags.bump("categories")
+    errors.sort()
+    return created, errors
+
+async def get_categories(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Fetches multiple categories with pagination, as plain rows holding the fields of schemas.Category,
+    reading through the category list cache.
+
+    When a cursor is given the page starts right after the row it points to (keyset pagination),
+    so the cost of a page does not depend on its depth and skip is ignored.
 
     Args:
         db (AsyncSession): The database session.
         skip (int): The number of records to skip for pagination. Default is 0.
         limit (int): The maximum number of records to return. Default is 100.
+        cursor (Optional[str]): The cursor returned with the previous page. Default is None.
 
     Returns:
-        List[models.Category]: A list of category objects.
+        List[Row]: A list of category rows, ordered by ID.
+
+    Raises:
+        pagination.InvalidCursorError: If the cursor cannot be decoded.
+    """
+    key = (skip, limit, cursor)
+    categories = cache.category_lists.get(key)
+    if categories is not cache.MISSING:
+        return categories
+    query = select(*serialization.categories.columns(models.Category)).order_by(models.Category.id).limit(limit)
+    if cursor is not None:
+        after = pagination.decode_cursor(cursor, {"id": pagination.cursor_int})
+        query = query.filter(models.Category.id > after["id"])
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    categories = result.all()
+    if not is_replica(db):
+        cache.category_lists.set(key, categories)
+    return categories
+
+async def search_categories(db: AsyncSession, query: str, limit: int = 10):
     """
-    result = await db.execute(select(models.Category).offset(skip).limit(limit))
-    return result.scalars().all()
+    Searches categories by name for autocomplete, in the in-memory search index.
+
+    Until the index is loaded, categories are read from the database instead, matching only the names
+    that start with the query, case-insensitively.
+
+    Args:
+        db (AsyncSession): The database session.
+        query (str): The text typed so far.
+        limit (int): The maximum number of categories to return. Default is 10.
+
+    Returns:
+        List[Row]: The matching categories, best matches first, as rows holding the fields of schemas.Category.
+    """
+    if search_index.ready:
+        return search_index.search(query, limit)
+    pattern = query.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    result = await db.execute(select(*serialization.categories.columns(models.Category))
+                              .filter(func.lower(models.Category.name).like(pattern, escape="\\"))
+                              .order_by(func.lower(models.Category.name), models.Category.id).limit(limit))
+    return result.all()
 
 async def delete_category(db: AsyncSession, category_id: int):
     """
-    Deletes a category by its ID.
+    Deletes a category by its ID with a single DELETE ... RETURNING.
 
     Args:
         db (AsyncSession): The database session.
         category_id (int): The ID of the category to delete.
 
     Returns:
-        models.Category: The deleted category object if found and deleted, otherwise None.
+        schemas.Category: The deleted category if found and deleted, otherwise None.
     """
-    db_category = await get_category(db, category_id)
-    if not db_category:
-        return None
-    await db.delete(db_category)
+    table = models.Category.__table__
+    deleted = await bulk.execute_returning(db, delete(table).where(table.c.id == category_id), schemas.Category)
     await db.commit()
-    return db_category
+    if not deleted:
+        return None
+    search_index.remove(category_id)
+    await cache.invalidate_category(category_id)
+    etags.bump("categories")
+    return deleted[0]
 
 async def update_category(db: AsyncSession, category_id: int, category: schemas.CategoryCreate):
     """
-    Updates an existing category by its ID.
+    Updates an existing category by its ID with a single UPDATE ... RETURNING.
 
     Args:
         db (AsyncSession): The database session.
@@ -77,12 +215,14 @@ async def update_category(db: AsyncSession, category_id: int, category: schemas.
         category (schemas.CategoryCreate): The new category data.
 
     Returns:
-        models.Category: The updated category object if found and updated, otherwise None.
+        schemas.Category: The updated category if found and updated, otherwise None.
     """
-    db_category = await get_category(db, category_id)
-    if not db_category:
-        return None
-    db_category.name = category.name
+    table = models.Category.__table__
+    updated = await bulk.execute_returning(db, update(table).where(table.c.id == category_id).values(**category.model_dump()), schemas.Category)
     await db.commit()
-    await db.refresh(db_category)
-    return db_category
+    if not updated:
+        return None
+    search_index.upsert(updated)
+    await cache.invalidate_category(category_id)
+    etags.bump("categories")
+    return updated[0]
@@ -0,0 +1,281 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import database
+from app.models import models
+from app.services import cache
+from app.config.settings import CATEGORY_SEARCH_MIN_SIMILARITY
+
+# Queries shorter than this many characters only match by prefix.
+FUZZY_MIN_LENGTH = 3
+# Maximum number of names scored by a fuzzy match.
+FUZZY_MAX_CANDIDATES = 500
+WARM_BATCH_SIZE = 10000
+
+_WORD = re.compile(r"\w+")
+
+class Category(NamedTuple):
+    """
+    A category read from the index, with the fields of schemas.Category.
+    """
+    id: int
+    name: str
+    created_at: datetime
+
+def normalize(text: str) -> str:
+    """
+    Folds a name or query for matching: accents removed, case folded and whitespace collapsed.
+
+    Args:
+        text (str): The text, such as "Café  Bogotá".
+
+    Returns:
+        str: The folded text, such as "cafe bogota".
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """
+    Returns the trigrams of the words of a folded text, each word padded with two spaces before and one after
+    (as PostgreSQL's pg_trgm does), so that word starts weigh more than word ends.
+
+    Args:
+        text (str): The folded text.
+
+    Returns:
+        FrozenSet[str]: The trigrams.
+    """
+    grams = set()
+    for word in _WORD.findall(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+def _prefix_range(keys: List[Tuple[str, int]], prefix: str):
+    index = bisect_left(keys, (prefix,))
+    while index < len(keys) and keys[index][0].startswith(prefix):
+        yield keys[index][1]
+        index += 1
+
+class CategoryIndex:
+    """
+    In-memory search index over the category names, for autocomplete.
+
+    Names are matched case- and accent-insensitively, in three tiers: names starting with the query,
+    then names with a word starting with the query, then similar names (containing at least
+    CATEGORY_SEARCH_MIN_SIMILARITY of the query's trigrams, to tolerate typos). The first two tiers are binary searches on sorted
+    keys; the fuzzy tier only scans the postings of the query's rarest trigrams, one of which any name
+    similar enough must share, so a search costs well under a millisecond with tens of thousands of categories.
+
+    Like the recommendation queue, the index is loaded at startup, kept up to date by the category
+    services and told about the changes of the other workers through the shared cache backend.
+
+    Attributes:
+        ready (bool): Whether the index has been loaded from the database and can serve searches.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._categories: Dict[int, Category] = {}
+        self._names: List[Tuple[str, int]] = []
+        self._words: List[Tuple[str, int]] = []
+        self._trigrams: Dict[int, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+
+    def __len__(self):
+        return len(self._categories)
+
+    def clear(self):
+        """
+        Empties the index and marks it as not ready.
+        """
+        self.ready = False
+        self._categories = {}
+        self._names = []
+        self._words = []
+        self._trigrams = {}
+        self._postings = defaultdict(set)
+
+    @staticmethod
+    def _keys(category_id: int, name: str) -> Tuple[Tuple[str, int], List[Tuple[str, int]]]:
+        key = normalize(name)
+        # Every word after the first is indexed by the rest of the name from its start.
+        words = [(key[match.start():], category_id) for match in _WORD.finditer(key) if match.start() > 0]
+        return (key, category_id), words
+
+    def _add(self, category: Category, sort: bool = True):
+        self._categories[category.id] = category
+        name, words = self._keys(category.id, category.name)
+        grams = trigrams(name[0])
+        self._trigrams[category.id] = grams
+        for gram in grams:
+            self._postings[gram].add(category.id)
+        if sort:
+            insort(self._names, name)
+            for word in words:
+                insort(self._words, word)
+        else:
+            self._names.append(name)
+            self._words.extend(words)
+
+    def _discard(self, category_id: int) -> bool:
+        category = self._categories.pop(category_id, None)
+        if category is None:
+            return False
+        name, words = self._keys(category_id, category.name)
+        for keys, key in [(self._names, name)] + [(self._words, word) for word in words]:
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+        for gram in self._trigrams.pop(category_id):
+            postings = self._postings[gram]
+            postings.discard(category_id)
+            if not postings:
+                del self._postings[gram]
+        return True
+
+    async def warm(self, db: AsyncSession):
+        """
+        Loads every category from the database, replacing the current content of the index.
+
+        Args:
+            db (AsyncSession): The database session.
+        """
+        self.clear()
+        result = await db.stream(select(models.Category.id, models.Category.name, models.Category.created_at)
+                                 .execution_options(yield_per=WARM_BATCH_SIZE))
+        async for partition in result.partitions():
+            for category_id, name, created_at in partition:
+                self._add(Category(category_id, name, created_at), sort=False)
+        self._names.sort()
+        self._words.sort()
+        self.ready = True
+
+    def upsert(self, categories: Iterable):
+        """
+        Adds categories to the index or updates their names.
+
+        Args:
+            categories (Iterable): Objects with the id, name and created_at of each category.
+        """
+        changed = [Category(category.id, category.name, category.created_at) for category in categories]
+        changed = [category for category in changed if self._upsert(category)]
+        if changed:
+            cache.publish("category_index", op="upsert", categories=[list(category) for category in changed])
+
+    def _upsert(self, category: Category) -> bool:
+        if not self.ready or self._categories.get(category.id) == category:
+            return False
+        self._discard(category.id)
+        self._add(category)
+        return True
+
+    def remove(self, category_id: int):
+        """
+        Removes a category from the index.
+
+        Args:
+            category_id (int): The ID of the category.
+        """
+        if self.ready and self._discard(category_id):
+            cache.publish("category_index", op="remove", ids=[category_id])
+
+    def apply_message(self, message: dict):
+        """
+        Applies a change published by the index of another worker, without publishing it again.
+
+        Args:
+            message (dict): The message, with the operation ("upsert" or "remove") and its arguments.
+        """
+        if not self.ready:
+            return
+        if message["op"] == "upsert":
+            for category_id, name, created_at in message["categories"]:
+                self._upsert(Category(category_id, name, datetime.fromisoformat(created_at)))
+        elif message["op"] == "remove":
+            for category_id in message["ids"]:
+                self._discard(category_id)
+
+    def search(self, query: str, limit: int) -> List[Category]:
+        """
+        Returns the categories matching a query, best matches first.
+
+        Args:
+            query (str): The text typed so far.
+            limit (int): The maximum number of categories to return.
+
+        Returns:
+            List[Category]: The names starting with the query in alphabetical order, then the names with a word
+            starting with it, then the similar names by decreasing number of trigrams shared with the query.
+        """
+        key = normalize(query)
+        if not key or limit <= 0:
+            return []
+        found: Dict[int, None] = {}
+        for keys in (self._names, self._words):
+            for category_id in _prefix_range(keys, key):
+                if len(found) >= limit:
+                    break
+                found.setdefault(category_id)
+        if len(found) < limit and len(key) >= FUZZY_MIN_LENGTH:
+            for category_id in self._similar(key, limit - len(found), found):
+                found.setdefault(category_id)
+        return [self._categories[category_id] for category_id in found]
+
+    def _similar(self, key: str, limit: int, exclude: Dict[int, None]) -> List[int]:
+        grams = trigrams(key)
+        if not grams:
+            return []
+        # A similar name contains at least ceil(t * |grams|) of the query's trigrams, so it has one of the
+        # |grams| - ceil(t * |grams|) + 1 rarest ones: only their postings need to be scanned. Common trigrams
+        # (shared by names built on the same word) could still make every name a candidate, so at most
+        # FUZZY_MAX_CANDIDATES names are scored: a bounded cost, at the price of rare misses among names that
+        # only share common trigrams with the query.
+        needed = max(1, math.ceil(CATEGORY_SEARCH_MIN_SIMILARITY * len(grams)))
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)[:len(grams) - needed + 1]
+        candidates = set()
+        for posting in postings:
+            if len(candidates) + len(posting) > FUZZY_MAX_CANDIDATES:
+                candidates.update(islice((category_id for category_id in posting if category_id not in candidates),
+                                         FUZZY_MAX_CANDIDATES - len(candidates)))
+                break
+            candidates |= posting
+        scored = []
+        for category_id in candidates:
+            if category_id in exclude:
+                continue
+            name_grams = self._trigrams[category_id]
+            shared = len(grams & name_grams)
+            if shared >= needed:
+                # Ties between names containing as much of the query go to the one closest to it in length.
+                scored.append((-shared, len(name_grams) - shared, self._categories[category_id].name, category_id))
+        scored.sort()
+        return [category_id for *_, category_id in scored[:limit]]
+
+index = CategoryIndex()
+cache.subscribe("category_index", index.apply_message)
+
+async def _reload():
+    # Changes announced while this worker was not subscribed are lost: start again from the database.
+    if index.ready:
+        async with database.SessionLocal() as db:
+            await index.warm(db)
+
+cache.on_resubscribe(_reload)
+
+async def warm(db: AsyncSession):
+    """
+    Loads the category search index from the database.
+
+    Args:
+        db (AsyncSession): The database session.
+    """
+    await index.warm(db)
@@ -0,0 +1,271 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import Column, Integer, MetaData, Table, delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import models
+from app.services import bulk, cache, etags, geo, tiles
+from app.config.settings import BULK_CHUNK_SIZE
+
+# Maximum number of geohash cells read by one candidate query.
+CELLS_PER_QUERY = 256
+SCAN_BATCH_SIZE = 10000
+
+class DedupPlan(NamedTuple):
+    """
+    What to do with each point of a batch of new locations.
+
+    Attributes:
+        new (List[int]): The indexes of the points to insert.
+        existing (Dict[int, int]): For the points within the tolerance of a stored location, the ID of that location.
+        repeated (Dict[int, int]): For the points within the tolerance of an earlier new point of the batch, the index of that point.
+    """
+    new: List[int]
+    existing: Dict[int, int]
+    repeated: Dict[int, int]
+
+class LocationGrid:
+    """
+    In-memory spatial grid of locations, to find the one nearest to a point within a tolerance.
+
+    Locations are bucketed by their geohash cell at the precision whose 3x3 block around a point covers the
+    tolerance (see geo.precision_for_radius), so a lookup only measures the distance to the locations of
+    9 cells. That precision depends on the latitude, so each location is also bucketed at the precisions
+    next to its own, which are the ones a point within the tolerance may use.
+
+    Attributes:
+        tolerance_km (float): The distance under which two points are the same place.
+    """
+
+    def __init__(self, tolerance_m: float):
+        self.tolerance_km = tolerance_m / 1000
+        self._locations: Dict[int, Tuple[float, float, str]] = {}
+        self._cells: Dict[str, List[int]] = defaultdict(list)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, location_id: int) -> bool:
+        return location_id in self._locations
+
+    def _precision(self, latitude: float) -> int:
+        return max(1, geo.precision_for_radius(self.tolerance_km, latitude))
+
+    def cells(self, latitude: float, longitude: float) -> List[str]:
+        """
+        Returns the cells holding every location within the tolerance of a point.
+
+        Args:
+            latitude (float): The latitude of the point.
+            longitude (float): The longitude of the point.
+
+        Returns:
+            List[str]: The geohash cells of the 3x3 block around the point.
+        """
+        return geo.neighbors(geo.encode(latitude, longitude, self._precision(latitude)))
+
+    def add(self, location_id: int, latitude: float, longitude: float, geohash: Optional[str] = None):
+        """
+        Adds a location to the grid.
+
+        Args:
+            location_id (int): The ID of the location.
+            latitude (float): The latitude of the location.
+            longitude (float): The longitude of the location.
+            geohash (Optional[str]): The geohash of the location. Default is computed from the coordinates.
+        """
+        geohash = geohash or geo.encode(latitude, longitude)
+        self._locations[location_id] = (latitude, longitude, geohash)
+        precision = self._precision(latitude)
+        for cell_precision in range(max(1, precision - 1), min(geo.GEOHASH_PRECISION, precision + 1) + 1):
+            self._cells[geohash[:cell_precision]].append(location_id)
+
+    def geohash(self, location_id: int) -> str:
+        """
+        Returns the geohash of a location of the grid.
+        """
+        return self._locations[location_id][2]
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[int]:
+        """
+        Finds the location nearest to a point, if it is within the tolerance.
+
+        Args:
+            latitude (float): The latitude of the point.
+            longitude (float): The longitude of the point.
+
+        Returns:
+            Optional[int]: The ID of the location, or None if no location is within the tolerance.
+        """
+        candidates = [location_id for cell in self.cells(latitude, longitude) for location_id in self._cells.get(cell, ())]
+        if not candidates:
+            return None
+        distances = geo.haversine_km(latitude, longitude, [self._locations[location_id][0] for location_id in candidates],
+                                     [self._locations[location_id][1] for location_id in candidates])
+        distance, location_id = min(zip(distances, candidates))
+        return location_id if distance <= self.tolerance_km else None
+
+    async def load_near(self, db: AsyncSession, points: Iterable[Tuple[float, float]]):
+        """
+        Adds the stored locations that may be within the tolerance of the given points, reading them through
+        the geohash index with one query per CELLS_PER_QUERY cells.
+
+        Args:
+            db (AsyncSession): The database session.
+            points (Iterable[Tuple[float, float]]): The latitude and longitude of each point.
+        """
+        cells = list(dict.fromkeys(cell for latitude, longitude in points for cell in self.cells(latitude, longitude)))
+        for _, chunk in bulk.chunked(cells, CELLS_PER_QUERY):
+            result = await db.execute(select(models.Location.id, models.Location.latitude, models.Location.longitude, models.Location.geohash)
+                                      .filter(geo.cells_condition(models.Location.geohash, chunk)))
+            for location_id, latitude, longitude, geohash in result.all():
+                if location_id not in self._locations:
+                    self.add(location_id, latitude, longitude, geohash)
+
+    def plan(self, points: Sequence[Tuple[float, float]]) -> DedupPlan:
+        """
+        Decides which points of a batch are new places, matching the others with the locations of the grid
+        or with the earlier points of the batch.
+
+        Args:
+            points (Sequence[Tuple[float, float]]): The latitude and longitude of each point.
+
+        Returns:
+            DedupPlan: The points to insert and the matches of the others.
+        """
+        new, existing, repeated = [], {}, {}
+        for index, (latitude, longitude) in enumerate(points):
+            match = self.nearest(latitude, longitude)
+            if match is None:
+                new.append(index)
+                # New points get negative IDs in the grid, so later points of the batch can match them.
+                self.add(-index - 1, latitude, longitude)
+            elif match < 0:
+                repeated[index] = -match - 1
+            else:
+                existing[index] = match
+        return DedupPlan(new, existing, repeated)
+
+async def find_duplicate(db: AsyncSession, latitude: float, longitude: float, tolerance_m: float) -> Optional[int]:
+    """
+    Finds the stored location nearest to a point, if it is within a tolerance.
+
+    Args:
+        db (AsyncSession): The database session.
+        latitude (float): The latitude of the point.
+        longitude (float): The longitude of the point.
+        tolerance_m (float): The tolerance in metres.
+
+    Returns:
+        Optional[int]: The ID of the location, or None if there is none within the tolerance.
+    """
+    grid = LocationGrid(tolerance_m)
+    await grid.load_near(db, [(latitude, longitude)])
+    return grid.nearest(latitude, longitude)
+
+metadata = MetaData()
+
+# Scratch tables of a compaction, created and dropped inside its transaction.
+location_merges = Table(
+    "location_merges", metadata,
+    Column("duplicate_id", Integer, primary_key=True),
+    Column("keeper_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+relation_merges = Table(
+    "relation_merges", metadata,
+    Column("relation_id", Integer, primary_key=True),
+    Column("keep_id", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+async def _find_merges(db: AsyncSession, tolerance_m: float) -> List[Tuple[int, int]]:
+    # The locations are read by ID, so the oldest location of each group of duplicates is the one kept.
+    # Only the kept locations stay in the grid: about 100 bytes each.
+    grid = LocationGrid(tolerance_m)
+    merges = []
+    result = await db.stream(select(models.Location.id, models.Location.latitude, models.Location.longitude, models.Location.geohash)
+                             .order_by(models.Location.id).execution_options(yield_per=SCAN_BATCH_SIZE))
+    async for partition in result.partitions():
+        for location_id, latitude, longitude, geohash in partition:
+            keeper_id = grid.nearest(latitude, longitude)
+            if keeper_id is None:
+                grid.add(location_id, latitude, longitude, geohash)
+            else:
+                merges.append((location_id, keeper_id))
+    return merges
+
+async def compact_locations(db: AsyncSession, tolerance_m: float) -> Dict[str, int]:
+    """
+    Merges the stored locations that are within a tolerance of an older location, in one transaction.
+
+    Duplicates are found with an in-memory grid while the locations are read once in ID order. Everything
+    else is set-based SQL over scratch tables of the merges: the relations of a duplicate are re-pointed
+    to the kept location, or merged into the relation it already has with the same category (its reviews
+    are moved there and the latest review is kept), and the duplicates are deleted. The tiles are then
+    rebuilt, and the changes are published to the workers through the shared cache backend. With the
+    in-process backend nothing is published, so the workers running elsewhere must be restarted.
+
+    Args:
+        db (AsyncSession): The database session.
+        tolerance_m (float): The distance in metres under which two locations are the same place.
+
+    Returns:
+        Dict[str, int]: The number of merged locations, of relations merged into another one and of relations moved.
+    """
+    merges = await _find_merges(db, tolerance_m)
+    if not merges:
+        return {"merged_locations": 0, "merged_relations": 0, "moved_relations": 0}
+
+    relation = models.LocationCategoryReviewed.__table__
+    review = models.Review.__table__
+    location = models.Location.__table__
+    await db.run_sync(lambda session: metadata.create_all(session.connection()))
+    for _, chunk in bulk.chunked(merges, BULK_CHUNK_SIZE):
+        await db.execute(insert(location_merges), [{"duplicate_id": duplicate_id, "keeper_id": keeper_id} for duplicate_id, keeper_id in chunk])
+
+    # Where each relation of a kept or duplicate location ends up, and the relation kept for each (location, category).
+    touched = select(location_merges.c.duplicate_id).union(select(location_merges.c.keeper_id))
+    target = (select(relation.c.id, func.coalesce(location_merges.c.keeper_id, relation.c.location_id).label("location_id"), relation.c.category_id)
+              .outerjoin(location_merges, location_merges.c.duplicate_id == relation.c.location_id)
+              .filter(relation.c.location_id.in_(touched)).cte("target"))
+    kept = (select(target.c.location_id, target.c.category_id, func.min(target.c.id).label("keep_id"))
+            .group_by(target.c.location_id, target.c.category_id).subquery("kept"))
+    await db.execute(insert(relation_merges).from_select(
+        ["relation_id", "keep_id"],
+        select(target.c.id, kept.c.keep_id)
+        .join(kept, (kept.c.location_id == target.c.location_id) & (kept.c.category_id == target.c.category_id))
+        .filter(target.c.id != kept.c.keep_id)))
+
+    # The merged relations hand their reviews and their latest review date to the kept one, then go away.
+    merged_ids = select(relation_merges.c.relation_id)
+    keep_id = select(relation_merges.c.keep_id).filter(relation_merges.c.relation_id == review.c.relation_id).scalar_subquery()
+    await db.execute(update(review).where(review.c.relation_id.in_(merged_ids)).values(relation_id=keep_id))
+    merged = relation.alias("merged")
+    merged_into = select(relation_merges.c.relation_id).filter(relation_merges.c.keep_id == relation.c.id).correlate_except(relation_merges)
+    latest = (select(func.max(merged.c.last_reviewed)).filter((merged.c.id == relation.c.id) | merged.c.id.in_(merged_into))
+              .correlate_except(merged).scalar_subquery())
+    await db.execute(update(relation).where(relation.c.id.in_(select(relation_merges.c.keep_id))).values(last_reviewed=latest))
+    deleted_relations = (await db.execute(delete(relation).where(relation.c.id.in_(merged_ids)).returning(relation.c.id))).scalars().all()
+
+    # The other relations of the duplicates move to the kept locations, and the duplicates are deleted.
+    keeper_id = select(location_merges.c.keeper_id).filter(location_merges.c.duplicate_id == relation.c.location_id).scalar_subquery()
+    moved = await db.execute(update(relation).where(relation.c.location_id.in_(select(location_merges.c.duplicate_id)))
+                             .values(location_id=keeper_id).returning(relation.c.id))
+    moved_relations = moved.scalars().all()
+    await db.execute(delete(location).where(location.c.id.in_(select(location_merges.c.duplicate_id))))
+
+    result = await db.execute(select(relation.c.id, relation.c.location_id, relation.c.category_id, relation.c.last_reviewed)
+                              .filter(relation.c.location_id.in_(select(location_merges.c.keeper_id))))
+    changed_relations = [list(row) for row in result.all()]
+    await db.run_sync(lambda session: metadata.drop_all(session.connection()))
+    # The rebuild commits the merge together with the recomputed tiles.
+    await tiles.rebuild(db)
+
+    for duplicate_id, _ in merges:
+        await cache.invalidate_location(duplicate_id)
+    cache.publish("queue", op="remove", ids=deleted_relations)
+    cache.publish("queue", op="upsert", relations=changed_relations)
+    for table in ("locations", "relations"):
+        etags.bump(table)
+    return {"merged_locations": len(merges), "merged_relations": len(deleted_relations), "moved_relations": len(moved_relations)}
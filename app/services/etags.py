@@ -0,0 +1,96 @@
+import hashlib
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Optional
+from fastapi import Request, Response, status
+from app.services import cache
+from app.config.settings import CACHE_TTL_SECONDS
+
+# Tags from another process never match ours, since each process counts its own changes.
+_EPOCH = uuid.uuid4().hex[:8]
+_versions: Dict[str, int] = defaultdict(int)
+
+def bump(table: str):
+    """
+    Records a change in a table, invalidating every ETag computed for it by this worker and, through
+    the shared cache backend, by the other workers.
+
+    Args:
+        table (str): The changed table: "locations", "categories" or "relations".
+    """
+    _versions[table] += 1
+    cache.publish("table", table=table)
+
+def _bump_remote(message: dict):
+    _versions[message["table"]] += 1
+
+cache.subscribe("table", _bump_remote)
+
+def version(table: str) -> int:
+    """
+    Returns the number of changes recorded for a table by this process.
+
+    Args:
+        table (str): The table.
+
+    Returns:
+        int: The change counter of the table.
+    """
+    return _versions[table]
+
+def make_etag(table: str, *parts) -> str:
+    """
+    Computes the ETag of a response that depends on a table.
+
+    The tag combines the change counter of the table, the request parameters and a time window of
+    CACHE_TTL_SECONDS, which bounds how long a tag stays valid when other workers write to the table
+    without a shared cache backend to tell this one, the same bound the entity caches accept.
+
+    Args:
+        table (str): The table the response is read from.
+        *parts: The parameters that identify the response, such as an ID or the page.
+
+    Returns:
+        str: The weak ETag.
+    """
+    window = int(time.time() // CACHE_TTL_SECONDS) if CACHE_TTL_SECONDS > 0 else 0
+    key = hashlib.blake2b(repr(parts).encode(), digest_size=6).hexdigest()
+    return f'W/"{_EPOCH}-{table}-{_versions[table]}-{window}-{key}"'
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Tells whether an If-None-Match header matches an ETag, using weak comparison.
+
+    Args:
+        if_none_match (Optional[str]): The value of the If-None-Match header.
+        etag (str): The current ETag.
+
+    Returns:
+        bool: True if the client already has the current representation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+def not_modified(request: Request, response: Response, table: str, *parts) -> Optional[Response]:
+    """
+    Sets the ETag of a response and answers conditional requests before any query runs.
+
+    Args:
+        request (Request): The incoming request.
+        response (Response): The response whose headers are being built.
+        table (str): The table the response is read from.
+        *parts: The parameters that identify the response.
+
+    Returns:
+        Optional[Response]: A 304 Not Modified response if the client's copy is current, otherwise None.
+    """
+    etag = make_etag(table, request.url.path, *parts)
+    if matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+from app.config.settings import EXPORT_BATCH_SIZE
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = {
+    "locations": [models.Location.id, models.Location.latitude, models.Location.longitude, models.Location.created_at],
+    "categories": [models.Category.id, models.Category.name, models.Category.created_at],
+    "relations": [models.LocationCategoryReviewed.id, models.LocationCategoryReviewed.location_id,
+                  models.LocationCategoryReviewed.category_id, models.LocationCategoryReviewed.last_reviewed],
+}
+
+def _to_json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+async def stream_export(db: AsyncSession, table: str, format: str = "ndjson") -> AsyncIterator[bytes]:
+    """
+    Streams every row of a table as NDJSON or CSV.
+
+    Rows are read from a server-side cursor in batches of EXPORT_BATCH_SIZE and encoded one batch at a time,
+    so memory stays bounded regardless of the size of the table. The session is closed once the stream ends,
+    because the request dependency has already released it by the time the response body is sent.
+
+    Args:
+        db (AsyncSession): The database session.
+        table (str): The table to export, one of EXPORT_COLUMNS.
+        format (str): The output format, "ndjson" or "csv". Default is "ndjson".
+
+    Yields:
+        bytes: The encoded rows of each batch.
+    """
+    columns = EXPORT_COLUMNS[table]
+    names = [column.key for column in columns]
+    query = select(*columns).order_by(columns[0]).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    try:
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(names)
+            yield buffer.getvalue().encode()
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerows(partition)
+                chunk = buffer.getvalue()
+            else:
+                chunk = "".join(json.dumps(dict(zip(names, map(_to_json_value, row)))) + "\n" for row in partition)
+            yield chunk.encode()
+    finally:
+        await db.close()
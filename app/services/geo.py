@@ -0,0 +1,252 @@
+import math
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import and_, or_
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180.0
+
+# Precision stored on every location row (~4.8m x 4.8m cells).
+GEOHASH_PRECISION = 9
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_INDEX = {char: index for index, char in enumerate(_BASE32)}
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    """
+    Encodes a coordinate as a geohash.
+
+    Args:
+        latitude (float): The latitude of the point.
+        longitude (float): The longitude of the point.
+        precision (int): The number of characters of the geohash. Default is GEOHASH_PRECISION.
+
+    Returns:
+        str: The geohash of the cell containing the point.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+def cell_span(precision: int) -> Tuple[float, float]:
+    """
+    Returns the size in degrees of a geohash cell.
+
+    Args:
+        precision (int): The number of characters of the geohash.
+
+    Returns:
+        Tuple[float, float]: The latitude and longitude span of a cell, in degrees.
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+def decode_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Decodes a geohash into the bounding box of its cell.
+
+    Args:
+        geohash (str): The geohash to decode.
+
+    Returns:
+        Tuple[float, float, float, float]: min latitude, max latitude, min longitude and max longitude.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+def neighbors(geohash: str) -> List[str]:
+    """
+    Returns a geohash cell together with its (up to) eight surrounding cells.
+
+    Cells wrap around the antimeridian; rows beyond the poles are skipped.
+
+    Args:
+        geohash (str): The center cell.
+
+    Returns:
+        List[str]: The distinct cells of the 3x3 block around the center cell.
+    """
+    precision = len(geohash)
+    lat_min, lat_max, lon_min, lon_max = decode_bbox(geohash)
+    lat_span, lon_span = lat_max - lat_min, lon_max - lon_min
+    center_lat, center_lon = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    cells = []
+    for d_lat in (0, -1, 1):
+        lat = center_lat + d_lat * lat_span
+        if lat < -90.0 or lat > 90.0:
+            continue
+        for d_lon in (0, -1, 1):
+            lon = (center_lon + d_lon * lon_span + 180.0) % 360.0 - 180.0
+            cell = encode(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
+def covered_radius_km(precision: int, latitude: float) -> float:
+    """
+    Returns the distance from a point that is guaranteed to be covered by the 3x3 block of cells around it.
+
+    Args:
+        precision (int): The precision of the cells.
+        latitude (float): The latitude of the point.
+
+    Returns:
+        float: The covered radius in kilometers.
+    """
+    lat_span, lon_span = cell_span(precision)
+    # Use the latitude farthest from the equator inside the block, where cells are narrowest.
+    edge_latitude = min(90.0, abs(latitude) + 2 * lat_span)
+    width_km = lon_span * KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+    return min(lat_span * KM_PER_DEGREE, width_km)
+
+def precision_for_radius(radius_km: float, latitude: float) -> int:
+    """
+    Returns the finest precision whose 3x3 block around a point covers the given radius.
+
+    Args:
+        radius_km (float): The search radius in kilometers.
+        latitude (float): The latitude of the point.
+
+    Returns:
+        int: The precision to use, or 0 if no cell block covers the radius.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if covered_radius_km(precision, latitude) >= radius_km:
+            return precision
+    return 0
+
+def precision_for_zoom(zoom: int, cluster_pixels: int = 64) -> int:
+    """
+    Returns the geohash precision whose cells are about cluster_pixels wide on a web map at a zoom level.
+
+    Args:
+        zoom (int): The zoom level of the map (0 shows the whole world in one 256 pixel tile).
+        cluster_pixels (int): The desired width of a cluster cell on screen. Default is 64.
+
+    Returns:
+        int: The finest precision whose cells are at least that wide, between 1 and GEOHASH_PRECISION.
+    """
+    target_span = 360.0 / (1 << zoom) * cluster_pixels / 256
+    for precision in range(GEOHASH_PRECISION, 1, -1):
+        if cell_span(precision)[1] >= target_span:
+            return precision
+    return 1
+
+def bbox_cells(min_lat: float, max_lat: float, min_lon: float, max_lon: float, max_cells: int = 32) -> List[str]:
+    """
+    Returns the geohash cells covering a bounding box, at the finest precision that needs at most max_cells cells.
+
+    Args:
+        min_lat (float): The southern edge of the box.
+        max_lat (float): The northern edge of the box.
+        min_lon (float): The western edge of the box, lower than max_lon.
+        max_lon (float): The eastern edge of the box.
+        max_cells (int): The maximum number of cells. Default is 32, which covers the whole world at precision 1.
+
+    Returns:
+        List[str]: The covering cells.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_span, lon_span = cell_span(precision)
+        first_row, last_row = int((min_lat + 90.0) // lat_span), int(min(max_lat + 90.0, 180.0 - 1e-9) // lat_span)
+        first_col, last_col = int((min_lon + 180.0) // lon_span), int(min(max_lon + 180.0, 360.0 - 1e-9) // lon_span)
+        if (last_row - first_row + 1) * (last_col - first_col + 1) <= max_cells or precision == 1:
+            break
+    return [encode(-90.0 + (row + 0.5) * lat_span, -180.0 + (col + 0.5) * lon_span, precision)
+            for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+def prefix_range(prefix: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns the half-open string range containing every geohash that starts with a prefix.
+
+    Expressing prefix matches as ranges lets a plain btree index on the geohash column serve them.
+
+    Args:
+        prefix (str): The geohash prefix.
+
+    Returns:
+        Tuple[str, Optional[str]]: The inclusive lower bound and exclusive upper bound (None if unbounded).
+    """
+    chars = list(prefix)
+    while chars:
+        index = _BASE32_INDEX[chars[-1]]
+        if index + 1 < len(_BASE32):
+            chars[-1] = _BASE32[index + 1]
+            return prefix, "".join(chars)
+        chars.pop()
+    return prefix, None
+
+def cells_condition(column, cells: Sequence[str]):
+    """
+    Builds the SQL filter matching the geohashes inside any of the given cells, as ranges an index on the column can serve.
+
+    Args:
+        column: The geohash column.
+        cells (Sequence[str]): The geohash cells.
+
+    Returns:
+        ColumnElement: The filter.
+    """
+    conditions = []
+    for cell in cells:
+        lower, upper = prefix_range(cell)
+        conditions.append(column >= lower if upper is None else and_(column >= lower, column < upper))
+    return or_(*conditions)
+
+def haversine_km(latitude: float, longitude: float, latitudes: Sequence[float], longitudes: Sequence[float]) -> List[float]:
+    """
+    Computes the great-circle distance from one point to many points.
+
+    Args:
+        latitude (float): The latitude of the origin.
+        longitude (float): The longitude of the origin.
+        latitudes (Sequence[float]): The latitudes of the targets.
+        longitudes (Sequence[float]): The longitudes of the targets.
+
+    Returns:
+        List[float]: The distance in kilometers to each target, in the same order.
+    """
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+    diameter = 2 * EARTH_RADIUS_KM
+    distances = []
+    append = distances.append
+    for lat, lon in zip(latitudes, longitudes):
+        lat2 = radians(lat)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(lon) - lon1) / 2) ** 2
+        append(diameter * asin(sqrt(min(1.0, a))))
+    return distances
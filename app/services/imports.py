@@ -0,0 +1,328 @@
+import codecs
+import csv
+import json
+import logging
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+from app.schemas import schemas
+from app.services import bulk, cache, categories as crud_categories, category_search, dedup, etags, geo, tiles
+from app.services.recommendation_queue import queue
+from app.config.settings import BULK_CHUNK_SIZE, LOCATION_DEDUP_METERS
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of item errors kept in an import result; the rest are only counted.
+MAX_REPORTED_ERRORS = 1000
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Splits a stream of bytes into text lines without buffering the whole stream.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The raw chunks, such as a request body stream.
+
+    Yields:
+        str: Each line, without its line terminator. Empty lines are kept, since they may be part of a quoted CSV field.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+class _LineQueue:
+    """
+    The lines waiting to be parsed by a csv.reader. Unlike a generator it can run dry and be refilled, so
+    the reader can parse an async stream of lines one record at a time.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+async def iter_records(lines: AsyncIterator[str], format: str) -> AsyncIterator[dict]:
+    """
+    Parses lines of a CSV file (with a header row) or of an NDJSON file into records. Blank lines are skipped,
+    and CSV records may span several lines inside quoted fields.
+
+    Records that cannot be parsed are yielded as a record holding only an "_error" key, so they keep
+    their position in the file.
+
+    Args:
+        lines (AsyncIterator[str]): The lines of the file.
+        format (str): The format of the file, "csv" or "ndjson".
+
+    Yields:
+        dict: The fields of each record.
+    """
+    header = None
+    pending = _LineQueue()
+    reader = csv.reader(pending)
+    quotes = 0
+    async for line in lines:
+        if format == "csv":
+            pending.lines.append(line + "\n")
+            # A record only ends at a line break outside quotes. Quotes inside a field are doubled, so the
+            # number of quotes read since the start of the record is even exactly when no field is open.
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+            quotes = 0
+            try:
+                values = next(reader)
+            except csv.Error as e:
+                pending.lines.clear()
+                yield {"_error": f"Line {reader.line_num}: {e}"}
+                continue
+            if not values:
+                continue
+            if header is None:
+                header = [value.strip() for value in values]
+                continue
+            yield dict(zip(header, values))
+        elif line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else {"_error": "Invalid JSON object"}
+    if pending.lines:
+        yield {"_error": f"Line {reader.line_num + 1}: unterminated quoted field"}
+
+class CategoryResolver:
+    """
+    Resolves category names to IDs, creating the missing categories, with an in-memory cache.
+
+    Attributes:
+        ids (Dict[str, int]): The IDs of the names resolved so far.
+        created (int): The number of categories created by the resolver.
+        uncommitted (List[category_search.Category]): The categories created since the last call to committed().
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.created = 0
+        self.uncommitted: List[category_search.Category] = []
+
+    async def resolve(self, db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Resolves category names to IDs. Missing categories are created but not committed.
+
+        Args:
+            db (AsyncSession): The database session.
+            names (Iterable[str]): The names to resolve.
+
+        Returns:
+            Dict[str, int]: The ID of every requested name.
+        """
+        names = set(names)
+        missing = names - self.ids.keys()
+        if missing:
+            result = await db.execute(select(models.Category.name, models.Category.id).filter(models.Category.name.in_(missing)))
+            self.ids.update(result.tuples().all())
+            missing -= self.ids.keys()
+        if missing:
+            created = await bulk.insert_returning(db, models.Category, [{"name": name} for name in sorted(missing)])
+            self.ids.update((category.name, category.id) for category in created)
+            self.created += len(created)
+            self.uncommitted.extend(category_search.Category(category.id, category.name, category.created_at) for category in created)
+        return {name: self.ids[name] for name in names}
+
+    async def committed(self):
+        """
+        Announces the categories created since the last call, once their transaction is committed: drops the
+        cached category lists and adds the categories to the search index.
+        """
+        if not self.uncommitted:
+            return
+        await cache.invalidate_category()
+        etags.bump("categories")
+        category_search.index.upsert(self.uncommitted)
+        self.uncommitted = []
+
+def _category_names(record: dict) -> List[str]:
+    value = record.get("categories") or []
+    if isinstance(value, str):
+        value = value.split("|")
+    return [name.strip() for name in value if isinstance(name, str) and name.strip()]
+
+def _add_error(result: schemas.ImportResult, index: int, detail: str):
+    result.error_count += 1
+    if len(result.errors) < MAX_REPORTED_ERRORS:
+        result.errors.append(schemas.BulkItemError(index=index, detail=detail))
+
+async def _batch_failed(db: AsyncSession, result: schemas.ImportResult, batch: List[tuple]):
+    logger.exception("Could not write the import batch starting at record %d", batch[0][0])
+    await db.rollback()
+    result.failure = f"Records {batch[0][0]} to {batch[-1][0]} could not be written; resume from next_offset"
+
+async def _batches(records: AsyncIterator[dict], offset: int, batch_size: int):
+    index = 0
+    batch = []
+    async for record in records:
+        if index >= offset:
+            batch.append((index, record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        index += 1
+    if batch:
+        yield batch
+
+async def import_locations(db: AsyncSession, records: AsyncIterator[dict], offset: int = 0, batch_size: int = BULK_CHUNK_SIZE,
+                           on_progress: Optional[Callable[[schemas.ImportResult], None]] = None, dedup_meters: Optional[float] = None):
+    """
+    Imports locations, and optionally their categories, from a stream of records.
+
+    Each record holds a latitude, a longitude and optionally "categories": a list of names, or a "|"-separated
+    string in CSV files. Category names are resolved to IDs through a cached lookup, creating the missing ones.
+    Records are validated and written in batches, each batch in a single transaction with multi-row inserts,
+    so an interrupted import can be resumed from the last reported next_offset. A batch that cannot be written
+    is rolled back and stops the import, whose result then holds the failure.
+
+    When deduplication is enabled, a record within the tolerance of a stored location, or of an earlier record
+    of its batch, adds its categories to that location instead of creating a new one.
+
+    Args:
+        db (AsyncSession): The database session.
+        records (AsyncIterator[dict]): The records to import.
+        offset (int): The number of leading records to skip, as returned in next_offset. Default is 0.
+        batch_size (int): The number of records written per transaction. Default is BULK_CHUNK_SIZE.
+        on_progress (Optional[Callable[[schemas.ImportResult], None]]): Called after every committed batch.
+        dedup_meters (Optional[float]): The deduplication tolerance in metres, 0 to disable it. Default is LOCATION_DEDUP_METERS.
+
+    Returns:
+        schemas.ImportResult: The counters and item errors of the import.
+    """
+    dedup_meters = LOCATION_DEDUP_METERS if dedup_meters is None else dedup_meters
+    result = schemas.ImportResult(next_offset=offset)
+    resolver = CategoryResolver()
+    async for batch in _batches(records, offset, batch_size):
+        valid = []
+        for index, record in batch:
+            if "_error" in record:
+                _add_error(result, index, record["_error"])
+                continue
+            try:
+                location = schemas.LocationCreate.model_validate(record)
+            except ValidationError as e:
+                _add_error(result, index, str(e.errors()[0]["msg"]))
+                continue
+            valid.append((location, _category_names(record)))
+
+        created_categories = resolver.created
+        try:
+            category_ids = await resolver.resolve(db, (name for _, names in valid for name in names))
+            points = [(location.latitude, location.longitude) for location, _ in valid]
+            grid = dedup.LocationGrid(dedup_meters)
+            if dedup_meters > 0:
+                await grid.load_near(db, points)
+                plan = grid.plan(points)
+            else:
+                plan = dedup.DedupPlan(list(range(len(valid))), {}, {})
+            locations = await bulk.insert_returning(db, models.Location, [
+                {**valid[index][0].model_dump(), "geohash": geo.encode(*points[index])} for index in plan.new
+            ])
+            changes = tiles.TileChanges()
+            geohashes = {}
+            for db_location in locations:
+                geohashes[db_location.id] = db_location.geohash
+                changes.location(db_location.geohash)
+            inserted = dict(zip(plan.new, (db_location.id for db_location in locations)))
+            location_ids = [plan.existing[index] if index in plan.existing else inserted[plan.repeated.get(index, index)] for index in range(len(valid))]
+            geohashes.update((location_id, grid.geohash(location_id)) for location_id in plan.existing.values())
+
+            # Merged records only add the categories their location does not have yet.
+            linked = set()
+            if plan.existing:
+                relation = models.LocationCategoryReviewed
+                linked_result = await db.execute(select(relation.location_id, relation.category_id)
+                                                 .filter(relation.location_id.in_(set(plan.existing.values()))))
+                linked.update(linked_result.tuples())
+            pairs = [(location_id, category_ids[name]) for location_id, (_, names) in zip(location_ids, valid) for name in names]
+            pairs = [pair for pair in dict.fromkeys(pairs) if pair not in linked]
+            relations = await bulk.insert_returning(db, models.LocationCategoryReviewed, [
+                {"location_id": location_id, "category_id": category_id, "last_reviewed": None} for location_id, category_id in pairs
+            ])
+            for location_id, _ in pairs:
+                changes.relation(geohashes[location_id], None)
+            await changes.apply(db)
+            await db.commit()
+        except Exception:
+            # The batch is rolled back as a whole; the result reports the records committed so far.
+            await _batch_failed(db, result, batch)
+            return result
+        queue.upsert_many(relations)
+        etags.bump("locations")
+        etags.bump("relations")
+        await resolver.committed()
+
+        result.processed += len(batch)
+        result.next_offset = batch[-1][0] + 1
+        result.created_locations += len(locations)
+        result.merged_locations += len(plan.existing) + len(plan.repeated)
+        result.created_relations += len(relations)
+        result.created_categories += resolver.created - created_categories
+        if on_progress is not None:
+            on_progress(result)
+    return result
+
+async def import_categories(db: AsyncSession, records: AsyncIterator[dict], offset: int = 0, batch_size: int = BULK_CHUNK_SIZE,
+                            on_progress: Optional[Callable[[schemas.ImportResult], None]] = None):
+    """
+    Imports categories from a stream of records holding a "name". A batch that cannot be written stops the
+    import, whose result then holds the failure and the offset to resume from.
+
+    Args:
+        db (AsyncSession): The database session.
+        records (AsyncIterator[dict]): The records to import.
+        offset (int): The number of leading records to skip, as returned in next_offset. Default is 0.
+        batch_size (int): The number of records written per transaction. Default is BULK_CHUNK_SIZE.
+        on_progress (Optional[Callable[[schemas.ImportResult], None]]): Called after every committed batch.
+
+    Returns:
+        schemas.ImportResult: The counters and item errors of the import.
+    """
+    result = schemas.ImportResult(next_offset=offset)
+    async for batch in _batches(records, offset, batch_size):
+        valid, errors = [], []
+        for index, record in batch:
+            if "_error" in record:
+                errors.append((index, record["_error"]))
+                continue
+            try:
+                valid.append((index, schemas.CategoryCreate.model_validate(record)))
+            except ValidationError as e:
+                errors.append((index, str(e.errors()[0]["msg"])))
+
+        try:
+            created, create_errors = await crud_categories.create_categories(db, [category for _, category in valid])
+        except Exception:
+            await _batch_failed(db, result, batch)
+            return result
+        errors.extend((valid[position][0], detail) for position, detail in create_errors)
+        for index, detail in sorted(errors):
+            _add_error(result, index, detail)
+
+        result.processed += len(batch)
+        result.next_offset = batch[-1][0] + 1
+        result.created_categories += len(created)
+        if on_progress is not None:
+            on_progress(result)
+    return result
@@ -1,75 +1,206 @@
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import delete, func, insert, or_, and_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models import models
 from app.schemas import schemas
+from app.config.database import is_replica
+from app.services import bulk, cache, dedup, etags, geo, pagination, serialization, tiles
+from app.config.settings import BULK_CHUNK_SIZE, LOCATION_DEDUP_METERS, VIEWPORT_MAX_POINTS
+
+# Precision of the first cell block inspected by a k-nearest search (~1.2km x 0.6km cells).
+NEARBY_START_PRECISION = 6
+
+# Maximum number of geohash ranges used to read the locations of a viewport box through the index.
+VIEWPORT_MAX_CELLS = 32
+
+async def _fetch_location(db: AsyncSession, location_id: int):
+    result = await db.execute(select(models.Location).filter(models.Location.id == location_id))
+    return result.scalars().first()
 
 async def get_location(db: AsyncSession, location_id: int):
     """
-    Fetches a location by its ID.
+    Fetches a location by its ID, reading through the location cache.
 
     Args:
         db (AsyncSession): The database session.
         location_id (int): The ID of the location to fetch.
 
     Returns:
-        models.Location: The location object if found, otherwise None.
+        schemas.Location: The location if found, otherwise None.
     """
-    result = await db.execute(select(models.Location).filter(models.Location.id == location_id))
-    return result.scalars().first()
+    location = await cache.locations.get(location_id)
+    if location is not cache.MISSING:
+        return location
+    db_location = await _fetch_location(db, location_id)
+    if db_location is None:
+        return None
+    location = schemas.Location.model_validate(db_location)
+    if not is_replica(db):
+        await cache.locations.set(location_id, location)
+    return location
+
+async def get_locations_by_ids(db: AsyncSession, location_ids: Iterable[int]) -> Dict[int, schemas.Location]:
+    """
+    Fetches many locations by ID, reading through the location cache and loading the misses
+    with one WHERE id IN (...) per chunk instead of one query per location.
+
+    Args:
+        db (AsyncSession): The database session.
+        location_ids (Iterable[int]): The IDs of the locations to fetch.
+
+    Returns:
+        Dict[int, schemas.Location]: The locations found, by ID.
+    """
+    location_ids = list(dict.fromkeys(location_ids))
+    locations = await cache.locations.get_many(location_ids)
+    missing = [location_id for location_id in location_ids if location_id not in locations]
+    columns = serialization.locations.columns(models.Location)
+    for _, chunk in bulk.chunked(missing, BULK_CHUNK_SIZE):
+        result = await db.execute(select(*columns).filter(models.Location.id.in_(chunk)))
+        loaded = {row.id: schemas.Location.model_validate(row._asdict()) for row in result.all()}
+        if not is_replica(db):
+            await cache.locations.set_many(loaded)
+        locations.update(loaded)
+    return locations
     
-async def create_location(db: AsyncSession, location: schemas.LocationCreate):
+async def create_location(db: AsyncSession, location: schemas.LocationCreate, dedup_meters: Optional[float] = None):
     """
-    Creates a new location.
+    Creates a new location with a single INSERT ... RETURNING, and counts it in its tile.
+
+    When deduplication is enabled and a stored location is within the tolerance, that location is
+    returned instead and nothing is written.
 
     Args:
         db (AsyncSession): The database session.
         location (schemas.LocationCreate): The location data to create.
+        dedup_meters (Optional[float]): The deduplication tolerance in metres, 0 to disable it. Default is LOCATION_DEDUP_METERS.
 
     Returns:
-        models.Location: The newly created location object.
+        Tuple[schemas.Location, bool]: The new or matching location, and whether it was created.
     """
-    db_location = models.Location(**location.model_dump())
-    db.add(db_location)
+    dedup_meters = LOCATION_DEDUP_METERS if dedup_meters is None else dedup_meters
+    if dedup_meters > 0:
+        location_id = await dedup.find_duplicate(db, location.latitude, location.longitude, dedup_meters)
+        if location_id is not None:
+            return await get_location(db, location_id), False
+    values = {**location.model_dump(), "geohash": geo.encode(location.latitude, location.longitude)}
+    [created] = await bulk.execute_returning(db, insert(models.Location.__table__).values(**values), schemas.Location)
+    changes = tiles.TileChanges()
+    changes.location(values["geohash"])
+    await changes.apply(db)
     await db.commit()
-    await db.refresh(db_location)
-    return db_location
+    etags.bump("locations")
+    return created, True
 
-async def get_locations(db: AsyncSession, skip: int = 0, limit: int = 100):
+async def create_locations(db: AsyncSession, locations: List[schemas.LocationCreate], dedup_meters: Optional[float] = None):
     """
-    Fetches multiple locations with pagination.
+    Creates many locations, one multi-row INSERT and one transaction per chunk.
+
+    A chunk that fails is rolled back and reported item by item; the other chunks are still written.
+    When deduplication is enabled, the locations within the tolerance of a stored location, or of an
+    earlier location of the request, are answered with that location instead of being inserted.
+
+    Args:
+        db (AsyncSession): The database session.
+        locations (List[schemas.LocationCreate]): The location data to create.
+        dedup_meters (Optional[float]): The deduplication tolerance in metres, 0 to disable it. Default is LOCATION_DEDUP_METERS.
+
+    Returns:
+        Tuple[List, List[int], List[Tuple[int, str]]]: The new or matching location of every location that could be
+        written, the indexes of the ones matched with an existing location, and the index and error detail of every
+        location that could not be created.
+    """
+    dedup_meters = LOCATION_DEDUP_METERS if dedup_meters is None else dedup_meters
+    created, merged, errors = [], [], []
+    for start, chunk in bulk.chunked(locations, BULK_CHUNK_SIZE):
+        points = [(location.latitude, location.longitude) for location in chunk]
+        try:
+            if dedup_meters > 0:
+                grid = dedup.LocationGrid(dedup_meters)
+                await grid.load_near(db, points)
+                plan = grid.plan(points)
+            else:
+                plan = dedup.DedupPlan(list(range(len(chunk))), {}, {})
+            existing = await get_locations_by_ids(db, plan.existing.values()) if plan.existing else {}
+            rows = [{**chunk[index].model_dump(), "geohash": geo.encode(*points[index])} for index in plan.new]
+            inserted = dict(zip(plan.new, await bulk.insert_returning(db, models.Location, rows)))
+            changes = tiles.TileChanges()
+            for row in rows:
+                changes.location(row["geohash"])
+            await changes.apply(db)
+            await db.commit()
+            if rows:
+                etags.bump("locations")
+            for offset in range(len(chunk)):
+                if offset in plan.existing:
+                    created.append(existing[plan.existing[offset]])
+                else:
+                    created.append(inserted[plan.repeated.get(offset, offset)])
+                if offset in plan.existing or offset in plan.repeated:
+                    merged.append(start + offset)
+        except Exception as e:
+            await db.rollback()
+            errors.extend((start + offset, f"Location could not be created: {e}") for offset in range(len(chunk)))
+    return created, merged, errors
+
+async def get_locations(db: AsyncSession, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Fetches multiple locations with pagination, as plain rows holding the fields of schemas.Location.
+
+    When a cursor is given the page starts right after the row it points to (keyset pagination),
+    so the cost of a page does not depend on its depth and skip is ignored.
 
     Args:
         db (AsyncSession): The database session.
         skip (int): The number of records to skip for pagination. Default is 0.
         limit (int): The maximum number of records to return. Default is 100.
+        cursor (Optional[str]): The cursor returned with the previous page. Default is None.
 
     Returns:
-        List[models.Location]: A list of location objects.
+        List[Row]: A list of location rows, ordered by ID.
+
+    Raises:
+        pagination.InvalidCursorError: If the cursor cannot be decoded.
     """
-    result = await db.execute(select(models.Location).offset(skip).limit(limit))
-    return result.scalars().all()
+    query = select(*serialization.locations.columns(models.Location)).order_by(models.Location.id).limit(limit)
+    if cursor is not None:
+        after = pagination.decode_cursor(cursor, {"id": pagination.cursor_int})
+        query = query.filter(models.Location.id > after["id"])
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return result.all()
 
 async def delete_location(db: AsyncSession, location_id: int):
     """
-    Deletes a location by its ID.
+    Deletes a location by its ID with a single DELETE ... RETURNING, and removes it from its tile.
 
     Args:
         db (AsyncSession): The database session.
         location_id (int): The ID of the location to delete.
 
     Returns:
-        models.Location: The deleted location object if found and deleted, otherwise None.
+        schemas.Location: The deleted location if found and deleted, otherwise None.
     """
-    db_location = await get_location(db, location_id)
-    if not db_location:
+    table = models.Location.__table__
+    deleted = await bulk.execute_returning(db, delete(table).where(table.c.id == location_id), schemas.Location)
+    if not deleted:
+        await db.rollback()
         return None
-    await db.delete(db_location)
+    changes = tiles.TileChanges()
+    changes.location(geo.encode(deleted[0].latitude, deleted[0].longitude), -1)
+    await changes.apply(db)
     await db.commit()
-    return db_location
+    await cache.invalidate_location(location_id)
+    etags.bump("locations")
+    return deleted[0]
 
 async def update_location(db: AsyncSession, location_id: int, location: schemas.LocationCreate):
     """
-    Updates an existing location by its ID.
+    Updates an existing location by its ID with a single UPDATE ... RETURNING.
+
+    When the location moves to another tile, it is moved there together with its relations.
 
     Args:
         db (AsyncSession): The database session.
@@ -77,13 +208,164 @@ async def update_location(db: AsyncSession, location_id: int, location: schemas.
         location (schemas.LocationCreate): The new location data.
 
     Returns:
-        models.Location: The updated location object if found and updated, otherwise None.
+        schemas.Location: The updated location if found and updated, otherwise None.
     """
-    db_location = await get_location(db, location_id)
-    if not db_location:
+    table = models.Location.__table__
+    values = {**location.model_dump(), "geohash": geo.encode(location.latitude, location.longitude)}
+    previous = (await db.execute(select(models.Location.geohash).filter(models.Location.id == location_id))).scalar_one_or_none()
+    updated = await bulk.execute_returning(db, update(table).where(table.c.id == location_id).values(**values), schemas.Location)
+    if not updated:
+        await db.rollback()
         return None
-    db_location.latitude = location.latitude
-    db_location.longitude = location.longitude
+    if tiles.tile_of(previous) != tiles.tile_of(values["geohash"]):
+        result = await db.execute(select(models.LocationCategoryReviewed.last_reviewed)
+                                  .filter(models.LocationCategoryReviewed.location_id == location_id))
+        changes = tiles.TileChanges()
+        changes.location(previous, -1)
+        changes.location(values["geohash"])
+        for last_reviewed in result.scalars().all():
+            changes.relation(previous, last_reviewed, -1)
+            changes.relation(values["geohash"], last_reviewed)
+        await changes.apply(db)
     await db.commit()
-    await db.refresh(db_location)
-    return db_location
+    await cache.invalidate_location(location_id)
+    etags.bump("locations")
+    return updated[0]
+
+async def _get_cell_candidates(db: AsyncSession, cells: Optional[list]):
+    """
+    Fetches the id and coordinates of the locations inside the given geohash cells.
+
+    Args:
+        db (AsyncSession): The database session.
+        cells (Optional[list]): The geohash cells to search, or None to search every location.
+
+    Returns:
+        List[Row]: The (id, latitude, longitude) rows of the candidate locations.
+    """
+    query = select(models.Location.id, models.Location.latitude, models.Location.longitude)
+    if cells is not None:
+        query = query.filter(geo.cells_condition(models.Location.geohash, cells))
+    result = await db.execute(query)
+    return result.all()
+
+def _viewport_condition(min_latitude: float, max_latitude: float, min_longitude: float, max_longitude: float):
+    """
+    Builds the filter matching the locations inside a viewport box.
+
+    A viewport crossing the antimeridian (min_longitude greater than max_longitude) is split in two boxes.
+    Each box is read through the geohash ranges covering it and then trimmed to its exact bounds.
+
+    Args:
+        min_latitude (float): The southern edge of the viewport.
+        max_latitude (float): The northern edge of the viewport.
+        min_longitude (float): The western edge of the viewport.
+        max_longitude (float): The eastern edge of the viewport.
+
+    Returns:
+        ColumnElement: The filter.
+    """
+    boxes = [(min_longitude, max_longitude)] if min_longitude <= max_longitude else [(min_longitude, 180.0), (-180.0, max_longitude)]
+    conditions = []
+    for west, east in boxes:
+        cells = geo.bbox_cells(min_latitude, max_latitude, west, east, VIEWPORT_MAX_CELLS)
+        conditions.append(and_(geo.cells_condition(models.Location.geohash, cells),
+                               models.Location.latitude.between(min_latitude, max_latitude),
+                               models.Location.longitude.between(west, east)))
+    return or_(*conditions)
+
+async def get_viewport(db: AsyncSession, min_latitude: float, max_latitude: float, min_longitude: float, max_longitude: float,
+                       zoom: int, category_id: Optional[int] = None, by_category: bool = False,
+                       max_points: int = VIEWPORT_MAX_POINTS):
+    """
+    Fetches the locations visible in a map viewport, as points when there are few of them and as clusters otherwise.
+
+    The visible locations are first counted up to max_points + 1. If they fit, they are returned as points;
+    otherwise they are grouped by the geohash cell matching the zoom level (cells about 64 pixels wide on screen)
+    and each cell is returned with its count and centroid, so the size of the response depends on the screen,
+    not on the number of locations.
+
+    Args:
+        db (AsyncSession): The database session.
+        min_latitude (float): The southern edge of the viewport.
+        max_latitude (float): The northern edge of the viewport.
+        min_longitude (float): The western edge of the viewport; greater than max_longitude if it crosses the antimeridian.
+        max_longitude (float): The eastern edge of the viewport.
+        zoom (int): The zoom level of the map.
+        category_id (Optional[int]): Only include the locations related to this category. Default is None.
+        by_category (bool): Split the clusters by category, counting relations instead of locations. Default is False.
+        max_points (int): The maximum number of locations returned as points. Default is VIEWPORT_MAX_POINTS.
+
+    Returns:
+        schemas.Viewport: The points or the clusters of the viewport.
+    """
+    precision = geo.precision_for_zoom(zoom)
+    condition = _viewport_condition(min_latitude, max_latitude, min_longitude, max_longitude)
+    relation = models.LocationCategoryReviewed
+    if category_id is not None:
+        condition = and_(condition, models.Location.id.in_(select(relation.location_id).filter(relation.category_id == category_id)))
+
+    visible = select(models.Location.id).filter(condition).limit(max_points + 1).subquery()
+    count = (await db.execute(select(func.count()).select_from(visible))).scalar_one()
+    if count <= max_points:
+        result = await db.execute(select(*serialization.locations.columns(models.Location)).filter(condition).order_by(models.Location.id))
+        points = [schemas.Location.model_validate(row) for row in result.all()]
+        return schemas.Viewport(zoom=zoom, precision=precision, total=len(points), points=points)
+
+    cell = func.substr(models.Location.geohash, 1, precision)
+    query = select(cell.label("geohash"), func.count().label("count"),
+                   func.avg(models.Location.latitude).label("latitude"),
+                   func.avg(models.Location.longitude).label("longitude")).filter(condition).group_by(cell).order_by(cell)
+    if by_category:
+        query = query.add_columns(relation.category_id).join(relation, relation.location_id == models.Location.id)
+        if category_id is not None:
+            query = query.filter(relation.category_id == category_id)
+        query = query.group_by(relation.category_id).order_by(relation.category_id)
+    result = await db.execute(query)
+    clusters = [schemas.LocationCluster.model_validate(row._asdict()) for row in result.all()]
+    return schemas.Viewport(zoom=zoom, precision=precision, total=sum(cluster.count for cluster in clusters), clusters=clusters)
+
+async def get_nearby_locations(db: AsyncSession, latitude: float, longitude: float, k: int = 10, radius_km: Optional[float] = None):
+    """
+    Fetches the k locations nearest to a point, optionally restricted to a radius.
+
+    Candidates are read through the geohash index on the locations table, using the 3x3 block of cells
+    around the point, and refined in-process with the haversine distance. Without a radius the search
+    starts with small cells and widens until the k nearest locations are known to be inside the block.
+
+    Args:
+        db (AsyncSession): The database session.
+        latitude (float): The latitude of the point.
+        longitude (float): The longitude of the point.
+        k (int): The maximum number of locations to return. Default is 10.
+        radius_km (Optional[float]): The maximum distance in kilometers. Default is None (no limit).
+
+    Returns:
+        List[Tuple[models.Location, float]]: The locations and their distance in kilometers, nearest first.
+    """
+    if radius_km is not None:
+        precision = geo.precision_for_radius(radius_km, latitude)
+        levels = [(precision, radius_km)]
+    else:
+        levels = [(precision, geo.covered_radius_km(precision, latitude))
+                  for precision in range(NEARBY_START_PRECISION, 0, -1)]
+        levels.append((0, float("inf")))
+
+    nearest = []
+    for precision, covered_km in levels:
+        cells = geo.neighbors(geo.encode(latitude, longitude, precision)) if precision else None
+        candidates = await _get_cell_candidates(db, cells)
+        distances = geo.haversine_km(latitude, longitude,
+                                     [row.latitude for row in candidates],
+                                     [row.longitude for row in candidates])
+        nearest = sorted((distance, row.id) for distance, row in zip(distances, candidates) if distance <= covered_km)
+        if len(nearest) >= k:
+            # Every location closer than the covered radius is inside the block, so these are the k nearest.
+            break
+    nearest = nearest[:k]
+    if not nearest:
+        return []
+
+    result = await db.execute(select(models.Location).filter(models.Location.id.in_([location_id for _, location_id in nearest])))
+    locations = {location.id: location for location in result.scalars().all()}
+    return [(locations[location_id], distance) for distance, location_id in nearest if location_id in locations]
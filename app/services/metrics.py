@@ -0,0 +1,218 @@
+import bisect
+from typing import Dict, List, Sequence
+from app.services import cache, singleflight
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonic counter, optionally split by labels.
+
+    Attributes:
+        name (str): The metric name.
+        help (str): The description of the metric.
+        labels (Tuple[str, ...]): The label names.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[tuple, float] = {} if self.labels else {(): 0}
+
+    def inc(self, *labels, amount: float = 1):
+        """
+        Increments the counter of a label combination.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            amount (float): The increment. Default is 1.
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}" for labels, value in self._values.items()]
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, optionally split by labels.
+    """
+    type = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        """
+        Decrements the gauge of a label combination.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            amount (float): The decrement. Default is 1.
+        """
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value: float):
+        """
+        Sets the gauge of a label combination.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            value (float): The new value.
+        """
+        self._values[labels] = value
+
+class Histogram(Counter):
+    """
+    Distribution of observed values in cumulative buckets, optionally split by labels.
+
+    Attributes:
+        buckets (Tuple[float, ...]): The upper bounds of the buckets, in ascending order.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        """
+        Records an observation.
+
+        Args:
+            *labels: The label values, in the order of the label names.
+            value (float): The observed value.
+        """
+        series = self._series.get(labels)
+        if series is None:
+            # One counter per bucket plus +Inf, then the sum of the observations.
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, observations in zip(self.buckets + (float("inf"),), series):
+                cumulative += observations
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(float(series[-1]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+http_request_duration = Histogram("http_request_duration_seconds", "Time until the response headers are sent, by route.", ["method", "route"])
+http_responses = Counter("http_responses_total", "Responses sent, by route and status code.", ["method", "route", "status"])
+http_requests_in_progress = Gauge("http_requests_in_progress", "Requests being served.")
+http_request_db_queries = Histogram("http_request_db_queries", "Database queries run by a request, by route.", ["method", "route"], QUERY_COUNT_BUCKETS)
+http_request_db_duration = Histogram("http_request_db_duration_seconds", "Time spent in database queries by a request, by route.", ["method", "route"])
+db_queries = Counter("db_queries_total", "Database queries run.")
+db_query_duration = Histogram("db_query_duration_seconds", "Duration of each database query.")
+
+METRICS = [http_request_duration, http_responses, http_requests_in_progress, http_request_db_queries, http_request_db_duration,
+           db_queries, db_query_duration]
+
+_pools: Dict[str, object] = {}
+
+def register_pool(name: str, engine):
+    """
+    Exports the connection pool gauges of an engine.
+
+    Args:
+        name (str): The label of the pool, such as "primary" or "replica".
+        engine: The engine, sync or async.
+    """
+    _pools[name] = engine.pool
+
+def route_of(request) -> str:
+    """
+    Returns the path template of the route that served a request, to keep the label cardinality bounded.
+
+    Args:
+        request (Request): The served request.
+
+    Returns:
+        str: The path template, such as "/api/locations/{location_id}", or "unmatched".
+    """
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    routes = getattr(request.app, "_metrics_routes", None)
+    if routes is None:
+        routes = request.app._metrics_routes = {route.endpoint: route.path for route in request.app.routes if hasattr(route, "endpoint")}
+    return routes.get(endpoint, "unmatched")
+
+def _pool_samples() -> List[str]:
+    lines = []
+    gauges = [("db_pool_size", "Connections kept open by the pool.", lambda pool: pool.size()),
+              ("db_pool_checked_out", "Connections in use.", lambda pool: pool.checkedout()),
+              ("db_pool_overflow", "Connections open beyond the pool size.", lambda pool: max(0, pool.overflow()))]
+    for name, help, read in gauges:
+        values = []
+        for pool_name, pool in _pools.items():
+            try:
+                values.append(f'{name}{{pool="{_escape(pool_name)}"}} {read(pool)}')
+            except AttributeError:
+                # Pools such as NullPool or StaticPool do not keep these counters.
+                continue
+        if values:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", *values]
+    return lines
+
+def _cache_samples() -> List[str]:
+    lines = []
+    for name, help, key, kind in [("cache_hits_total", "Cache lookups that found a valid entry.", "hits", "counter"),
+                                  ("cache_misses_total", "Cache lookups that found no valid entry.", "misses", "counter"),
+                                  ("cache_evictions_total", "Cache entries dropped to respect the size limit.", "evictions", "counter"),
+                                  ("cache_entries", "Entries stored in the cache.", "size", "gauge")]:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{cache_name}"}} {stats[key]}' for cache_name, stats in cache.stats().items()]
+    return lines
+
+def _singleflight_samples() -> List[str]:
+    name = "coalesced_calls_total"
+    lines = [f"# HELP {name} Coalesced reads by outcome: run by a leader, shared with a running call, or reused within the window.",
+             f"# TYPE {name} counter"]
+    for group, stats in singleflight.stats().items():
+        lines += [f'{name}{{group="{group}",outcome="{outcome}"}} {stats[key]}'
+                  for outcome, key in [("run", "leaders"), ("shared", "shared"), ("reused", "hits")]]
+    return lines
+
+def render() -> str:
+    """
+    Renders every metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The exposition.
+    """
+    lines = []
+    for metric in METRICS:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.type}", *metric.samples()]
+    lines += _pool_samples()
+    lines += _cache_samples()
+    lines += _singleflight_samples()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Maximum number of IDs accepted by the ?ids= list endpoints.
+MAX_IDS = 1000
+
+class InvalidCursorError(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded.
+    """
+
+def encode_cursor(values: dict) -> str:
+    """
+    Encodes the keyset of the last row of a page as an opaque cursor.
+
+    Args:
+        values (dict): The key values of the last row returned.
+
+    Returns:
+        str: The URL-safe cursor.
+    """
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def cursor_int(value: Any) -> int:
+    """
+    Checks a cursor value that must be an integer, such as an ID.
+
+    Args:
+        value (Any): The decoded value.
+
+    Returns:
+        int: The value.
+
+    Raises:
+        TypeError: If the value is not an integer.
+    """
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError("Expected an integer")
+    return value
+
+def cursor_datetime(value: Any) -> Optional[datetime]:
+    """
+    Parses a cursor value that must be an ISO timestamp or null.
+
+    Args:
+        value (Any): The decoded value.
+
+    Returns:
+        Optional[datetime]: The timestamp, or None.
+
+    Raises:
+        TypeError, ValueError: If the value is not an ISO timestamp or null.
+    """
+    return None if value is None else datetime.fromisoformat(value)
+
+def decode_cursor(cursor: str, fields: Dict[str, Callable[[Any], Any]]) -> dict:
+    """
+    Decodes an opaque cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): The cursor received from the client.
+        fields (Dict[str, Callable[[Any], Any]]): The keys the cursor must contain, with the function that checks
+            and converts the value of each, such as cursor_int.
+
+    Returns:
+        dict: The converted key values of the last row of the previous page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed, misses any of the keys or has a value of the wrong type.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(values, dict):
+        raise InvalidCursorError("Invalid cursor")
+    try:
+        return {key: convert(values[key]) for key, convert in fields.items()}
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+def next_cursor(items: Sequence[Any], limit: int, key: Callable[[Any], dict]) -> Optional[str]:
+    """
+    Builds the cursor of the page following the given one.
+
+    Args:
+        items (Sequence[Any]): The rows of the current page.
+        limit (int): The page size that was requested.
+        key (Callable[[Any], dict]): Extracts the keyset values from a row.
+
+    Returns:
+        Optional[str]: The cursor of the next page, or None if this was the last page.
+    """
+    if limit <= 0 or len(items) < limit:
+        return None
+    return encode_cursor(key(items[-1]))
+
+def parse_ids(ids: str) -> List[int]:
+    """
+    Parses the value of an ?ids= parameter, a comma-separated list of IDs, dropping repeated IDs.
+
+    Args:
+        ids (str): The value of the parameter, such as "3,1,2".
+
+    Returns:
+        List[int]: The IDs, in the order given.
+    """
+    return list(dict.fromkeys(int(value) for value in ids.split(",")))
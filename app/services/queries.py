@@ -0,0 +1,154 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config.settings import QUERY_REPEAT_THRESHOLD, SLOW_QUERY_EXPLAIN, SLOW_QUERY_SECONDS
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+class QueryRecorder:
+    """
+    Records the SQL statements run while it is the current recorder, usually during one request.
+
+    Attributes:
+        count (int): The number of statements run.
+        duration (float): The total time spent running them, in seconds.
+        statements (Counter): The number of times each statement text was run.
+        parent (Optional[QueryRecorder]): The enclosing recorder, which also records every statement.
+    """
+
+    def __init__(self, parent: Optional["QueryRecorder"] = None):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+        self.parent = parent
+
+    def record(self, statement: str, elapsed: float):
+        """
+        Records a statement run.
+
+        Args:
+            statement (str): The SQL text of the statement.
+            elapsed (float): The time it took, in seconds.
+        """
+        recorder = self
+        while recorder is not None:
+            recorder.count += 1
+            recorder.duration += elapsed
+            recorder.statements[statement] += 1
+            recorder = recorder.parent
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> Dict[str, int]:
+        """
+        Returns the statements run at least threshold times, the usual sign of an N+1 query pattern.
+
+        Args:
+            threshold (int): The number of runs from which a statement counts as repeated. Default is QUERY_REPEAT_THRESHOLD.
+
+        Returns:
+            Dict[str, int]: The number of runs of each repeated statement.
+        """
+        return {statement: runs for statement, runs in self.statements.items() if runs >= threshold}
+
+    def report(self) -> str:
+        """
+        Describes the recorded statements, most frequent first.
+
+        Returns:
+            str: One line per distinct statement with its number of runs.
+        """
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        lines += [f"{runs:>4} x {' '.join(statement.split())}" for statement, runs in self.statements.most_common()]
+        return "\n".join(lines)
+
+_current: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+def current() -> Optional[QueryRecorder]:
+    """
+    Returns the recorder of the current request, if any.
+
+    Returns:
+        Optional[QueryRecorder]: The current recorder.
+    """
+    return _current.get()
+
+@contextmanager
+def recording() -> Iterator[QueryRecorder]:
+    """
+    Records the statements run inside the block, including the ones run by tasks it starts.
+
+    Blocks can be nested, for example a test measuring a request that a middleware also measures;
+    the statements are recorded by every active recorder.
+
+    Yields:
+        QueryRecorder: The recorder of the block.
+    """
+    recorder = QueryRecorder(parent=_current.get())
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    metrics.db_queries.inc()
+    metrics.db_query_duration.observe(value=elapsed)
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.record(statement, elapsed)
+    if SLOW_QUERY_SECONDS > 0 and elapsed >= SLOW_QUERY_SECONDS:
+        _log_slow_query(conn, statement, parameters, context, executemany, elapsed)
+
+def _log_slow_query(conn, statement: str, parameters, context, executemany: bool, elapsed: float):
+    plan = None
+    if SLOW_QUERY_EXPLAIN and not executemany and not context.execution_options.get("stream_results") and statement.lstrip().upper().startswith("SELECT"):
+        plan = explain(conn, statement, parameters)
+    logger.warning("Slow query (%.1f ms): %s\nParameters: %r%s", elapsed * 1000, " ".join(statement.split()), parameters,
+                   f"\nPlan:\n{plan}" if plan else "")
+
+def explain(conn, statement: str, parameters) -> Optional[str]:
+    """
+    Returns the query plan of a SELECT statement, as reported by the database.
+
+    The plan is read with a separate DBAPI cursor on the same connection, so it runs in the same
+    transaction and is not recorded or timed itself.
+
+    Args:
+        conn (Connection): The connection that ran the statement.
+        statement (str): The SQL text of the statement, in the DBAPI parameter style.
+        parameters: The DBAPI parameters of the statement.
+
+    Returns:
+        Optional[str]: The plan, one row per line, or None if it could not be read.
+    """
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return "\n".join(" ".join(str(value) for value in row) for row in cursor.fetchall())
+    except Exception:
+        logger.debug("Could not explain the slow query", exc_info=True)
+        return None
+    finally:
+        cursor.close()
+
+def install():
+    """
+    Starts timing the statements of every engine. Calling it again has no effect.
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
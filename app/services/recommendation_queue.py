@@ -0,0 +1,391 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import database
+from app.models import models
+from app.services import cache
+from app.config.settings import RECOMMENDATION_QUEUE_ENABLED
+
+REVIEW_INTERVAL = timedelta(days=30)
+WARM_BATCH_SIZE = 10000
+
+class _Entry(NamedTuple):
+    location_id: int
+    category_id: int
+    last_reviewed: Optional[datetime]
+
+class Relation(NamedTuple):
+    """
+    A relation read from the queue, with the fields of schemas.LocationCategoryReviewed.
+    """
+    location_id: int
+    category_id: int
+    id: int
+    last_reviewed: Optional[datetime]
+
+class RecommendationQueue:
+    """
+    In-memory priority queue of the location-category relations due for review.
+
+    Relations never reviewed come first, by ID, followed by the ones whose last review is older than
+    REVIEW_INTERVAL, oldest first; this is the same order as the database queries in services.recommendations.
+    Updates push new heap items and leave the old ones behind as stale items. Reads pop the items they
+    visit and push back only the ones they return, so stale items are dropped the first time a read reaches
+    them, and the heaps are also rebuilt when stale items outnumber the relations.
+
+    The queue also knows the reviewer leases granted by the workers. A read that reaches a leased relation
+    moves it to a heap ordered by lease expiry, from which it goes back to the queue when the lease expires
+    or is released, so reads never walk over the relations held by reviewers and claims made in the same
+    process never hand out a relation twice.
+
+    Every change is also published through the shared cache backend and applied by the queues of the
+    other workers (see apply_message), so they serve the same recommendations.
+
+    Attributes:
+        ready (bool): Whether the queue has been loaded from the database and can serve reads.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._entries: Dict[int, _Entry] = {}
+        self._never_reviewed: List[int] = []
+        self._reviewed: List[tuple] = []
+        self._leases: Dict[int, datetime] = {}
+        self._lease_expiry: List[Tuple[datetime, int]] = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, relation_id: int) -> bool:
+        return relation_id in self._entries
+
+    def clear(self):
+        """
+        Empties the queue and marks it as not ready.
+        """
+        self.ready = False
+        self._entries = {}
+        self._never_reviewed = []
+        self._reviewed = []
+        self._leases = {}
+        self._lease_expiry = []
+
+    async def warm(self, db: AsyncSession):
+        """
+        Loads every relation and active lease from the database, replacing the current content of the queue.
+
+        Args:
+            db (AsyncSession): The database session.
+        """
+        self.clear()
+        now = datetime.utcnow()
+        relation = models.LocationCategoryReviewed
+        result = await db.stream(select(relation.id, relation.location_id, relation.category_id, relation.last_reviewed, relation.leased_until)
+                                 .execution_options(yield_per=WARM_BATCH_SIZE))
+        async for partition in result.partitions():
+            for relation_id, location_id, category_id, last_reviewed, leased_until in partition:
+                self._entries[relation_id] = _Entry(location_id, category_id, last_reviewed)
+                if leased_until is not None and leased_until > now:
+                    self._leases[relation_id] = leased_until
+        self._rebuild()
+        self.ready = True
+
+    def _rebuild(self):
+        queued = [(relation_id, entry) for relation_id, entry in self._entries.items() if relation_id not in self._leases]
+        self._never_reviewed = [relation_id for relation_id, entry in queued if entry.last_reviewed is None]
+        self._reviewed = [(entry.last_reviewed, relation_id) for relation_id, entry in queued if entry.last_reviewed is not None]
+        self._lease_expiry = [(until, relation_id) for relation_id, until in self._leases.items()]
+        heapq.heapify(self._never_reviewed)
+        heapq.heapify(self._reviewed)
+        heapq.heapify(self._lease_expiry)
+
+    def _maybe_rebuild(self):
+        if len(self._never_reviewed) + len(self._reviewed) + len(self._lease_expiry) > 2 * len(self._entries) + 1024:
+            self._rebuild()
+
+    def _push(self, relation_id: int):
+        entry = self._entries.get(relation_id)
+        if entry is None:
+            return
+        if entry.last_reviewed is None:
+            heapq.heappush(self._never_reviewed, relation_id)
+        else:
+            heapq.heappush(self._reviewed, (entry.last_reviewed, relation_id))
+
+    def upsert(self, relation_id: int, location_id: int, category_id: int, last_reviewed: Optional[datetime]):
+        """
+        Adds a relation to the queue or updates its review state. A new review ends the lease of the relation.
+
+        Args:
+            relation_id (int): The ID of the relation.
+            location_id (int): The ID of the related location.
+            category_id (int): The ID of the related category.
+            last_reviewed (Optional[datetime]): The timestamp of the last review, or None if never reviewed.
+        """
+        if self._upsert(relation_id, location_id, category_id, last_reviewed):
+            cache.publish("queue", op="upsert", relations=[[relation_id, location_id, category_id, last_reviewed]])
+
+    def _upsert(self, relation_id: int, location_id: int, category_id: int, last_reviewed: Optional[datetime]) -> bool:
+        if not self.ready:
+            return False
+        entry = _Entry(location_id, category_id, last_reviewed)
+        if self._entries.get(relation_id) == entry:
+            return False
+        self._entries[relation_id] = entry
+        self._leases.pop(relation_id, None)
+        self._push(relation_id)
+        self._maybe_rebuild()
+        return True
+
+    def upsert_many(self, relations: Iterable):
+        """
+        Adds or updates many relations.
+
+        Args:
+            relations (Iterable): Objects with the id, location_id, category_id and last_reviewed of each relation.
+        """
+        changed = [[relation.id, relation.location_id, relation.category_id, relation.last_reviewed] for relation in relations
+                   if self._upsert(relation.id, relation.location_id, relation.category_id, relation.last_reviewed)]
+        if changed:
+            cache.publish("queue", op="upsert", relations=changed)
+
+    def remove(self, relation_id: int):
+        """
+        Removes a relation from the queue.
+
+        Args:
+            relation_id (int): The ID of the relation.
+        """
+        self._remove(relation_id)
+        if self.ready:
+            cache.publish("queue", op="remove", ids=[relation_id])
+
+    def _remove(self, relation_id: int):
+        self._leases.pop(relation_id, None)
+        if self._entries.pop(relation_id, None) is not None:
+            self._maybe_rebuild()
+
+    def lease(self, relation_ids: Iterable[int], until: datetime):
+        """
+        Records the lease of relations to a reviewer, hiding them from reads until it expires.
+
+        Args:
+            relation_ids (Iterable[int]): The IDs of the leased relations.
+            until (datetime): The expiry of the lease.
+        """
+        relation_ids = list(relation_ids)
+        self._lease(relation_ids, until)
+        if self.ready and relation_ids:
+            cache.publish("queue", op="lease", ids=relation_ids, until=until)
+
+    def _lease(self, relation_ids: Iterable[int], until: datetime):
+        for relation_id in relation_ids:
+            self._leases[relation_id] = until
+
+    def release(self, relation_ids: Iterable[int]):
+        """
+        Forgets the lease of relations, showing them again in reads.
+
+        Args:
+            relation_ids (Iterable[int]): The IDs of the released relations.
+        """
+        relation_ids = list(relation_ids)
+        self._release(relation_ids)
+        if self.ready and relation_ids:
+            cache.publish("queue", op="release", ids=relation_ids)
+
+    def _release(self, relation_ids: Iterable[int]):
+        for relation_id in relation_ids:
+            if self._leases.pop(relation_id, None) is not None:
+                # The relation may have been moved to the lease expiry heap by a read.
+                self._push(relation_id)
+
+    def apply_message(self, message: dict):
+        """
+        Applies a change published by the queue of another worker, without publishing it again.
+
+        Args:
+            message (dict): The message, with the operation ("upsert", "remove", "lease" or "release") and its arguments.
+        """
+        if not self.ready:
+            return
+        op = message["op"]
+        if op == "upsert":
+            for relation_id, location_id, category_id, last_reviewed in message["relations"]:
+                self._upsert(relation_id, location_id, category_id, _parse_datetime(last_reviewed))
+        elif op == "remove":
+            for relation_id in message["ids"]:
+                self._remove(relation_id)
+        elif op == "lease":
+            self._lease(message["ids"], _parse_datetime(message["until"]))
+        elif op == "release":
+            self._release(message["ids"])
+
+    def _expire(self, now: datetime):
+        # Expiry items whose lease was released, renewed or ended by a review are outdated: the relation
+        # is back in the queue already, or is pushed again with its new expiry.
+        while self._lease_expiry and self._lease_expiry[0][0] <= now:
+            _, relation_id = heapq.heappop(self._lease_expiry)
+            until = self._leases.get(relation_id)
+            if until is None:
+                continue
+            if until > now:
+                heapq.heappush(self._lease_expiry, (until, relation_id))
+            else:
+                del self._leases[relation_id]
+                self._push(relation_id)
+
+    def _take(self, heap: list, k: int, relation_id_of: Callable, current: Callable, now: datetime,
+              stop: Optional[Callable] = None) -> list:
+        """
+        Returns the k smallest items of a heap that are current and not leased, in ascending order.
+
+        The visited items are popped: stale and repeated items are dropped, leased ones are moved to the lease
+        expiry heap and only the returned ones are pushed back, so every item is skipped at most once and
+        the cost of a read is O((k + dropped items) log n).
+
+        Args:
+            heap (list): The heap to read.
+            k (int): The maximum number of items to return.
+            relation_id_of (Callable): Returns the relation ID of an item.
+            current (Callable): Tells whether an item matches the current state of its relation.
+            now (datetime): The current time, to expire leases.
+            stop (Optional[Callable]): Tells whether an item, and therefore every larger one, ends the read.
+
+        Returns:
+            list: The items.
+        """
+        items, seen = [], set()
+        while heap and len(items) < k:
+            if stop is not None and stop(heap[0]):
+                break
+            item = heapq.heappop(heap)
+            relation_id = relation_id_of(item)
+            if relation_id in seen or not current(item):
+                continue
+            seen.add(relation_id)
+            if self._is_leased(relation_id, now):
+                heapq.heappush(self._lease_expiry, (self._leases[relation_id], relation_id))
+            else:
+                items.append(item)
+        for item in items:
+            heapq.heappush(heap, item)
+        return items
+
+    def _is_leased(self, relation_id: int, now: datetime) -> bool:
+        until = self._leases.get(relation_id)
+        if until is None:
+            return False
+        if until <= now:
+            del self._leases[relation_id]
+            return False
+        return True
+
+    def claim(self, limit: int, until: datetime, now: Optional[datetime] = None) -> List[int]:
+        """
+        Picks the relations due for review that are not leased, and leases them at once in this process.
+
+        Picking and leasing run without yielding to the event loop, so concurrent claims in this
+        process always get distinct relations without any lock. The other workers are only told about
+        the leases confirmed with lease() once written to the database; the others are given back with unclaim().
+
+        Args:
+            limit (int): The maximum number of relations to claim.
+            until (datetime): The expiry of the lease.
+            now (Optional[datetime]): The current time. Default is datetime.utcnow().
+
+        Returns:
+            List[int]: The IDs of the claimed relations, in review order.
+        """
+        relation_ids = [relation.id for relation in self.fresh(limit, now)]
+        self._lease(relation_ids, until)
+        return relation_ids
+
+    def unclaim(self, relation_ids: Iterable[int], until: datetime):
+        """
+        Gives back relations picked by claim() that could not be leased in the database, such as the ones
+        another process leased first. Leases recorded for them since the claim are kept.
+
+        Args:
+            relation_ids (Iterable[int]): The IDs of the relations.
+            until (datetime): The expiry given to claim().
+        """
+        self._release([relation_id for relation_id in relation_ids if self._leases.get(relation_id) == until])
+
+    def _relation(self, relation_id: int) -> Relation:
+        entry = self._entries[relation_id]
+        return Relation(entry.location_id, entry.category_id, relation_id, entry.last_reviewed)
+
+    def never_reviewed(self, limit: int, now: Optional[datetime] = None) -> List[Relation]:
+        """
+        Returns the relations that have never been reviewed and are not leased, by ID.
+
+        Args:
+            limit (int): The maximum number of relations to return.
+            now (Optional[datetime]): The current time, to expire leases. Default is datetime.utcnow().
+
+        Returns:
+            List[Relation]: The relations.
+        """
+        now = now or datetime.utcnow()
+        self._expire(now)
+
+        def current(relation_id: int) -> bool:
+            entry = self._entries.get(relation_id)
+            return entry is not None and entry.last_reviewed is None
+
+        ids = self._take(self._never_reviewed, limit, lambda relation_id: relation_id, current, now)
+        return [self._relation(relation_id) for relation_id in ids]
+
+    def fresh(self, limit: int, now: Optional[datetime] = None) -> List[Relation]:
+        """
+        Returns the relations due for review that are not leased: never reviewed first, then the ones reviewed longest ago.
+
+        Args:
+            limit (int): The maximum number of relations to return.
+            now (Optional[datetime]): The current time. Default is datetime.utcnow().
+
+        Returns:
+            List[Relation]: The relations.
+        """
+        now = now or datetime.utcnow()
+        cutoff = now - REVIEW_INTERVAL
+
+        def current(item: tuple) -> bool:
+            entry = self._entries.get(item[1])
+            return entry is not None and entry.last_reviewed == item[0]
+
+        relations = self.never_reviewed(limit, now)
+        if len(relations) < limit:
+            items = self._take(self._reviewed, limit - len(relations), lambda item: item[1], current, now,
+                               lambda item: item[0] >= cutoff)
+            relations.extend(self._relation(relation_id) for _, relation_id in items)
+        return relations
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+queue = RecommendationQueue()
+cache.subscribe("queue", queue.apply_message)
+
+async def _reload():
+    # Changes announced while this worker was not subscribed are lost: start again from the database.
+    if queue.ready:
+        async with database.SessionLocal() as db:
+            await queue.warm(db)
+
+cache.on_resubscribe(_reload)
+
+async def warm(db: AsyncSession):
+    """
+    Loads the recommendation queue from the database, if it is enabled.
+
+    Args:
+        db (AsyncSession): The database session.
+    """
+    if RECOMMENDATION_QUEUE_ENABLED:
+        await queue.warm(db)
+    else:
+        queue.clear()
@@ -1,108 +1,373 @@
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app.models import models
+from app.services import bulk, etags, pagination, serialization, tiles
+from app.services.recommendation_queue import REVIEW_INTERVAL, queue
+from app.schemas import schemas
+from app.config.settings import BULK_CHUNK_SIZE, RECOMMENDATION_LEASE_SECONDS
+from sqlalchemy import and_, case, delete, insert, or_, update
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
-from sqlalchemy.orm import selectinload
 
-async def get_fresh_recommendations(db: AsyncSession):
+def _not_leased(now: datetime):
+    leased_until = models.LocationCategoryReviewed.leased_until
+    return or_(leased_until.is_(None), leased_until <= now)
+
+async def get_fresh_recommendations(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None):
     """
-    Fetches 10 recommendations of location-category combinations that have not been reviewed in the last 30 days,
-    prioritizing those that never have been reviewed.
+    Fetches recommendations of location-category combinations that have not been reviewed in the last 30 days,
+    prioritizing those that never have been reviewed and then the ones reviewed longest ago.
+
+    The first page is read from the in-memory recommendation queue when it is loaded; later pages use
+    a keyset query on the database with the same ordering. Relations leased to a reviewer are skipped.
 
     Args:
         db (AsyncSession): The database session.
+        limit (int): The maximum number of recommendations to return. Default is 10.
+        cursor (Optional[str]): The cursor returned with the previous page. Default is None.
 
     Returns:
-        List[models.LocationCategoryReviewed]: A list of recommended location-category relationships.
+        List[Row]: The recommended relations, as rows holding the fields of schemas.LocationCategoryReviewed.
+
+    Raises:
+        pagination.InvalidCursorError: If the cursor cannot be decoded.
     """
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    query = (
-        select(models.LocationCategoryReviewed)
-        .options(joinedload(models.LocationCategoryReviewed.location), joinedload(models.LocationCategoryReviewed.category))
-        .filter(
-            (models.LocationCategoryReviewed.last_reviewed.is_(None)) | 
-            (models.LocationCategoryReviewed.last_reviewed < thirty_days_ago)
+    if cursor is None and queue.ready:
+        return queue.fresh(limit)
+
+    now = datetime.utcnow()
+    thirty_days_ago = now - REVIEW_INTERVAL
+    last_reviewed = models.LocationCategoryReviewed.last_reviewed
+    relation_id = models.LocationCategoryReviewed.id
+    columns = serialization.relations.columns(models.LocationCategoryReviewed)
+    after = pagination.decode_cursor(cursor, {"last_reviewed": pagination.cursor_datetime, "id": pagination.cursor_int}) if cursor is not None else None
+
+    # Never reviewed relations first, then the stale ones. Each part is a range scan on its own index
+    # (the partial never-reviewed index and the (last_reviewed, id) index) instead of a filtered sort.
+    recommendations = []
+    if after is None or after["last_reviewed"] is None:
+        query = (
+            select(*columns)
+            .filter(last_reviewed.is_(None), _not_leased(now))
+            .order_by(relation_id)
+            .limit(limit)
         )
-        .order_by(models.LocationCategoryReviewed.last_reviewed.desc())
-        .limit(10)
-    )
-    
-    result = await db.execute(query)
-    recommendations = result.scalars().all()
-    
+        if after is not None:
+            query = query.filter(relation_id > after["id"])
+        result = await db.execute(query)
+        recommendations.extend(result.all())
+        after = None
+
+    if len(recommendations) < limit:
+        query = (
+            select(*columns)
+            .filter(last_reviewed < thirty_days_ago, _not_leased(now))
+            .order_by(last_reviewed, relation_id)
+            .limit(limit - len(recommendations))
+        )
+        if after is not None:
+            query = query.filter((last_reviewed > after["last_reviewed"]) |
+                                 ((last_reviewed == after["last_reviewed"]) & (relation_id > after["id"])))
+        result = await db.execute(query)
+        recommendations.extend(result.all())
+
     return recommendations
 
-async def get_never_reviewed_recommendations(db: AsyncSession):
+async def get_never_reviewed_recommendations(db: AsyncSession, limit: int = 10, cursor: Optional[str] = None):
     """
     Fetches recommendations that have never been reviewed.
 
+    The first page is read from the in-memory recommendation queue when it is loaded.
+    Relations leased to a reviewer are skipped.
+
     Args:
         db (AsyncSession): The database session.
+        limit (int): The maximum number of recommendations to return. Default is 10.
+        cursor (Optional[str]): The cursor returned with the previous page. Default is None.
 
     Returns:
-        List[models.LocationCategoryReviewed]: A list of reviewed location-category relationships
-        that have never been reviewed.
+        List[Row]: The relations that have never been reviewed, ordered by ID, as rows holding
+        the fields of schemas.LocationCategoryReviewed.
+
+    Raises:
+        pagination.InvalidCursorError: If the cursor cannot be decoded.
     """
-    result = await db.execute(select(models.LocationCategoryReviewed)
-                              .filter(models.LocationCategoryReviewed.last_reviewed.is_(None))
-                              .limit(10))
-    return result.scalars().all()
+    if cursor is None and queue.ready:
+        return queue.never_reviewed(limit)
+
+    query = (select(*serialization.relations.columns(models.LocationCategoryReviewed))
+             .filter(models.LocationCategoryReviewed.last_reviewed.is_(None), _not_leased(datetime.utcnow()))
+             .order_by(models.LocationCategoryReviewed.id)
+             .limit(limit))
+    if cursor is not None:
+        after = pagination.decode_cursor(cursor, {"id": pagination.cursor_int})
+        query = query.filter(models.LocationCategoryReviewed.id > after["id"])
+    result = await db.execute(query)
+    return result.all()
 
 async def create_relation(db: AsyncSession, location_id: int, category_id: int):
     """
     Creates a new relation for a given location and category.
 
+    A location and a category are linked at most once; if they already are, the existing relation is returned.
+    The relation is written with a single INSERT ... ON CONFLICT DO NOTHING RETURNING, so only a pair
+    that is already linked costs a second query. A new relation is counted in the tile of its location.
+
     Args:
         db (AsyncSession): The database session.
         location_id (int): The ID of the location.
         category_id (int): The ID of the category.
 
     Returns:
-        models.LocationCategoryReviewed: The newly created relation object.
+        schemas.LocationCategoryReviewed: The newly created relation, or the existing one.
     """
-    relation = models.LocationCategoryReviewed(location_id=location_id, category_id=category_id, last_reviewed=None)
-    db.add(relation)
+    statement = bulk.insert_on_conflict(db, models.LocationCategoryReviewed,
+                                        {"location_id": location_id, "category_id": category_id, "last_reviewed": None},
+                                        ["location_id", "category_id"])
+    created = await bulk.execute_returning(db, statement, schemas.LocationCategoryReviewed)
+    if not created:
+        await db.commit()
+        return await get_relation(db, location_id, category_id)
+    relation = created[0]
+    geohashes = await tiles.location_geohashes(db, [location_id])
+    changes = tiles.TileChanges()
+    changes.relation(geohashes.get(location_id), None)
+    await changes.apply(db)
     await db.commit()
-    await db.refresh(relation)
+    queue.upsert(relation.id, relation.location_id, relation.category_id, relation.last_reviewed)
+    etags.bump("relations")
     return relation
 
+async def get_relation(db: AsyncSession, location_id: int, category_id: int):
+    """
+    Fetches the relation between a location and a category.
+
+    Args:
+        db (AsyncSession): The database session.
+        location_id (int): The ID of the location.
+        category_id (int): The ID of the category.
+
+    Returns:
+        models.LocationCategoryReviewed: The relation object if found, otherwise None.
+    """
+    result = await db.execute(select(models.LocationCategoryReviewed)
+                              .filter(models.LocationCategoryReviewed.location_id == location_id,
+                                      models.LocationCategoryReviewed.category_id == category_id))
+    return result.scalars().first()
+
+async def create_relations(db: AsyncSession, relations: List[schemas.LocationCategoryReviewedCreate]):
+    """
+    Creates many relations, one multi-row INSERT and one transaction per chunk.
+
+    Relations pointing to a location or category that does not exist, and pairs that are already linked
+    or repeated inside the batch, are reported as errors without aborting the rest of the batch.
+
+    Args:
+        db (AsyncSession): The database session.
+        relations (List[schemas.LocationCategoryReviewedCreate]): The relation data to create.
+
+    Returns:
+        Tuple[List[models.LocationCategoryReviewed], List[Tuple[int, str]]]: The created relation objects, and the
+        index and error detail of every relation that could not be created.
+    """
+    created, errors = [], []
+    for start, chunk in bulk.chunked(relations, BULK_CHUNK_SIZE):
+        result = await db.execute(select(models.Location.id, models.Location.geohash)
+                                  .filter(models.Location.id.in_({relation.location_id for relation in chunk})))
+        geohashes = dict(result.tuples().all())
+        location_ids = set(geohashes)
+        result = await db.execute(select(models.Category.id).filter(models.Category.id.in_({relation.category_id for relation in chunk})))
+        category_ids = set(result.scalars().all())
+        result = await db.execute(select(models.LocationCategoryReviewed.location_id, models.LocationCategoryReviewed.category_id)
+                                  .filter(models.LocationCategoryReviewed.location_id.in_(location_ids),
+                                          models.LocationCategoryReviewed.category_id.in_(category_ids)))
+        linked = set(result.tuples().all())
+        pending = []
+        for offset, relation in enumerate(chunk):
+            pair = (relation.location_id, relation.category_id)
+            if relation.location_id not in location_ids:
+                errors.append((start + offset, "Location not found"))
+            elif relation.category_id not in category_ids:
+                errors.append((start + offset, "Category not found"))
+            elif pair in linked:
+                errors.append((start + offset, "Relation already exists"))
+            else:
+                linked.add(pair)
+                pending.append((start + offset, relation))
+        try:
+            rows = [{**relation.model_dump(), "last_reviewed": None} for _, relation in pending]
+            chunk_created = await bulk.insert_returning(db, models.LocationCategoryReviewed, rows)
+            changes = tiles.TileChanges()
+            for _, relation in pending:
+                changes.relation(geohashes[relation.location_id], None)
+            await changes.apply(db)
+            await db.commit()
+            queue.upsert_many(chunk_created)
+            etags.bump("relations")
+            created.extend(chunk_created)
+        except Exception as e:
+            await db.rollback()
+            errors.extend((index, f"Relation could not be created: {e}") for index, _ in pending)
+    errors.sort()
+    return created, errors
+
 async def create_review(db: AsyncSession, review_id: int):
     """
     Creates a new review for a given location and category.
 
+    The relation's last_reviewed is set, and its lease ended, with an UPDATE ... RETURNING and the review
+    is appended to the review history, in one transaction. The previous review state is read first to update the tile counters.
+
     Args:
         db (AsyncSession): The database session.
         review_id (int): The ID of the review to create.
 
     Returns:
-        models.LocationCategoryReviewed: The updated review object.
+        schemas.LocationCategoryReviewed: The updated review, or None if the relation does not exist.
     """
-    relation = await get_review(db, review_id)
-    if not relation:
+    states = await tiles.relation_states(db, [review_id])
+    if review_id not in states:
+        await db.rollback()
+        return None
+    table = models.LocationCategoryReviewed.__table__
+    reviewed_at = datetime.utcnow()
+    updated = await bulk.execute_returning(db, update(table).where(table.c.id == review_id).values(last_reviewed=reviewed_at, leased_by=None, leased_until=None),
+                                           schemas.LocationCategoryReviewed)
+    if not updated:
+        await db.rollback()
         return None
-    relation.last_reviewed = datetime.utcnow()
+    geohash, last_reviewed = states[review_id]
+    changes = tiles.TileChanges()
+    changes.relation(geohash, last_reviewed, -1)
+    changes.relation(geohash, updated[0].last_reviewed)
+    return await _record_review(db, updated[0], changes)
+
+async def _record_review(db: AsyncSession, relation: schemas.LocationCategoryReviewed, changes: tiles.TileChanges):
+    """
+    Appends the review of a relation to the review history, applies its tile changes and commits them.
+
+    Args:
+        db (AsyncSession): The database session, inside the transaction that reviewed the relation.
+        relation (schemas.LocationCategoryReviewed): The reviewed relation.
+        changes (tiles.TileChanges): The changes of the review to the tile counters.
+
+    Returns:
+        schemas.LocationCategoryReviewed: The reviewed relation.
+    """
+    await db.execute(insert(models.Review.__table__).values(relation_id=relation.id, reviewed_at=relation.last_reviewed))
+    await changes.apply(db)
     await db.commit()
-    await db.refresh(relation)
+    queue.upsert(relation.id, relation.location_id, relation.category_id, relation.last_reviewed)
+    etags.bump("relations")
     return relation
 
+def _review_time(reviewed_at: Optional[datetime], now: datetime) -> datetime:
+    """
+    Converts the timestamp sent with a review to the naive UTC time stored in the database.
+
+    Args:
+        reviewed_at (Optional[datetime]): The timestamp sent, naive times being taken as UTC.
+        now (datetime): The current naive UTC time.
+
+    Returns:
+        datetime: The review time, never later than now.
+    """
+    if reviewed_at is None:
+        return now
+    if reviewed_at.tzinfo is not None:
+        reviewed_at = reviewed_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(reviewed_at, now)
+
+async def create_reviews(db: AsyncSession, reviews: List[schemas.BulkReviewItem]):
+    """
+    Reviews many relations with one set-based UPDATE ... RETURNING and one INSERT per chunk.
+
+    Reviews without a timestamp are dated now, timestamps with an offset are converted to UTC and
+    timestamps in the future are clamped to now. last_reviewed only moves forward, so syncing an
+    older review never hides a newer one, but every review is added to the history. Reviewing a
+    relation ends its lease.
+
+    Args:
+        db (AsyncSession): The database session.
+        reviews (List[schemas.BulkReviewItem]): The IDs of the relations to review, with optional timestamps.
+
+    Returns:
+        Tuple[List[models.LocationCategoryReviewed], List[int]]: The reviewed relation objects, and the
+        requested IDs that do not exist.
+    """
+    now = datetime.utcnow()
+    relation = models.LocationCategoryReviewed
+    reviewed, missing = [], []
+    for _, chunk in bulk.chunked(reviews, BULK_CHUNK_SIZE):
+        latest, times = {}, []
+        for review in chunk:
+            reviewed_at = _review_time(review.reviewed_at, now)
+            times.append(reviewed_at)
+            latest[review.id] = max(reviewed_at, latest.get(review.id, reviewed_at))
+        states = await tiles.relation_states(db, latest)
+        reviewed_at = case(latest, value=relation.id)
+        result = await db.execute(
+            update(relation)
+            .where(relation.id.in_(states))
+            .values(last_reviewed=case((or_(relation.last_reviewed.is_(None), relation.last_reviewed < reviewed_at), reviewed_at),
+                                       else_=relation.last_reviewed),
+                    leased_by=None, leased_until=None)
+            .returning(relation)
+            .execution_options(synchronize_session=False)
+        )
+        chunk_reviewed = result.scalars().all()
+        found = {item.id for item in chunk_reviewed}
+        rows = [{"relation_id": review.id, "reviewed_at": reviewed_at}
+                for review, reviewed_at in zip(chunk, times) if review.id in found]
+        if rows:
+            await db.execute(insert(models.Review), rows)
+        changes = tiles.TileChanges()
+        for item in chunk_reviewed:
+            geohash, last_reviewed = states[item.id]
+            changes.relation(geohash, last_reviewed, -1)
+            changes.relation(geohash, item.last_reviewed)
+        await changes.apply(db)
+        await db.commit()
+        queue.upsert_many(chunk_reviewed)
+        reviewed.extend(chunk_reviewed)
+        missing.extend(relation_id for relation_id in latest if relation_id not in found)
+    if reviewed:
+        etags.bump("relations")
+    return reviewed, missing
+
 async def create_relation_with_review(db: AsyncSession, location_id: int, category_id: int):
     """
     Creates a new relation for a given location and category, and reviews it.
 
+    The relation is created or, if the pair is already linked, marked as reviewed with a single
+    INSERT ... ON CONFLICT DO UPDATE RETURNING, and the review is appended to the history in the same transaction.
+    The location and the previous state of the pair are read first to update the tile counters.
+
     Args:
         db (AsyncSession): The database session.
         location_id (int): The ID of the location.
         category_id (int): The ID of the category.
         
     Returns:
-        models.LocationCategoryReviewed: The newly created relation object.
+        schemas.LocationCategoryReviewed: The reviewed relation.
     """
-    relation = await create_relation(db, location_id, category_id)
-    if not relation:
-        return None
-    return await create_review(db, relation.id)
+    existing = models.LocationCategoryReviewed
+    result = await db.execute(select(models.Location.geohash, existing.id, existing.last_reviewed)
+                              .outerjoin(existing, and_(existing.location_id == models.Location.id, existing.category_id == category_id))
+                              .filter(models.Location.id == location_id)
+                              .with_for_update(of=models.Location))
+    previous = result.first()
+    statement = bulk.insert_on_conflict(db, models.LocationCategoryReviewed,
+                                        {"location_id": location_id, "category_id": category_id, "last_reviewed": datetime.utcnow(),
+                                         "leased_by": None, "leased_until": None},
+                                        ["location_id", "category_id"], update=["last_reviewed", "leased_by", "leased_until"])
+    [relation] = await bulk.execute_returning(db, statement, schemas.LocationCategoryReviewed)
+    changes = tiles.TileChanges()
+    if previous is not None:
+        if previous.id is not None:
+            changes.relation(previous.geohash, previous.last_reviewed, -1)
+        changes.relation(previous.geohash, relation.last_reviewed)
+    return await _record_review(db, relation, changes)
 
 async def get_review(db: AsyncSession, review_id: int):
     """
@@ -115,26 +380,154 @@ async def get_review(db: AsyncSession, review_id: int):
     Returns:
         models.LocationCategoryReviewed: The review object if found, otherwise None.
     """
-    result = await db.execute(select(models.LocationCategoryReviewed)
-                              .options(selectinload(models.LocationCategoryReviewed.location),
-                                       selectinload(models.LocationCategoryReviewed.category))
-                              .filter(models.LocationCategoryReviewed.id == review_id))
+    result = await db.execute(select(models.LocationCategoryReviewed).filter(models.LocationCategoryReviewed.id == review_id))
     return result.scalars().first()
 
 async def delete_review(db: AsyncSession, review_id: int):
     """
-    Deletes a review by its ID.
+    Deletes a review by its ID, together with its review history, in one transaction, and removes it from its tile.
 
     Args:
         db (AsyncSession): The database session.
         review_id (int): The ID of the review to delete.
 
     Returns:
-        models.LocationCategoryReviewed: The deleted review object if found and deleted, otherwise None.
+        schemas.LocationCategoryReviewed: The deleted review if found and deleted, otherwise None.
     """
-    review = await get_review(db, review_id)
-    if not review:
+    states = await tiles.relation_states(db, [review_id])
+    if review_id not in states:
+        await db.rollback()
+        return None
+    table = models.LocationCategoryReviewed.__table__
+    await db.execute(delete(models.Review.__table__).where(models.Review.__table__.c.relation_id == review_id))
+    deleted = await bulk.execute_returning(db, delete(table).where(table.c.id == review_id), schemas.LocationCategoryReviewed)
+    if not deleted:
+        await db.rollback()
         return None
-    await db.delete(review)
+    changes = tiles.TileChanges()
+    changes.relation(*states[review_id], -1)
+    await changes.apply(db)
+    await db.commit()
+    queue.remove(review_id)
+    etags.bump("relations")
+    return deleted[0]
+
+async def get_review_history(db: AsyncSession, review_id: int, limit: int = 100):
+    """
+    Fetches the review history of a relation, most recent first.
+
+    Args:
+        db (AsyncSession): The database session.
+        review_id (int): The ID of the relation.
+        limit (int): The maximum number of reviews to return. Default is 100.
+
+    Returns:
+        List[models.Review]: The reviews of the relation.
+    """
+    result = await db.execute(select(models.Review)
+                              .filter(models.Review.relation_id == review_id)
+                              .order_by(models.Review.reviewed_at.desc(), models.Review.id.desc())
+                              .limit(limit))
+    return result.scalars().all()
+
+async def claim_recommendations(db: AsyncSession, reviewer: str, limit: int = 10, lease_seconds: int = RECOMMENDATION_LEASE_SECONDS):
+    """
+    Leases relations due for review to a reviewer, in the order of the fresh recommendations.
+
+    Concurrent reviewers always get distinct relations. On PostgreSQL the due relations are picked
+    with SELECT ... FOR UPDATE SKIP LOCKED inside the UPDATE that leases them, so claimers skip each
+    other's rows instead of waiting on them. On other databases the relations are picked and leased
+    in memory by the recommendation queue without yielding to the event loop, then written with an
+    UPDATE that only leases relations still due and free, in case another process claimed them first;
+    the relations it skips, or all of them if the UPDATE fails, are given back to the queue at once.
+    Relations whose lease expired can be claimed again.
+
+    Args:
+        db (AsyncSession): The database session.
+        reviewer (str): The reviewer claiming the relations.
+        limit (int): The maximum number of relations to claim. Default is 10.
+        lease_seconds (int): The duration of the lease. Default is RECOMMENDATION_LEASE_SECONDS.
+
+    Returns:
+        List[schemas.RecommendationLease]: The leased relations, never reviewed first, then the ones reviewed longest ago.
+    """
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=lease_seconds)
+    relation = models.LocationCategoryReviewed
+    table = relation.__table__
+    stale = relation.last_reviewed < now - REVIEW_INTERVAL
+    lease = {"leased_by": reviewer, "leased_until": until}
+    claimed, picked, committed = [], [], set()
+    try:
+        if db.get_bind().dialect.name == "postgresql":
+            for due, order in ((relation.last_reviewed.is_(None), [relation.id]), (stale, [relation.last_reviewed, relation.id])):
+                if len(claimed) >= limit:
+                    break
+                candidates = (select(relation.id).filter(due, _not_leased(now)).order_by(*order)
+                              .limit(limit - len(claimed)).with_for_update(skip_locked=True))
+                claimed += await bulk.execute_returning(db, update(table).where(table.c.id.in_(candidates.scalar_subquery())).values(**lease),
+                                                        schemas.RecommendationLease)
+        else:
+            if queue.ready:
+                candidate_ids = picked = queue.claim(limit, until, now)
+            else:
+                candidate_ids = [row.id for row in await get_fresh_recommendations(db, limit)]
+            if candidate_ids:
+                claimed = await bulk.execute_returning(db, update(table)
+                                                       .where(table.c.id.in_(candidate_ids), or_(table.c.last_reviewed.is_(None), stale), _not_leased(now))
+                                                       .values(**lease), schemas.RecommendationLease)
+        await db.commit()
+        committed = {item.id for item in claimed}
+    finally:
+        # The relations picked by the queue but not leased by the UPDATE (changed or claimed by another process
+        # meanwhile), or all of them if it failed, go back to the queue instead of staying hidden until the lease expires.
+        queue.unclaim(set(picked) - committed, until)
+    queue.lease((item.id for item in claimed), until)
+    if claimed:
+        etags.bump("relations")
+    return sorted(claimed, key=lambda item: (item.last_reviewed is not None, item.last_reviewed or now, item.id))
+
+async def renew_leases(db: AsyncSession, reviewer: str, relation_ids: List[int], lease_seconds: int = RECOMMENDATION_LEASE_SECONDS):
+    """
+    Extends the leases a reviewer still holds. Expired leases are not renewed, since the relations may have been claimed again.
+
+    Args:
+        db (AsyncSession): The database session.
+        reviewer (str): The reviewer holding the leases.
+        relation_ids (List[int]): The IDs of the leased relations.
+        lease_seconds (int): The new duration of the leases, from now. Default is RECOMMENDATION_LEASE_SECONDS.
+
+    Returns:
+        List[schemas.RecommendationLease]: The relations whose lease was renewed.
+    """
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=lease_seconds)
+    table = models.LocationCategoryReviewed.__table__
+    renewed = await bulk.execute_returning(db, update(table)
+                                           .where(table.c.id.in_(relation_ids), table.c.leased_by == reviewer, table.c.leased_until > now)
+                                           .values(leased_until=until), schemas.RecommendationLease)
+    await db.commit()
+    queue.lease((item.id for item in renewed), until)
+    return sorted(renewed, key=lambda item: item.id)
+
+async def release_leases(db: AsyncSession, reviewer: str, relation_ids: List[int]):
+    """
+    Ends the leases of a reviewer without reviewing the relations, so other reviewers can claim them.
+
+    Args:
+        db (AsyncSession): The database session.
+        reviewer (str): The reviewer holding the leases.
+        relation_ids (List[int]): The IDs of the leased relations.
+
+    Returns:
+        List[schemas.RecommendationLease]: The released relations.
+    """
+    table = models.LocationCategoryReviewed.__table__
+    released = await bulk.execute_returning(db, update(table)
+                                            .where(table.c.id.in_(relation_ids), table.c.leased_by == reviewer)
+                                            .values(leased_by=None, leased_until=None), schemas.RecommendationLease)
     await db.commit()
-    return review
+    queue.release(item.id for item in released)
+    if released:
+        etags.bump("relations")
+    return sorted(released, key=lambda item: item.id)
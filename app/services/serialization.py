@@ -0,0 +1,82 @@
+from typing import Iterable, List, Type
+from typing_extensions import TypedDict
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from app.schemas import schemas
+
+JSON_MEDIA_TYPE = "application/json"
+
+class RowListAdapter:
+    """
+    Serializes lists of plain rows straight to JSON with the field layout of a response schema.
+
+    List endpoints read only the columns of their schema, as SQLAlchemy rows or named tuples, and
+    dump them with a TypeAdapter built once at import, instead of hydrating ORM objects and then
+    validating them into schema instances before serializing.
+
+    Attributes:
+        schema (Type[BaseModel]): The response schema of each item.
+        fields (List[str]): The fields of the schema, in serialization order.
+    """
+
+    def __init__(self, schema: Type[BaseModel]):
+        self.schema = schema
+        self.fields = list(schema.model_fields)
+        row_type = TypedDict(f"{schema.__name__}Row", {name: field.annotation for name, field in schema.model_fields.items()})
+        self._adapter = TypeAdapter(List[row_type])
+
+    def columns(self, model) -> list:
+        """
+        Returns the table columns of a model that hold the fields of the schema.
+
+        Args:
+            model: The ORM model.
+
+        Returns:
+            list: The columns, in the order of the schema fields.
+        """
+        return [model.__table__.c[name] for name in self.fields]
+
+    def dump_json(self, rows: Iterable) -> bytes:
+        """
+        Serializes rows to a JSON array.
+
+        Args:
+            rows (Iterable): Rows or named tuples holding at least the fields of the schema.
+
+        Returns:
+            bytes: The JSON document.
+        """
+        return self._adapter.dump_json([row._asdict() for row in rows])
+
+    def response(self, rows: Iterable, response: Response) -> Response:
+        """
+        Builds the JSON response of a list endpoint, keeping the headers already set on the endpoint's response.
+
+        Args:
+            rows (Iterable): Rows or named tuples holding at least the fields of the schema.
+            response (Response): The response injected in the endpoint, holding headers such as ETag.
+
+        Returns:
+            Response: The response, which FastAPI sends without validating it against the response model again.
+        """
+        return json_response(self.dump_json(rows), response)
+
+def json_response(body: bytes, response: Response) -> Response:
+    """
+    Builds a JSON response from an already serialized body, keeping the headers already set on the endpoint's response.
+
+    Args:
+        body (bytes): The JSON document.
+        response (Response): The response injected in the endpoint, holding headers such as ETag.
+
+    Returns:
+        Response: The response, which FastAPI sends without validating it against the response model again.
+    """
+    fast = Response(content=body, media_type=JSON_MEDIA_TYPE)
+    fast.raw_headers.extend(header for header in response.raw_headers if header[0] != b"content-length")
+    return fast
+
+locations = RowListAdapter(schemas.Location)
+categories = RowListAdapter(schemas.Category)
+relations = RowListAdapter(schemas.LocationCategoryReviewed)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from app.services.cache import LRUCache, MISSING
+from app.config.settings import COALESCE_MAX_ENTRIES, COALESCE_WINDOW_SECONDS
+
+class _LeaderCancelled(Exception):
+    """
+    Raised to the followers of a call whose leader was cancelled, so one of them runs it instead.
+    """
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller of a key (the leader) runs it, and the callers
+    arriving while it runs (the followers) wait for and share its result instead of running it again.
+
+    With a window, results are also kept for that many seconds, so callers arriving right after the
+    leader finished share it too. Keys should include everything the result depends on, such as the
+    change counter of the tables read (etags.version), so that a write in this process is never hidden.
+
+    Attributes:
+        name (str): The name of the group, used in the statistics.
+        window (float): The number of seconds a result is reused after the call finished; 0 disables it.
+        leaders (int): The number of calls that ran.
+        shared (int): The number of calls that waited for the result of a running call.
+        hits (int): The number of calls answered from the window.
+    """
+
+    def __init__(self, name: str, window: float = COALESCE_WINDOW_SECONDS, maxsize: int = COALESCE_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.window = window
+        self.leaders = 0
+        self.shared = 0
+        self.hits = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._results = LRUCache(name, maxsize=maxsize if window > 0 else 0, ttl=window, clock=clock)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the result of a call, sharing it with every concurrent call of the same key.
+
+        Exceptions of the leader are raised to its followers too. If the leader is cancelled (for
+        example because its client disconnected), a follower runs the call instead.
+
+        Args:
+            key (Hashable): The identity of the call.
+            call (Callable[[], Awaitable[Any]]): The coroutine function that computes the result.
+
+        Returns:
+            Any: The result of the call.
+        """
+        while True:
+            if self.window > 0:
+                result = self._results.get(key)
+                if result is not MISSING:
+                    self.hits += 1
+                    return result
+            future = self._calls.get(key)
+            if future is None:
+                break
+            self.shared += 1
+            try:
+                # Shield the shared future, so a cancelled follower does not cancel it for the others.
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            self._results.set(key, result)
+            return result
+        finally:
+            del self._calls[key]
+            if future.done() and not future.cancelled():
+                # Mark the exception as retrieved when no follower was waiting for it.
+                future.exception()
+
+    def clear(self):
+        """
+        Forgets the results kept in the window. Running calls are not affected.
+        """
+        self._results.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the group.
+
+        Returns:
+            Dict[str, Any]: The calls run, shared and answered from the window, and the calls running now.
+        """
+        return {"leaders": self.leaders, "shared": self.shared, "hits": self.hits, "in_flight": len(self._calls)}
+
+fresh_recommendations = SingleFlight("fresh_recommendations")
+category_lists = SingleFlight("category_lists")
+
+GROUPS = [fresh_recommendations, category_lists]
+
+def clear():
+    """
+    Forgets the results kept by every group.
+    """
+    for group in GROUPS:
+        group.clear()
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Returns the counters of every group.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The statistics of each group by name.
+    """
+    return {group.name: group.stats() for group in GROUPS}
@@ -0,0 +1,258 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Date, case, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import models
+from app.schemas import schemas
+from app.services import bulk, geo
+from app.config.settings import BULK_CHUNK_SIZE, TILE_PRECISION
+
+# Relations not reviewed for this many days are stale, as for the fresh recommendations.
+STALE_AFTER_DAYS = 30
+
+# Maximum number of geohash ranges used to read the tiles of a bounding box.
+TILES_MAX_CELLS = 32
+
+def tile_of(geohash: Optional[str]) -> Optional[str]:
+    """
+    Returns the tile containing a geohash.
+
+    Args:
+        geohash (Optional[str]): The geohash of a location.
+
+    Returns:
+        Optional[str]: The geohash of the tile, or None if the location has no geohash.
+    """
+    return geohash[:TILE_PRECISION] if geohash else None
+
+def first_recent_day(today: Optional[date] = None) -> date:
+    """
+    Returns the first day whose reviews are recent; relations last reviewed before it are stale.
+
+    Staleness is counted in whole days, so a relation becomes stale at the start of the day after
+    the one it turns STALE_AFTER_DAYS days old.
+
+    Args:
+        today (Optional[date]): The current day. Default is today in UTC.
+
+    Returns:
+        date: The first recent day.
+    """
+    return (today or datetime.utcnow().date()) - timedelta(days=STALE_AFTER_DAYS - 1)
+
+class TileChanges:
+    """
+    Accumulates the changes a write makes to the tile counters, and applies them in its transaction.
+
+    Changes are summed per tile and per review day in memory and written with one INSERT ... ON CONFLICT
+    increment per table, so keeping the tiles up to date costs at most two statements per write.
+    Reviews older than the staleness window are not tracked, since they only count as stale.
+
+    Attributes:
+        counts (Dict[str, List[int]]): The change of the locations, relations and never_reviewed counters of each tile.
+        reviews (Dict[Tuple[str, date], int]): The change of the relations of each tile last reviewed on each recent day.
+    """
+
+    def __init__(self, today: Optional[date] = None):
+        self.counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+        self.reviews: Dict[Tuple[str, date], int] = defaultdict(int)
+        self._first_day = first_recent_day(today)
+
+    def location(self, geohash: Optional[str], sign: int = 1):
+        """
+        Records a location added to (sign 1) or removed from (sign -1) its tile.
+
+        Args:
+            geohash (Optional[str]): The geohash of the location.
+            sign (int): 1 or -1. Default is 1.
+        """
+        if tile := tile_of(geohash):
+            self.counts[tile][0] += sign
+
+    def relation(self, geohash: Optional[str], last_reviewed: Optional[datetime], sign: int = 1):
+        """
+        Records a relation, in a given review state, added to (sign 1) or removed from (sign -1) the tile of its location.
+
+        A review is recorded as the removal of the relation in its previous state and the addition in the new one.
+
+        Args:
+            geohash (Optional[str]): The geohash of the location of the relation.
+            last_reviewed (Optional[datetime]): The last review of the relation, or None if it was never reviewed.
+            sign (int): 1 or -1. Default is 1.
+        """
+        tile = tile_of(geohash)
+        if tile is None:
+            return
+        counts = self.counts[tile]
+        counts[1] += sign
+        if last_reviewed is None:
+            counts[2] += sign
+        elif last_reviewed.date() >= self._first_day:
+            self.reviews[(tile, last_reviewed.date())] += sign
+
+    async def apply(self, db: AsyncSession):
+        """
+        Writes the accumulated changes and forgets them. The caller owns the transaction; nothing is committed here.
+
+        Args:
+            db (AsyncSession): The database session.
+        """
+        tiles = [{"geohash": tile, "locations": locations, "relations": relations, "never_reviewed": never_reviewed}
+                 for tile, (locations, relations, never_reviewed) in self.counts.items() if locations or relations or never_reviewed]
+        reviews = [{"geohash": tile, "day": day, "relations": relations} for (tile, day), relations in self.reviews.items() if relations]
+        for _, chunk in bulk.chunked(tiles, BULK_CHUNK_SIZE):
+            await db.execute(bulk.insert_on_conflict(db, models.Tile, list(chunk), ["geohash"],
+                                                     increment=["locations", "relations", "never_reviewed"]))
+        for _, chunk in bulk.chunked(reviews, BULK_CHUNK_SIZE):
+            await db.execute(bulk.insert_on_conflict(db, models.TileReview, list(chunk), ["geohash", "day"], increment=["relations"]))
+        self.counts.clear()
+        self.reviews.clear()
+
+async def location_geohashes(db: AsyncSession, location_ids: Iterable[int]) -> Dict[int, str]:
+    """
+    Fetches the geohash of locations, to place their new relations in their tiles.
+
+    Args:
+        db (AsyncSession): The database session.
+        location_ids (Iterable[int]): The IDs of the locations.
+
+    Returns:
+        Dict[int, str]: The geohash of each location found.
+    """
+    result = await db.execute(select(models.Location.id, models.Location.geohash).filter(models.Location.id.in_(set(location_ids))))
+    return dict(result.tuples().all())
+
+async def relation_states(db: AsyncSession, relation_ids: Iterable[int]) -> Dict[int, Tuple[str, Optional[datetime]]]:
+    """
+    Fetches the tile placement and review state of relations before a write changes them.
+
+    The relations are locked until the end of the transaction (on PostgreSQL), so concurrent
+    reviews of the same relation apply their tile changes one after the other.
+
+    Args:
+        db (AsyncSession): The database session.
+        relation_ids (Iterable[int]): The IDs of the relations.
+
+    Returns:
+        Dict[int, Tuple[str, Optional[datetime]]]: The geohash of the location and the last review of each relation found.
+    """
+    relation = models.LocationCategoryReviewed
+    result = await db.execute(select(relation.id, models.Location.geohash, relation.last_reviewed)
+                              .join(models.Location, models.Location.id == relation.location_id)
+                              .filter(relation.id.in_(set(relation_ids)))
+                              .with_for_update(of=relation))
+    return {relation_id: (geohash, last_reviewed) for relation_id, geohash, last_reviewed in result.tuples().all()}
+
+async def rebuild(db: AsyncSession) -> int:
+    """
+    Recomputes every tile from the base tables and commits them.
+
+    Writes maintain the tiles incrementally; a rebuild fills them for existing data (or data loaded
+    outside the services), repairs any drift and drops the review days that left the staleness window.
+
+    Args:
+        db (AsyncSession): The database session.
+
+    Returns:
+        int: The number of tiles.
+    """
+    changes = TileChanges()
+    first_day = first_recent_day()
+    tile = func.substr(models.Location.geohash, 1, TILE_PRECISION)
+    relation = models.LocationCategoryReviewed
+
+    result = await db.execute(select(tile, func.count()).filter(models.Location.geohash.is_not(None)).group_by(tile))
+    for geohash, locations in result.tuples():
+        changes.counts[geohash][0] = locations
+    result = await db.execute(select(tile, func.count(), func.sum(case((relation.last_reviewed.is_(None), 1), else_=0)))
+                              .join(relation, relation.location_id == models.Location.id)
+                              .filter(models.Location.geohash.is_not(None)).group_by(tile))
+    for geohash, relations, never_reviewed in result.tuples():
+        changes.counts[geohash][1:] = [relations, never_reviewed]
+    day = func.date(relation.last_reviewed, type_=Date)
+    result = await db.execute(select(tile, day, func.count())
+                              .join(relation, relation.location_id == models.Location.id)
+                              .filter(models.Location.geohash.is_not(None),
+                                      relation.last_reviewed >= datetime.combine(first_day, datetime.min.time()))
+                              .group_by(tile, day))
+    for geohash, reviewed_on, relations in result.tuples():
+        changes.reviews[(geohash, reviewed_on)] = relations
+
+    count = len(changes.counts)
+    await db.execute(delete(models.TileReview))
+    await db.execute(delete(models.Tile))
+    await changes.apply(db)
+    await db.commit()
+    return count
+
+def _tile_cells(precision: int, prefix: Optional[str], bbox: Optional[Tuple[float, float, float, float]]) -> Optional[List[str]]:
+    """
+    Returns the cells, no finer than the requested precision, whose tiles must be read; None reads every tile.
+    """
+    cells = None
+    if bbox is not None:
+        min_latitude, max_latitude, min_longitude, max_longitude = bbox
+        boxes = [(min_longitude, max_longitude)] if min_longitude <= max_longitude else [(min_longitude, 180.0), (-180.0, max_longitude)]
+        cells = {cell[:precision] for west, east in boxes
+                 for cell in geo.bbox_cells(min_latitude, max_latitude, west, east, TILES_MAX_CELLS)}
+    if prefix:
+        cells = {prefix} if cells is None else {cell for cell in cells if cell.startswith(prefix) or prefix.startswith(cell)}
+        cells = {max(cell, prefix, key=len) for cell in cells}
+    return sorted(cells) if cells is not None else None
+
+async def get_tiles(db: AsyncSession, precision: int = 3, prefix: Optional[str] = None,
+                    bbox: Optional[Tuple[float, float, float, float]] = None, today: Optional[date] = None) -> List[schemas.Tile]:
+    """
+    Fetches the location and review counters of the map, aggregated to geohash cells of a precision.
+
+    Only the tile tables are read, so the cost depends on the number of tiles in the area, not on
+    the number of locations or relations.
+
+    Args:
+        db (AsyncSession): The database session.
+        precision (int): The geohash precision of the returned cells, at most TILE_PRECISION. Default is 3.
+        prefix (Optional[str]): Only return the cells inside this geohash cell. Default is None.
+        bbox (Optional[Tuple[float, float, float, float]]): Only return the cells intersecting this
+            (min_latitude, max_latitude, min_longitude, max_longitude) box. Default is None.
+        today (Optional[date]): The current day, which sets the staleness window. Default is today in UTC.
+
+    Returns:
+        List[schemas.Tile]: The cells holding at least one location or relation, ordered by geohash.
+    """
+    precision = min(precision, TILE_PRECISION)
+    cells = _tile_cells(precision, prefix, bbox)
+    if cells == []:
+        return []
+
+    cell = func.substr(models.Tile.geohash, 1, precision)
+    query = (select(cell, func.sum(models.Tile.locations), func.sum(models.Tile.relations), func.sum(models.Tile.never_reviewed))
+             .group_by(cell).order_by(cell))
+    review_cell = func.substr(models.TileReview.geohash, 1, precision)
+    recent_query = (select(review_cell, func.sum(models.TileReview.relations))
+                    .filter(models.TileReview.day >= first_recent_day(today)).group_by(review_cell))
+    if cells is not None:
+        query = query.filter(geo.cells_condition(models.Tile.geohash, cells))
+        recent_query = recent_query.filter(geo.cells_condition(models.TileReview.geohash, cells))
+    recent = dict((await db.execute(recent_query)).tuples().all())
+
+    tiles = []
+    for geohash, locations, relations, never_reviewed in (await db.execute(query)).tuples():
+        if not (locations or relations):
+            continue
+        if bbox is not None and not _intersects(geohash, bbox):
+            continue
+        stale = max(0, relations - never_reviewed - (recent.get(geohash) or 0))
+        tiles.append(schemas.Tile(geohash=geohash, locations=locations, relations=relations,
+                                  never_reviewed=never_reviewed, stale=stale))
+    return tiles
+
+def _intersects(cell: str, bbox: Tuple[float, float, float, float]) -> bool:
+    min_latitude, max_latitude, min_longitude, max_longitude = bbox
+    lat_min, lat_max, lon_min, lon_max = geo.decode_bbox(cell)
+    if lat_max < min_latitude or lat_min > max_latitude:
+        return False
+    if min_longitude <= max_longitude:
+        return lon_max >= min_longitude and lon_min <= max_longitude
+    return lon_max >= min_longitude or lon_min <= max_longitude
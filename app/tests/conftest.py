@@ -1,26 +1,30 @@
 import pytest
 import pytest_asyncio
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from app.main import app as real_app
-from app.config.database import Base, get_db
+from app import migrations
+from app.config.database import Base, get_db, get_read_db
+from app.services import category_search, queries, recommendation_queue
 from app.config.settings import TEST_DATABASE_URL
 from httpx import AsyncClient, ASGITransport
 from asgi_lifespan import LifespanManager
 import asyncio
+from contextlib import contextmanager
 
 engine = create_async_engine(TEST_DATABASE_URL, echo=False,
     pool_size=20,
     max_overflow=40,)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession, expire_on_commit=False)
 
 @pytest_asyncio.fixture(scope="module", autouse=True)
 async def async_db_engine():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    yield conn
+    await migrations.migrate(engine)
+    yield engine
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS schema_version"))
 
 @pytest_asyncio.fixture
 async def app():
@@ -30,8 +34,12 @@ async def app():
         yield session
         
     real_app.dependency_overrides[get_db] = override_get_db
+    real_app.dependency_overrides[get_read_db] = override_get_db
 
     async with LifespanManager(real_app) as manager:
+        async with TestingSessionLocal() as session:
+            await recommendation_queue.warm(session)
+            await category_search.warm(session)
         yield manager.app
 
 @pytest_asyncio.fixture
@@ -40,6 +48,24 @@ async def client(app):
     async with AsyncClient(transport=transport, base_url="http://testserver/api/") as client:
         yield client
 
+@pytest.fixture
+def query_budget():
+    """
+    Asserts the maximum number of SQL statements run inside a block, and that none is repeated (N+1).
+
+    Usage:
+        with query_budget(2):
+            await client.get("/locations/1")
+    """
+    @contextmanager
+    def budget(max_queries: int, allow_repeated: bool = False):
+        with queries.recording() as recorder:
+            yield recorder
+        assert recorder.count <= max_queries, f"Query budget of {max_queries} exceeded:\n{recorder.report()}"
+        if not allow_repeated:
+            assert not recorder.repeated(), f"Repeated queries:\n{recorder.report()}"
+    return budget
+
 @pytest.fixture(scope='session')
 def event_loop():
     loop = asyncio.get_event_loop_policy().new_event_loop()
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+class FakeRedis:
+    """
+    A minimal in-memory server speaking the Redis protocol, with the commands used by the cache backend
+    (PING, AUTH, SELECT, GET, MGET, SET with PX or EX, DEL, PUBLISH and SUBSCRIBE).
+
+    Usage:
+        async with FakeRedis() as server:
+            backend = RedisBackend(server.url)
+    """
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+        self._subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = defaultdict(set)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+    def subscribers(self) -> int:
+        """
+        Returns the number of active subscriptions, over every channel.
+        """
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def drop_connections(self):
+        """
+        Closes every client connection, as a server restart would.
+        """
+        for writer in list(self._connections):
+            writer.close()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[list]:
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                self.commands += 1
+                name = args[0].upper()
+                if name in (b"PING", b"AUTH", b"SELECT"):
+                    writer.write(b"+OK\r\n" if name != b"PING" else b"+PONG\r\n")
+                elif name == b"GET":
+                    writer.write(_bulk(self._get(args[1])))
+                elif name == b"MGET":
+                    writer.write(b"*%d\r\n" % (len(args) - 1) + b"".join(_bulk(self._get(key)) for key in args[1:]))
+                elif name == b"SET":
+                    expiry = None
+                    if len(args) >= 5 and args[3].upper() in (b"PX", b"EX"):
+                        expiry = time.monotonic() + int(args[4]) / (1000 if args[3].upper() == b"PX" else 1)
+                    self.data[args[1]] = (args[2], expiry)
+                    writer.write(b"+OK\r\n")
+                elif name == b"DEL":
+                    writer.write(b":%d\r\n" % sum(self.data.pop(key, None) is not None for key in args[1:]))
+                elif name == b"PUBLISH":
+                    subscribers = self._subscribers[args[1]]
+                    for subscriber in subscribers:
+                        subscriber.write(b"*3\r\n" + _bulk(b"message") + _bulk(args[1]) + _bulk(args[2]))
+                    writer.write(b":%d\r\n" % len(subscribers))
+                elif name == b"SUBSCRIBE":
+                    for index, channel in enumerate(args[1:], start=1):
+                        self._subscribers[channel].add(writer)
+                        writer.write(b"*3\r\n" + _bulk(b"subscribe") + _bulk(channel) + b":%d\r\n" % index)
+                else:
+                    writer.write(b"-ERR unknown command '%s'\r\n" % name)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            for subscribers in self._subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
@@ -1,5 +1,27 @@
+import asyncio
+import json
+import heapq
+import time
 import pytest
+from starlette.requests import Request
 from httpx import AsyncClient
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app import cli, migrations
+from app.main import app as main_app
+from app.config import database
+from app.benchmarks import runner, seed, serialization as benchmark_serialization, startup as benchmark_startup
+from app.schemas import schemas
+from app.services import bulk, cache, category_search, etags, geo, metrics, pagination, queries, tiles
+from app.services import categories as crud_categories, dedup, imports as crud_imports, locations as crud_locations
+from app.tests.conftest import TestingSessionLocal, engine as test_engine
+from app.services.cache import LRUCache
+from app.services.cache_backends import CacheBackend, CacheBackendError, MemoryBackend, RedisBackend
+from app.services.singleflight import SingleFlight
+from app.services.recommendation_queue import RecommendationQueue, queue as recommendation_queue
+from app.tests.fake_redis import FakeRedis
 
 @pytest.mark.asyncio
 async def test_read_root(client: AsyncClient):
@@ -82,6 +104,237 @@ async def test_delete_category(client: AsyncClient):
     get_response = await client.get(f"/categories/{category_id}")
     assert get_response.status_code == 404
     assert get_response.json() == {"detail": "Category not found"}
+
+@pytest.mark.asyncio
+async def test_read_categories_with_cursor(client: AsyncClient):
+    for name in ["Cursor A", "Cursor B", "Cursor C"]:
+        await client.post("/categories/", json={"name": name})
+    all_ids = [category["id"] for category in (await client.get("/categories/")).json()]
+
+    ids = []
+    params = {"limit": 2}
+    while True:
+        response = await client.get("/categories/", params=params)
+        assert response.status_code == 200
+        ids.extend(category["id"] for category in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert ids == all_ids
+
+@pytest.mark.asyncio
+async def test_read_categories_with_invalid_cursor(client: AsyncClient):
+    response = await client.get("/categories/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+    # Well-formed cursors whose values have the wrong type are rejected too.
+    for path, values in [("/categories/", {"id": "x"}), ("/locations/", {"id": [1]}), ("/recommendations/never-reviewed/", {"id": True}),
+                         ("/recommendations/fresh/", {"last_reviewed": 5, "id": 1}), ("/recommendations/fresh/", {"last_reviewed": None, "id": "1"})]:
+        response = await client.get(path, params={"cursor": pagination.encode_cursor(values)})
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+@pytest.mark.asyncio
+async def test_list_limits_are_bounded(client: AsyncClient):
+    for path in ["/categories/", "/locations/", "/recommendations/fresh/", "/recommendations/never-reviewed/", "/recommendations/1/reviews"]:
+        assert (await client.get(path, params={"limit": -1})).status_code == 422
+        assert (await client.get(path, params={"limit": 1001})).status_code == 422
+    assert (await client.get("/locations/", params={"skip": -1})).status_code == 422
+
+@pytest.mark.asyncio
+async def test_category_errors_do_not_leak_details(client: AsyncClient, monkeypatch):
+    async def failing(*args, **kwargs):
+        raise RuntimeError("SELECT secret FROM categories")
+
+    monkeypatch.setattr(crud_categories, "create_category", failing)
+    monkeypatch.setattr(crud_categories, "search_categories", failing)
+    for response in [await client.post("/categories/", json={"name": "Leaky Category"}),
+                     await client.get("/categories/search", params={"q": "leaky"})]:
+        assert response.status_code == 500
+        assert response.json() == {"detail": "An unexpected error occurred"}
+
+@pytest.mark.asyncio
+async def test_read_category_uses_cache(client: AsyncClient):
+    category_id = (await client.post("/categories/", json={"name": "Cached Category"})).json()["id"]
+    await client.get(f"/categories/{category_id}")
+    hits = (await client.get("../cache/stats")).json()["categories"]["hits"]
+
+    response = await client.get(f"/categories/{category_id}")
+    assert response.json()["name"] == "Cached Category"
+    assert (await client.get("../cache/stats")).json()["categories"]["hits"] == hits + 1
+
+    await client.delete(f"/categories/{category_id}")
+    assert (await client.get(f"/categories/{category_id}")).status_code == 404
+
+@pytest.mark.asyncio
+async def test_read_categories_after_create_skips_stale_list(client: AsyncClient):
+    before = (await client.get("/categories/", params={"limit": 1000})).json()
+    await client.post("/categories/", json={"name": "Fresh List Category"})
+    after = (await client.get("/categories/", params={"limit": 1000})).json()
+    assert len(after) == len(before) + 1
+
+@pytest.mark.asyncio
+async def test_read_categories_conditional_get(client: AsyncClient):
+    response = await client.get("/categories/")
+    etag = response.headers["ETag"]
+
+    not_modified = await client.get("/categories/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+    await client.post("/categories/", json={"name": "ETag Category"})
+    modified = await client.get("/categories/", headers={"If-None-Match": etag})
+    assert modified.status_code == 200
+    assert modified.headers["ETag"] != etag
+
+@pytest.mark.asyncio
+async def test_read_category_conditional_get(client: AsyncClient):
+    category_id = (await client.post("/categories/", json={"name": "ETag Detail Category"})).json()["id"]
+    etag = (await client.get(f"/categories/{category_id}")).headers["ETag"]
+    assert (await client.get(f"/categories/{category_id}", headers={"If-None-Match": etag})).status_code == 304
+    other = await client.get(f"/categories/{category_id - 1}", headers={"If-None-Match": etag})
+    assert other.status_code != 304
+
+def test_lru_cache_evicts_and_expires():
+    now = [0.0]
+    lru = LRUCache("test", maxsize=2, ttl=10, clock=lambda: now[0])
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b", None) is None
+    assert lru.get("a") == 1
+    now[0] = 11
+    assert lru.get("a", None) is None
+    assert lru.stats()["evictions"] == 1
+    assert lru.stats()["hits"] == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_concurrent_calls():
+    group = SingleFlight("test", window=0)
+    release = asyncio.Event()
+    runs = []
+
+    async def call():
+        runs.append(1)
+        await release.wait()
+        return b"[]"
+
+    waiting = [asyncio.ensure_future(group.do("key", call)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*waiting) == [b"[]"] * 5
+    assert len(runs) == 1
+    assert group.stats() == {"leaders": 1, "shared": 4, "hits": 0, "in_flight": 0}
+    # Without a window, a later call runs again.
+    await group.do("key", call)
+    assert len(runs) == 2
+
+@pytest.mark.asyncio
+async def test_single_flight_errors_cancellation_and_window():
+    now = [0.0]
+    group = SingleFlight("test", window=1, clock=lambda: now[0])
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise ValueError("boom")
+
+    waiting = [asyncio.ensure_future(group.do("error", fail)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiting, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+    # A cancelled leader hands the call over to a follower.
+    release.clear()
+    async def slow():
+        await release.wait()
+        return 42
+    leader = asyncio.ensure_future(group.do("slow", slow))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(group.do("slow", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await follower == 42
+
+    # Within the window the result is reused without running the call.
+    assert await group.do("slow", slow) == 42
+    assert group.stats()["hits"] == 1
+    now[0] = 2
+    assert await group.do("slow", slow) == 42
+    assert group.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_search_categories(client: AsyncClient):
+    created = [(await client.post("/categories/", json={"name": name})).json() for name in ["Qwaxi Café", "Museo Qwaxi", "Qwaxinar"]]
+    response = await client.get("/categories/search", params={"q": "QWAXI"})
+    assert response.status_code == 200
+    assert [category["name"] for category in response.json()] == ["Qwaxi Café", "Qwaxinar", "Museo Qwaxi"]
+    assert response.json()[0] == created[0]
+    assert (await client.get("/categories/search", params={"q": "qwaxi cafe"})).json()[0]["name"] == "Qwaxi Café"
+    assert (await client.get("/categories/search", params={"q": "qwaxy cafe"})).json()[0]["name"] == "Qwaxi Café"
+    assert len((await client.get("/categories/search", params={"q": "qwaxi", "limit": 1})).json()) == 1
+
+    etag = response.headers["ETag"]
+    assert (await client.get("/categories/search", params={"q": "QWAXI"}, headers={"If-None-Match": etag})).status_code == 304
+    await client.delete(f"/categories/{created[1]['id']}")
+    response = await client.get("/categories/search", params={"q": "QWAXI"}, headers={"If-None-Match": etag})
+    assert [category["name"] for category in response.json()] == ["Qwaxi Café", "Qwaxinar"]
+    assert (await client.get("/categories/search", params={"q": ""})).status_code == 422
+
+def test_category_index_prefix_fuzzy_and_changes():
+    index = category_search.CategoryIndex()
+    index.ready = True
+    now = datetime.utcnow()
+    names = [f"Categoría {number:05d}" for number in range(30000)] + ["Parque Nacional", "Gran Parque", "Parqueadero"]
+    index.upsert(category_search.Category(category_id, name, now) for category_id, name in enumerate(names, start=1))
+    assert len(index) == 30003
+
+    def search(query, limit=10):
+        return [category.name for category in index.search(query, limit)]
+
+    assert search("parque") == ["Parque Nacional", "Parqueadero", "Gran Parque"]
+    assert search("categoria 0001", 3) == ["Categoría 00010", "Categoría 00011", "Categoría 00012"]
+    assert search("parqeu nacional")[0] == "Parque Nacional"
+    assert search("zzzz") == []
+
+    index.upsert([category_search.Category(30002, "Pequeño Parque", now)])
+    index.remove(30001)
+    assert search("parque") == ["Parqueadero", "Pequeño Parque"]
+    index.apply_message({"op": "upsert", "categories": [[30001, "Parque Central", str(now)]]})
+    index.apply_message({"op": "remove", "ids": [30003]})
+    assert search("parque") == ["Parque Central", "Pequeño Parque"]
+
+    start = time.perf_counter()
+    for query in ["cat", "categoria 123", "parqe", "catgoria 0042"]:
+        for _ in range(25):
+            index.search(query, 10)
+    assert (time.perf_counter() - start) / 100 < 0.005
+
+@pytest.mark.asyncio
+async def test_create_categories_bulk(client: AsyncClient):
+    names = ["Bulk A", "Test Category", "Bulk B", "Bulk A"]
+    response = await client.post("/categories/bulk", json=[{"name": name} for name in names])
+    assert response.status_code == 200
+    data = response.json()
+    assert [category["name"] for category in data["created"]] == ["Bulk A", "Bulk B"]
+    assert data["errors"] == [
+        {"index": 1, "detail": "Category name must be unique"},
+        {"index": 3, "detail": "Category name must be unique"},
+    ]
+
+@pytest.mark.asyncio
+async def test_export_categories_csv(client: AsyncClient):
+    response = await client.get("/categories/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "id,name,created_at"
+    names = [line.split(",")[1] for line in lines[1:]]
+    assert names == [category["name"] for category in (await client.get("/categories/", params={"limit": 1000})).json()]
 #endregion
 
 ########################################################################################
@@ -146,6 +399,196 @@ async def test_delete_location(client: AsyncClient):
     get_response = await client.get(f"/locations/{location_id}")
     assert get_response.status_code == 404
     assert get_response.json() == {"detail": "Location not found"}
+
+@pytest.mark.asyncio
+async def test_read_nearby_locations(client: AsyncClient):
+    for latitude, longitude in [(10.001, 20.0), (10.05, 20.0), (-33.45, -70.66)]:
+        await client.post("/locations/", json={"latitude": latitude, "longitude": longitude})
+
+    response = await client.get("/locations/nearby", params={"latitude": 10.0, "longitude": 20.0, "k": 3})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 3
+    distances = [item["distance_km"] for item in data]
+    assert distances == sorted(distances)
+    assert all(distance < 6 for distance in distances)
+
+@pytest.mark.asyncio
+async def test_read_nearby_locations_within_radius(client: AsyncClient):
+    response = await client.get("/locations/nearby", params={"latitude": -33.45, "longitude": -70.66, "radius_km": 5})
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["latitude"] == -33.45
+    assert data[0]["distance_km"] == pytest.approx(0.0)
+
+@pytest.mark.asyncio
+async def test_create_locations_bulk(client: AsyncClient):
+    locations = [{"latitude": 1.0 + index, "longitude": 2.0 + index} for index in range(5)]
+    response = await client.post("/locations/bulk", json=locations)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["errors"] == []
+    assert [(item["latitude"], item["longitude"]) for item in data["created"]] == [(item["latitude"], item["longitude"]) for item in locations]
+    assert len({item["id"] for item in data["created"]}) == 5
+
+@pytest.mark.asyncio
+async def test_create_locations_dedup(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(crud_locations, "LOCATION_DEDUP_METERS", 10.0)
+    monkeypatch.setattr(crud_imports, "LOCATION_DEDUP_METERS", 10.0)
+    first = (await client.post("/locations/", json={"latitude": -33.8568, "longitude": 151.2153}))
+    assert first.status_code == 201
+    # About 5 metres north: the same place.
+    again = await client.post("/locations/", json={"latitude": -33.85675, "longitude": 151.2153})
+    assert again.status_code == 200
+    assert again.json() == first.json()
+    assert (await client.post("/locations/", json={"latitude": -33.8573, "longitude": 151.2153})).status_code == 201
+
+    response = await client.post("/locations/bulk", json=[{"latitude": -33.85682, "longitude": 151.21532}, {"latitude": -33.86, "longitude": 151.22},
+                                                          {"latitude": -33.86001, "longitude": 151.22001}])
+    data = response.json()
+    assert data["merged"] == [0, 2]
+    assert data["created"][0]["id"] == first.json()["id"]
+    assert data["created"][1]["id"] == data["created"][2]["id"] != first.json()["id"]
+
+    body = "latitude,longitude,categories\n-33.85681,151.21531,Dedup Opera|Dedup Harbour\n-33.85679,151.21529,Dedup Opera\n"
+    data = (await client.post("/imports/locations", params={"format": "csv"}, content=body)).json()
+    assert (data["created_locations"], data["merged_locations"], data["created_relations"]) == (0, 2, 2)
+    relations = (await client.get("/recommendations/never-reviewed/", params={"limit": 1000})).json()
+    assert sum(relation["location_id"] == first.json()["id"] for relation in relations) == 2
+
+def test_location_grid_plan():
+    grid = dedup.LocationGrid(10)
+    grid.add(7, 4.711, -74.072)
+    plan = grid.plan([(4.71103, -74.07201), (4.72, -74.08), (4.72005, -74.08), (4.711, -74.0722)])
+    assert plan == dedup.DedupPlan(new=[1, 3], existing={0: 7}, repeated={2: 1})
+
+def test_compact_locations_command_needs_shared_cache(monkeypatch, capsys):
+    monkeypatch.setattr(cli, "CACHE_BACKEND_URL", "memory://")
+    with pytest.raises(SystemExit):
+        cli.main(["compact-locations", "--meters", "10"])
+    assert "--without-shared-cache" in capsys.readouterr().err
+
+@pytest.mark.asyncio
+async def test_compact_locations(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'compact.db'}")
+    try:
+        await migrations.migrate(engine)
+        async with engine.begin() as conn:
+            await conn.execute(text("INSERT INTO locations (id, latitude, longitude, geohash) VALUES (:id, :latitude, :longitude, :geohash)"), [
+                {"id": location_id, "latitude": latitude, "longitude": longitude, "geohash": geo.encode(latitude, longitude)}
+                for location_id, latitude, longitude in [(1, 4.711, -74.072), (2, 4.71102, -74.07201), (3, 4.71101, -74.072), (4, 4.8, -74.1)]
+            ])
+            await conn.execute(text("INSERT INTO categories (id, name) VALUES (1, 'Parks'), (2, 'Museums')"))
+            await conn.execute(text("INSERT INTO location_category_reviewed (id, location_id, category_id, last_reviewed) VALUES "
+                                    "(1, 1, 1, '2024-01-01 00:00:00'), (2, 2, 1, '2024-03-01 00:00:00'), (3, 2, 2, NULL), "
+                                    "(4, 3, 2, NULL), (5, 4, 1, NULL)"))
+            await conn.execute(text("INSERT INTO reviews (relation_id, reviewed_at) VALUES (1, '2024-01-01 00:00:00'), (2, '2024-03-01 00:00:00')"))
+
+        async with AsyncSession(engine, expire_on_commit=False) as db:
+            assert await dedup.compact_locations(db, 10) == {"merged_locations": 2, "merged_relations": 2, "moved_relations": 1}
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT id FROM locations ORDER BY id"))).scalars().all() == [1, 4]
+            relations = (await conn.execute(text("SELECT id, location_id, category_id, last_reviewed FROM location_category_reviewed ORDER BY id"))).all()
+            assert [(relation_id, location_id, category_id, str(last_reviewed)[:10]) for relation_id, location_id, category_id, last_reviewed in relations] == [
+                (1, 1, 1, "2024-03-01"), (3, 1, 2, "None"), (5, 4, 1, "None")]
+            assert (await conn.execute(text("SELECT relation_id FROM reviews"))).scalars().all() == [1, 1]
+            assert (await conn.execute(text("SELECT sum(locations), sum(relations), sum(never_reviewed) FROM tiles"))).one() == (2, 3, 2)
+        async with AsyncSession(engine) as db:
+            assert await dedup.compact_locations(db, 10) == {"merged_locations": 0, "merged_relations": 0, "moved_relations": 0}
+    finally:
+        await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_export_locations_ndjson(client: AsyncClient):
+    response = await client.get("/locations/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == (await client.get("/locations/", params={"limit": 1000})).json()
+
+@pytest.mark.asyncio
+async def test_location_query_budgets(client: AsyncClient, query_budget):
+    # The insert and the upsert of its tile.
+    with query_budget(2):
+        location_id = (await client.post("/locations/", json={"latitude": 11.0, "longitude": 11.0})).json()["id"]
+    with query_budget(1):
+        await client.get(f"/locations/{location_id}")
+    with query_budget(0):
+        await client.get(f"/locations/{location_id}")
+    with query_budget(1):
+        await client.get("/locations/", params={"limit": 1000})
+
+@pytest.mark.asyncio
+async def test_read_locations_by_ids(client: AsyncClient, query_budget):
+    created = (await client.post("/locations/bulk", json=[{"latitude": 13.0 + index, "longitude": 13.0} for index in range(3)])).json()["created"]
+    ids = [location["id"] for location in created]
+    # Requested in any order, with repeated and missing IDs: one query loads every location not cached.
+    with query_budget(1):
+        response = await client.get("/locations/", params={"ids": f"{ids[2]},{ids[0]},999999,{ids[2]},{ids[1]}"})
+    assert response.status_code == 200
+    assert [location["id"] for location in response.json()] == [ids[2], ids[0], ids[1]]
+    with query_budget(1):
+        await client.get("/locations/", params={"ids": ",".join(map(str, ids + [999999]))})
+
+    categories = (await client.post("/categories/bulk", json=[{"name": f"Batch Category {index}"} for index in range(2)])).json()["created"]
+    response = await client.get("/categories/", params={"ids": f"{categories[1]['id']},{categories[0]['id']}"})
+    assert response.json() == [categories[1], categories[0]]
+
+    assert (await client.get("/locations/", params={"ids": "1,a"})).status_code == 422
+    assert (await client.get("/categories/", params={"ids": ",".join(map(str, range(1, 1100)))})).status_code == 400
+
+@pytest.mark.asyncio
+async def test_read_viewport_points_and_clusters(client: AsyncClient):
+    locations = [{"latitude": -40.0 + index * 0.01, "longitude": -150.0 + index * 0.01} for index in range(6)]
+    locations += [{"latitude": -45.0, "longitude": -140.0}]
+    await client.post("/locations/bulk", json=locations)
+    bbox = {"min_latitude": -46, "max_latitude": -39, "min_longitude": -151, "max_longitude": -139}
+
+    response = await client.get("/locations/viewport", params={**bbox, "zoom": 4})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 7
+    assert len(data["points"]) == 7
+    assert data["clusters"] == []
+
+    data = (await client.get("/locations/viewport", params={**bbox, "zoom": 4, "max_points": 3})).json()
+    assert data["points"] == []
+    assert data["precision"] == geo.precision_for_zoom(4)
+    assert sorted(cluster["count"] for cluster in data["clusters"]) == [1, 6]
+    cluster = max(data["clusters"], key=lambda cluster: cluster["count"])
+    assert cluster["latitude"] == pytest.approx(-39.975)
+    assert cluster["longitude"] == pytest.approx(-149.975)
+    assert geo.encode(cluster["latitude"], cluster["longitude"]).startswith(cluster["geohash"])
+
+@pytest.mark.asyncio
+async def test_read_viewport_across_antimeridian(client: AsyncClient):
+    await client.post("/locations/bulk", json=[{"latitude": -60.0, "longitude": 179.9}, {"latitude": -60.0, "longitude": -179.9}])
+    response = await client.get("/locations/viewport", params={"min_latitude": -61, "max_latitude": -59, "min_longitude": 179,
+                                                               "max_longitude": -179, "zoom": 8})
+    assert response.status_code == 200
+    assert sorted(point["longitude"] for point in response.json()["points"]) == [-179.9, 179.9]
+
+@pytest.mark.asyncio
+async def test_read_viewport_by_category(client: AsyncClient):
+    location_ids = [item["id"] for item in (await client.post("/locations/bulk", json=[{"latitude": -70.0, "longitude": 100.0 + index * 0.001}
+                                                                                      for index in range(3)])).json()["created"]]
+    category_ids = [(await client.post("/categories/", json={"name": f"Viewport {name}"})).json()["id"] for name in ("A", "B")]
+    for location_id in location_ids:
+        await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_ids[0]})
+    await client.post("/recommendations/", json={"location_id": location_ids[0], "category_id": category_ids[1]})
+    bbox = {"min_latitude": -71, "max_latitude": -69, "min_longitude": 99, "max_longitude": 101, "zoom": 5, "max_points": 0}
+
+    data = (await client.get("/locations/viewport", params={**bbox, "by_category": True})).json()
+    assert [(cluster["category_id"], cluster["count"]) for cluster in data["clusters"]] == [(category_ids[0], 3), (category_ids[1], 1)]
+    data = (await client.get("/locations/viewport", params={**bbox, "category_id": category_ids[1], "max_points": 10})).json()
+    assert [point["id"] for point in data["points"]] == [location_ids[0]]
+
+@pytest.mark.asyncio
+async def test_read_viewport_invalid_bbox(client: AsyncClient):
+    response = await client.get("/locations/viewport", params={"min_latitude": 10, "max_latitude": 0, "min_longitude": 0,
+                                                               "max_longitude": 10, "zoom": 3})
+    assert response.status_code == 400
 #endregion
 
 ########################################################################################
@@ -238,6 +681,809 @@ async def test_delete_review(client: AsyncClient):
     get_response = await client.get(f"/recommendations/{review_id}")
     assert get_response.status_code == 404
     assert get_response.json() == {"detail": "Review not found"}
+
+@pytest.mark.asyncio
+async def test_get_fresh_recommendations_with_cursor(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 6.0, "longitude": 6.0})).json()["id"]
+    for name in ["Cursor Relation A", "Cursor Relation B", "Cursor Relation C"]:
+        category_id = (await client.post("/categories/", json={"name": name})).json()["id"]
+        await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})
+
+    first_page = await client.get("/recommendations/fresh/", params={"limit": 2})
+    assert first_page.status_code == 200
+    assert len(first_page.json()) == 2
+    cursor = first_page.headers["X-Next-Cursor"]
+
+    second_page = await client.get("/recommendations/fresh/", params={"limit": 2, "cursor": cursor})
+    assert second_page.status_code == 200
+    first_ids = {relation["id"] for relation in first_page.json()}
+    assert second_page.json()
+    assert first_ids.isdisjoint(relation["id"] for relation in second_page.json())
+
+@pytest.mark.asyncio
+async def test_create_relations_bulk(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 5.0, "longitude": 5.0})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Bulk Relation Category"})).json()["id"]
+    relations = [
+        {"location_id": location_id, "category_id": category_id},
+        {"location_id": 999999, "category_id": category_id},
+        {"location_id": location_id, "category_id": 999999},
+    ]
+    response = await client.post("/recommendations/bulk", json=relations)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["created"]) == 1
+    assert data["created"][0]["location_id"] == location_id
+    assert data["created"][0]["last_reviewed"] is None
+    assert data["errors"] == [
+        {"index": 1, "detail": "Location not found"},
+        {"index": 2, "detail": "Category not found"},
+    ]
+
+    response = await client.post("/recommendations/bulk", json=relations[:1])
+    assert response.json()["errors"] == [{"index": 0, "detail": "Relation already exists"}]
+
+@pytest.mark.asyncio
+async def test_create_relation_is_unique_per_pair(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 7.0, "longitude": 7.0})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Unique Pair Category"})).json()["id"]
+    first = await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})
+    second = await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})
+    assert first.json()["id"] == second.json()["id"]
+
+    reviewed = await client.post("/recommendations/with-review/", json={"location_id": location_id, "category_id": category_id})
+    assert reviewed.status_code == 201
+    assert reviewed.json()["id"] == first.json()["id"]
+    assert reviewed.json()["last_reviewed"] is not None
+
+@pytest.mark.asyncio
+async def test_get_review_history(client: AsyncClient):
+    relation_id = (await client.post("/recommendations/", json={"location_id": 1, "category_id": 1})).json()["id"]
+    await client.post(f"/recommendations/{relation_id}/review")
+    await client.post(f"/recommendations/{relation_id}/review")
+
+    response = await client.get(f"/recommendations/{relation_id}/reviews")
+    assert response.status_code == 200
+    reviews = response.json()
+    assert len(reviews) >= 2
+    assert all(review["relation_id"] == relation_id for review in reviews)
+    assert reviews[0]["reviewed_at"] == (await client.get(f"/recommendations/{relation_id}")).json()["last_reviewed"]
+
+@pytest.mark.asyncio
+async def test_recommendations_follow_reviews(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 8.0, "longitude": 8.0})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Queue Category"})).json()["id"]
+    relation_id = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})).json()["id"]
+    never_reviewed = (await client.get("/recommendations/never-reviewed/", params={"limit": 1000})).json()
+    assert relation_id in [relation["id"] for relation in never_reviewed]
+
+    await client.post(f"/recommendations/{relation_id}/review")
+    never_reviewed = (await client.get("/recommendations/never-reviewed/", params={"limit": 1000})).json()
+    fresh = (await client.get("/recommendations/fresh/", params={"limit": 1000})).json()
+    assert relation_id not in [relation["id"] for relation in never_reviewed]
+    assert relation_id not in [relation["id"] for relation in fresh]
+
+@pytest.mark.asyncio
+async def test_create_reviews_bulk(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 9.0, "longitude": 9.0})).json()["id"]
+    first_category = (await client.post("/categories/", json={"name": "Bulk Review One"})).json()["id"]
+    second_category = (await client.post("/categories/", json={"name": "Bulk Review Two"})).json()["id"]
+    first = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": first_category})).json()["id"]
+    second = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": second_category})).json()["id"]
+
+    response = await client.post("/recommendations/review/bulk", json=[
+        {"id": first},
+        {"id": second, "reviewed_at": "2024-01-02T03:04:05"},
+        {"id": 999999},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["missing"] == [999999]
+    reviewed = {relation["id"]: relation["last_reviewed"] for relation in data["reviewed"]}
+    assert set(reviewed) == {first, second}
+    assert reviewed[second] == "2024-01-02T03:04:05"
+    assert reviewed[first] is not None
+
+    # An older review is recorded in the history but does not move last_reviewed back.
+    response = await client.post("/recommendations/review/bulk", json=[{"id": first, "reviewed_at": "2020-01-01T00:00:00"}])
+    assert response.json()["reviewed"][0]["last_reviewed"] == reviewed[first]
+    assert len((await client.get(f"/recommendations/{first}/reviews")).json()) == 2
+
+    never_reviewed = (await client.get("/recommendations/never-reviewed/", params={"limit": 1000})).json()
+    assert not {first, second} & {relation["id"] for relation in never_reviewed}
+
+@pytest.mark.asyncio
+async def test_create_reviews_bulk_normalises_timestamps(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 9.5, "longitude": 9.5})).json()["id"]
+    first_category = (await client.post("/categories/", json={"name": "Offset Review One"})).json()["id"]
+    second_category = (await client.post("/categories/", json={"name": "Offset Review Two"})).json()["id"]
+    first = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": first_category})).json()["id"]
+    second = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": second_category})).json()["id"]
+
+    before = datetime.utcnow()
+    response = await client.post("/recommendations/review/bulk", json=[
+        {"id": first, "reviewed_at": "2024-03-01T10:00:00+02:00"},
+        {"id": second, "reviewed_at": "2999-01-01T00:00:00"},
+    ])
+    reviewed = {relation["id"]: relation["last_reviewed"] for relation in response.json()["reviewed"]}
+    assert reviewed[first] == "2024-03-01T08:00:00"
+    assert (await client.get(f"/recommendations/{first}/reviews")).json()[0]["reviewed_at"] == "2024-03-01T08:00:00"
+    # A review dated in the future is taken as done now.
+    assert before <= datetime.fromisoformat(reviewed[second]) <= datetime.utcnow()
+
+@pytest.mark.asyncio
+async def test_recommendation_query_budgets(client: AsyncClient, query_budget):
+    location_id = (await client.post("/locations/", json={"latitude": 10.0, "longitude": 10.0})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Budget Category"})).json()["id"]
+    # Writes also read the tile of the relation and upsert its counters.
+    with query_budget(3):
+        relation_id = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})).json()["id"]
+    with query_budget(5):
+        await client.post(f"/recommendations/{relation_id}/review")
+    # Reviewed again the same day: the tile counters do not change, so they are not written.
+    with query_budget(3):
+        await client.post("/recommendations/with-review/", json={"location_id": location_id, "category_id": category_id})
+    with query_budget(1):
+        assert (await client.get(f"/recommendations/{relation_id}")).status_code == 200
+    with query_budget(0):
+        await client.get("/recommendations/fresh/", params={"limit": 1000})
+    with query_budget(3):
+        await client.post("/recommendations/review/bulk", json=[{"id": relation_id}])
+
+def test_recommendation_queue_order():
+    queue = RecommendationQueue()
+    queue.ready = True
+    now = datetime(2024, 6, 1)
+    queue.upsert(1, 1, 1, now - timedelta(days=40))
+    queue.upsert(2, 1, 2, None)
+    queue.upsert(3, 1, 3, now - timedelta(days=90))
+    queue.upsert(4, 1, 4, now - timedelta(days=1))
+    queue.upsert(5, 1, 5, None)
+    assert [relation.id for relation in queue.fresh(10, now)] == [2, 5, 3, 1]
+
+    queue.upsert(2, 1, 2, now)
+    queue.remove(3)
+    assert [relation.id for relation in queue.fresh(10, now)] == [5, 1]
+    assert [relation.id for relation in queue.never_reviewed(10)] == [5]
+
+@pytest.mark.asyncio
+async def test_claim_recommendations(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 11.0, "longitude": 11.0})).json()["id"]
+    category_ids = [(await client.post("/categories/", json={"name": f"Lease Category {index}"})).json()["id"] for index in range(4)]
+    relation_ids = [(await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})).json()["id"]
+                    for category_id in category_ids]
+
+    # Claim everything due, twice: the second reviewer never gets a relation the first one holds.
+    first = (await client.post("/recommendations/claim", json={"reviewer": "ana", "limit": 1000})).json()
+    second = (await client.post("/recommendations/claim", json={"reviewer": "luis", "limit": 1000})).json()
+    assert set(relation_ids) <= {relation["id"] for relation in first}
+    assert not {relation["id"] for relation in first} & {relation["id"] for relation in second}
+    assert all(relation["leased_by"] == "ana" and relation["leased_until"] for relation in first)
+    fresh = (await client.get("/recommendations/fresh/", params={"limit": 1000})).json()
+    assert not set(relation_ids) & {relation["id"] for relation in fresh}
+
+    # Only the holder renews or releases a lease.
+    assert (await client.post("/recommendations/leases/renew", json={"reviewer": "luis", "ids": relation_ids})).json() == []
+    renewed = (await client.post("/recommendations/leases/renew", json={"reviewer": "ana", "ids": relation_ids, "lease_seconds": 600})).json()
+    assert {relation["id"] for relation in renewed} == set(relation_ids)
+    released = (await client.post("/recommendations/leases/release", json={"reviewer": "ana", "ids": relation_ids[:2]})).json()
+    assert {relation["id"] for relation in released} == set(relation_ids[:2])
+    assert all(relation["leased_by"] is None for relation in released)
+    claimed = (await client.post("/recommendations/claim", json={"reviewer": "luis", "limit": 1000})).json()
+    assert {relation["id"] for relation in claimed} == set(relation_ids[:2])
+
+    # A review ends the lease.
+    assert (await client.post(f"/recommendations/{relation_ids[2]}/review")).status_code == 201
+    renewed = (await client.post("/recommendations/leases/renew", json={"reviewer": "ana", "ids": relation_ids})).json()
+    assert [relation["id"] for relation in renewed] == [relation_ids[3]]
+
+    await client.post("/recommendations/leases/release", json={"reviewer": "ana", "ids": [relation["id"] for relation in first]})
+    await client.post("/recommendations/leases/release", json={"reviewer": "luis", "ids": [relation["id"] for relation in second + claimed]})
+
+@pytest.mark.asyncio
+async def test_claim_recommendations_limits_lease(client: AsyncClient):
+    response = await client.post("/recommendations/claim", json={"reviewer": "ana", "lease_seconds": 10 ** 6})
+    assert response.status_code == 400
+    response = await client.post("/recommendations/claim", json={"reviewer": ""})
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_failed_claim_gives_relations_back(client: AsyncClient, monkeypatch):
+    location_id = (await client.post("/locations/", json={"latitude": 11.5, "longitude": 11.5})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Failed Claim Category"})).json()["id"]
+    relation_id = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})).json()["id"]
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(bulk, "execute_returning", fail)
+        assert (await client.post("/recommendations/claim", json={"reviewer": "ana", "limit": 1000})).status_code == 500
+    fresh = (await client.get("/recommendations/fresh/", params={"limit": 1000})).json()
+    assert relation_id in [relation["id"] for relation in fresh]
+
+def test_recommendation_queue_unclaim():
+    queue = RecommendationQueue()
+    queue.ready = True
+    now = datetime(2024, 6, 1)
+    until = now + timedelta(minutes=5)
+    for relation_id in range(1, 4):
+        queue.upsert(relation_id, 1, relation_id, None)
+    assert queue.claim(3, until, now) == [1, 2, 3]
+    # Relation 3 was leased by another process in the meantime: that lease is kept.
+    queue.lease([3], until + timedelta(seconds=1))
+    queue.unclaim([2, 3], until)
+    assert [relation.id for relation in queue.fresh(10, now)] == [2]
+
+@pytest.mark.asyncio
+async def test_fresh_recommendations_coalesce_identical_requests(client: AsyncClient):
+    responses = await asyncio.gather(*(client.get("/recommendations/fresh/", params={"limit": 50}) for _ in range(5)))
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.content for response in responses}) == 1
+    categories = await asyncio.gather(*(client.get("/categories/", params={"limit": 50}) for _ in range(5)))
+    assert len({response.content for response in categories}) == 1
+
+    # A write changes the key, so the next request never reuses the previous body.
+    location_id = (await client.post("/locations/", json={"latitude": 12.0, "longitude": 12.0})).json()["id"]
+    category_id = (await client.post("/categories/", json={"name": "Coalesced Category"})).json()["id"]
+    relation_id = (await client.post("/recommendations/", json={"location_id": location_id, "category_id": category_id})).json()["id"]
+    fresh = (await client.get("/recommendations/fresh/", params={"limit": 1000})).json()
+    assert relation_id in [relation["id"] for relation in fresh]
+    categories = (await client.get("/categories/", params={"limit": 1000})).json()
+    assert category_id in [category["id"] for category in categories]
+
+def test_recommendation_queue_leases_expire():
+    queue = RecommendationQueue()
+    queue.ready = True
+    now = datetime(2024, 6, 1)
+    for relation_id in range(1, 5):
+        queue.upsert(relation_id, 1, relation_id, None)
+    assert queue.claim(2, now + timedelta(minutes=5), now) == [1, 2]
+    assert queue.claim(10, now + timedelta(minutes=5), now) == [3, 4]
+    assert queue.fresh(10, now) == []
+    queue.release([2])
+    assert [relation.id for relation in queue.never_reviewed(10, now)] == [2]
+    # Expired leases are claimable again, and a review drops the lease.
+    assert [relation.id for relation in queue.fresh(10, now + timedelta(minutes=5))] == [1, 2, 3, 4]
+    queue.lease([1], now + timedelta(hours=1))
+    queue.upsert(1, 1, 1, now)
+    queue.upsert(1, 1, 1, None)
+    assert [relation.id for relation in queue.fresh(10, now)][0] == 1
+
+def test_recommendation_queue_claims_skip_leases_once(monkeypatch):
+    queue = RecommendationQueue()
+    queue.ready = True
+    now = datetime(2024, 6, 1)
+    for relation_id in range(1, 2001):
+        queue.upsert(relation_id, 1, relation_id, None if relation_id % 2 else now - timedelta(days=40 + relation_id))
+    pops = []
+    heappop = heapq.heappop
+    monkeypatch.setattr(heapq, "heappop", lambda heap: pops.append(1) or heappop(heap))
+
+    # Each claim only visits its own relations and the ones leased by the previous claim, however many leases are held.
+    claimed = []
+    for _ in range(180):
+        pops.clear()
+        claimed += queue.claim(10, now + timedelta(minutes=5), now)
+        assert len(pops) <= 40
+    assert len(claimed) == len(set(claimed)) == 1800
+    assert len(queue.fresh(1000, now)) == 200
+
+    # Released and expired leases are back in the queue.
+    queue.release(claimed[:5])
+    assert [relation.id for relation in queue.never_reviewed(5, now)] == sorted(claimed[:5])
+    assert len(queue.fresh(2000, now + timedelta(minutes=5))) == 2000
+# endregion
+
+########################################################################################
+# region Imports
+########################################################################################
+
+@pytest.mark.asyncio
+async def test_import_locations_csv(client: AsyncClient):
+    body = "latitude,longitude,categories\n4.6,-74.08,Import Park|Import Museum\nnot-a-number,-74.1,\n4.7,-74.05,Import Park\n"
+    response = await client.post("/imports/locations", params={"format": "csv"}, content=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed"] == 3
+    assert data["next_offset"] == 3
+    assert data["created_locations"] == 2
+    assert data["created_categories"] == 2
+    assert data["created_relations"] == 3
+    assert data["error_count"] == 1
+    assert data["errors"][0]["index"] == 1
+
+@pytest.mark.asyncio
+async def test_import_csv_quoted_newlines():
+    async def chunks():
+        yield b'latitude,longitude,categories\r\n4.6,-74.08,"Import\r\n\r\nMultiline ""Park"""\r\n'
+        yield b'\r\n4.7,-74.05,Import Zoo\r\n4.8,-74.0,"Import Open'
+
+    records = [record async for record in crud_imports.iter_records(crud_imports.iter_lines(chunks()), "csv")]
+    assert records == [
+        {"latitude": "4.6", "longitude": "-74.08", "categories": 'Import\n\nMultiline "Park"'},
+        {"latitude": "4.7", "longitude": "-74.05", "categories": "Import Zoo"},
+        {"_error": "Line 7: unterminated quoted field"},
+    ]
+
+@pytest.mark.asyncio
+async def test_import_locations_indexes_new_categories(client: AsyncClient):
+    body = '{"latitude": 4.61, "longitude": -74.07, "categories": ["Zumbrel Imported Garden"]}\n'
+    assert (await client.post("/imports/locations", content=body)).json()["created_categories"] == 1
+    found = (await client.get("/categories/search", params={"q": "zumbrel"})).json()
+    assert [category["name"] for category in found] == ["Zumbrel Imported Garden"]
+
+@pytest.mark.asyncio
+async def test_import_locations_resumes_after_failed_batch(client: AsyncClient, monkeypatch):
+    lines = [f'{{"latitude": -31.{index}, "longitude": 151.{index}, "categories": ["Resume Batch {index}"]}}' for index in range(5)]
+
+    async def records(lines):
+        for line in lines:
+            yield line
+
+    apply = tiles.TileChanges.apply
+    calls = []
+
+    async def failing_apply(self, db):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        await apply(self, db)
+
+    monkeypatch.setattr(tiles.TileChanges, "apply", failing_apply)
+    async with TestingSessionLocal() as db:
+        result = await crud_imports.import_locations(db, crud_imports.iter_records(records(lines), "ndjson"), batch_size=2, dedup_meters=0)
+    assert result.next_offset == 2
+    assert result.created_locations == 2
+    assert result.failure is not None
+    monkeypatch.setattr(tiles.TileChanges, "apply", apply)
+
+    async with TestingSessionLocal() as db:
+        resumed = await crud_imports.import_locations(db, crud_imports.iter_records(records(lines), "ndjson"), offset=result.next_offset,
+                                                      batch_size=2, dedup_meters=0)
+    assert resumed.failure is None
+    assert resumed.next_offset == 5
+    assert resumed.created_locations == 3
+    found = (await client.get("/categories/search", params={"q": "resume batch", "limit": 100})).json()
+    assert sorted(category["name"] for category in found) == [f"Resume Batch {index}" for index in range(5)]
+
+@pytest.mark.asyncio
+async def test_import_categories_ndjson_with_offset(client: AsyncClient):
+    body = '{"name": "Import Skipped"}\n{"name": "Import Park"}\n{"name": "Import Zoo"}\nnot json\n'
+    response = await client.post("/imports/categories", params={"offset": 1}, content=body)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed"] == 3
+    assert data["created_categories"] == 1
+    assert [error["index"] for error in data["errors"]] == [1, 3]
+    names = [category["name"] for category in (await client.get("/categories/", params={"limit": 1000})).json()]
+    assert "Import Zoo" in names
+    assert "Import Skipped" not in names
+# endregion
+
+########################################################################################
+# region Database
+########################################################################################
+
+def _request_with_cookies(cookies: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"cookie", cookies.encode())]})
+
+def test_read_session_factory_routes_to_replica():
+    assert database.read_session_factory(_request_with_cookies("")) is database.ReadSessionLocal
+    stale_write = time.time() - database.READ_YOUR_WRITES_SECONDS - 1
+    assert database.read_session_factory(_request_with_cookies(f"{database.LAST_WRITE_COOKIE}={stale_write}")) is database.ReadSessionLocal
+
+def test_read_session_factory_reads_your_writes():
+    request = _request_with_cookies(f"{database.LAST_WRITE_COOKIE}={time.time()}")
+    assert database.read_session_factory(request) is database.SessionLocal
+
+@pytest.mark.asyncio
+async def test_replica_reads_do_not_fill_caches(app, client: AsyncClient, tmp_path, monkeypatch):
+    category = (await client.post("/categories/", json={"name": "Lagging Category"})).json()
+
+    # The replica is a copy of the database taken before the category is deleted.
+    replica_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    ReplicaSession = sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False, info={"replica": True})
+    await migrations.migrate(replica_engine)
+    async with replica_engine.begin() as conn:
+        await conn.execute(text("INSERT INTO categories (id, name, created_at) VALUES (:id, :name, :created_at)"),
+                           {"id": category["id"], "name": category["name"], "created_at": datetime.fromisoformat(category["created_at"])})
+
+    async def get_read_db(request: Request):
+        factory = TestingSessionLocal if database.read_session_factory(request) is database.SessionLocal else ReplicaSession
+        async with factory() as session:
+            yield session
+
+    monkeypatch.setitem(main_app.dependency_overrides, database.get_read_db, get_read_db)
+    try:
+        assert (await client.delete(f"/categories/{category['id']}")).status_code == 200
+        client.cookies.clear()
+        assert (await client.get(f"/categories/{category['id']}")).json()["name"] == "Lagging Category"
+        assert category["id"] in [item["id"] for item in (await client.get("/categories/", params={"limit": 1000})).json()]
+
+        # The writer reads from the primary and never gets the row the lagging replica returned.
+        client.cookies.set(database.LAST_WRITE_COOKIE, str(time.time()))
+        assert (await client.get(f"/categories/{category['id']}")).status_code == 404
+        assert category["id"] not in [item["id"] for item in (await client.get("/categories/", params={"limit": 1000})).json()]
+    finally:
+        client.cookies.clear()
+        await replica_engine.dispose()
+
+@pytest.mark.asyncio
+async def test_write_sets_last_write_cookie(client: AsyncClient):
+    response = await client.post("/locations/", json={"latitude": 9.0, "longitude": 9.0})
+    assert database.LAST_WRITE_COOKIE in response.cookies
+    assert database.LAST_WRITE_COOKIE not in (await client.get("/locations/")).headers.get("set-cookie", "")
+
+@pytest.mark.asyncio
+async def test_migrated_schema_matches_models():
+    assert await migrations.check(test_engine) == migrations.latest_version()
+
+    def columns(sync):
+        inspector = inspect(sync)
+        return {table: {column["name"] for column in inspector.get_columns(table)} for table in database.Base.metadata.tables}
+
+    async with test_engine.connect() as conn:
+        existing = await conn.run_sync(columns)
+    assert existing == {name: set(table.columns.keys()) for name, table in database.Base.metadata.tables.items()}
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_database(tmp_path):
+    legacy = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy.db'}")
+    try:
+        assert [migration.version for migration in await migrations.migrate(legacy, target=1)] == [1]
+        with pytest.raises(migrations.SchemaVersionError):
+            await migrations.check(legacy)
+        async with legacy.begin() as conn:
+            await conn.execute(text("INSERT INTO locations (id, latitude, longitude) VALUES (1, 4.711, -74.072), (2, 48.85, 2.35), (3, 48.86, 2.35)"))
+            await conn.execute(text("INSERT INTO categories (id, name) VALUES (1, 'Parks')"))
+            await conn.execute(text("INSERT INTO location_category_reviewed (location_id, category_id, last_reviewed) VALUES "
+                                    "(1, 1, '2024-01-01 00:00:00'), (1, 1, '2024-03-01 00:00:00'), (1, 1, NULL), (2, 1, :recent)"),
+                               {"recent": datetime.utcnow() - timedelta(days=2)})
+
+        applied = await migrations.migrate(legacy)
+        assert [migration.version for migration in applied] == list(range(2, migrations.latest_version() + 1))
+        assert await migrations.migrate(legacy) == []
+        assert await migrations.check(legacy) == migrations.latest_version()
+        async with legacy.connect() as conn:
+            assert (await conn.execute(text("SELECT geohash FROM locations"))).scalar() == geo.encode(4.711, -74.072)
+            relations = (await conn.execute(text("SELECT id, last_reviewed, leased_by FROM location_category_reviewed WHERE location_id = 1"))).all()
+            assert [(relation_id, str(last_reviewed)[:10], leased_by) for relation_id, last_reviewed, leased_by in relations] == [(1, "2024-03-01", None)]
+            assert (await conn.execute(text("SELECT relation_id FROM reviews ORDER BY relation_id"))).scalars().all() == [1, 4]
+            backfilled = [(await conn.execute(text(f"SELECT * FROM {table} ORDER BY geohash"))).all() for table in ("tiles", "tile_reviews")]
+        assert [(locations, relations) for _, locations, relations, _ in backfilled[0]] == [(1, 1), (2, 1)]
+        assert len(backfilled[1]) == 1
+
+        # The backfill of the migration computes the same tiles as the tiles service.
+        async with AsyncSession(legacy) as db:
+            await tiles.rebuild(db)
+        async with legacy.connect() as conn:
+            assert [(await conn.execute(text(f"SELECT * FROM {table} ORDER BY geohash"))).all() for table in ("tiles", "tile_reviews")] == backfilled
+    finally:
+        await legacy.dispose()
+# endregion
+
+########################################################################################
+# region Geo
+########################################################################################
+
+def test_encode_known_geohash():
+    assert geo.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geo.encode(-25.382708, -49.265506, 8) == "6gkzwgjz"
+
+def test_decode_bbox_contains_point():
+    lat_min, lat_max, lon_min, lon_max = geo.decode_bbox(geo.encode(4.711, -74.072, 7))
+    assert lat_min <= 4.711 <= lat_max
+    assert lon_min <= -74.072 <= lon_max
+
+def test_neighbors_wrap_antimeridian():
+    cells = geo.neighbors(geo.encode(0.0, 179.99, 4))
+    assert len(cells) == 9
+    assert any(cell == geo.encode(0.0, -179.99, 4) for cell in cells)
+
+def test_prefix_range():
+    assert geo.prefix_range("u4pr") == ("u4pr", "u4ps")
+    assert geo.prefix_range("u4z") == ("u4z", "u5")
+    assert geo.prefix_range("zz") == ("zz", None)
+
+def test_bbox_cells_cover_box():
+    assert len(geo.bbox_cells(-90, 90, -180, 180)) == 32
+    cells = geo.bbox_cells(4.5, 4.8, -74.2, -74.0, max_cells=16)
+    assert len(cells) <= 16
+    for latitude, longitude in [(4.5, -74.2), (4.8, -74.0), (4.65, -74.1)]:
+        assert any(geo.encode(latitude, longitude).startswith(cell) for cell in cells)
+
+def test_precision_for_zoom():
+    precisions = [geo.precision_for_zoom(zoom) for zoom in range(23)]
+    assert precisions == sorted(precisions)
+    assert precisions[0] == 1 and precisions[-1] == geo.GEOHASH_PRECISION
+
+def test_haversine_km():
+    distances = geo.haversine_km(4.711, -74.072, [4.711, 6.2442], [-74.072, -75.5812])
+    assert distances[0] == pytest.approx(0.0)
+    assert distances[1] == pytest.approx(239.6, abs=1.0)
 # endregion
 
+########################################################################################
+# region Metrics
+########################################################################################
+
+@pytest.mark.asyncio
+async def test_metrics_record_routes_and_queries(client: AsyncClient):
+    location_id = (await client.post("/locations/", json={"latitude": 1.5, "longitude": 1.5})).json()["id"]
+    await client.get(f"/locations/{location_id}")
+    labels = ("GET", "/api/locations/{location_id}")
+    assert metrics.http_request_duration.count(*labels) >= 1
+    assert metrics.db_queries.value() > 0
+
+    response = await client.get("../metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/locations/{location_id}"}' in response.text
+    assert 'http_responses_total{method="POST",route="/api/locations/",status="201"} ' in response.text
+    assert "http_requests_in_progress 1" in response.text
+    assert 'cache_hits_total{cache="locations"}' in response.text
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("test_seconds", "Test histogram.", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe("/", value=value)
+    assert histogram.samples() == [
+        'test_seconds_bucket{route="/",le="0.1"} 2',
+        'test_seconds_bucket{route="/",le="1.0"} 3',
+        'test_seconds_bucket{route="/",le="+Inf"} 4',
+        'test_seconds_sum{route="/"} 3.65',
+        'test_seconds_count{route="/"} 4',
+    ]
+
+def test_query_recorder_nesting_and_repeats():
+    with queries.recording() as outer:
+        with queries.recording() as inner:
+            for _ in range(3):
+                inner.record("SELECT * FROM locations WHERE id = ?", 0.001)
+        outer.record("SELECT 1", 0.001)
+    assert (inner.count, outer.count) == (3, 4)
+    assert inner.repeated(threshold=3) == {"SELECT * FROM locations WHERE id = ?": 3}
+    assert outer.repeated(threshold=4) == {}
+    assert queries.current() is None
 
+@pytest.mark.asyncio
+async def test_slow_query_log_captures_plan(client: AsyncClient, monkeypatch, caplog):
+    monkeypatch.setattr(queries, "SLOW_QUERY_SECONDS", 1e-9)
+    monkeypatch.setattr(queries, "SLOW_QUERY_EXPLAIN", True)
+    with caplog.at_level("WARNING", logger=queries.__name__):
+        await client.get("/locations/", params={"limit": 5})
+    slow = [record.getMessage() for record in caplog.records if record.name == queries.__name__]
+    assert any("FROM locations" in message and "Plan:" in message for message in slow)
+# endregion
+
+########################################################################################
+# region Tiles
+########################################################################################
+
+@pytest.mark.asyncio
+async def test_tiles_follow_writes(client: AsyncClient):
+    prefix = geo.encode(50.0, -30.0, 3)
+    locations = (await client.post("/locations/bulk", json=[{"latitude": 50.0 + index * 0.001, "longitude": -30.0} for index in range(4)])).json()["created"]
+    category_id = (await client.post("/categories/", json={"name": "Tile Category"})).json()["id"]
+    relations = [(await client.post("/recommendations/", json={"location_id": location["id"], "category_id": category_id})).json()
+                 for location in locations[:3]]
+    await client.post(f"/recommendations/{relations[0]['id']}/review")
+    old_review = (datetime.utcnow() - timedelta(days=40)).isoformat()
+    await client.post("/recommendations/review/bulk", json=[{"id": relations[1]["id"], "reviewed_at": old_review}])
+
+    response = await client.get("/tiles/", params={"precision": 3, "prefix": prefix})
+    assert response.status_code == 200
+    assert response.json() == [{"geohash": prefix, "locations": 4, "relations": 3, "never_reviewed": 1, "stale": 1}]
+
+    await client.delete(f"/recommendations/{relations[1]['id']}")
+    await client.delete(f"/locations/{locations[3]['id']}")
+    async with TestingSessionLocal() as db:
+        await crud_locations.update_location(db, locations[2]["id"], schemas.LocationCreate(latitude=-50.0, longitude=30.0))
+    [tile] = (await client.get("/tiles/", params={"precision": 3, "prefix": prefix})).json()
+    assert (tile["locations"], tile["relations"], tile["never_reviewed"], tile["stale"]) == (2, 1, 0, 0)
+    [moved] = (await client.get("/tiles/", params={"precision": 3, "prefix": geo.encode(-50.0, 30.0, 3)})).json()
+    assert (moved["locations"], moved["relations"], moved["never_reviewed"]) == (1, 1, 1)
+
+@pytest.mark.asyncio
+async def test_tiles_by_bounding_box(client: AsyncClient):
+    await client.post("/locations/", json={"latitude": -20.0, "longitude": 60.0})
+    response = await client.get("/tiles/", params={"precision": 4, "min_latitude": -20.5, "max_latitude": -19.5,
+                                                   "min_longitude": 59.5, "max_longitude": 60.5})
+    assert response.status_code == 200
+    assert [tile["geohash"] for tile in response.json()] == [geo.encode(-20.0, 60.0, 4)]
+    assert (await client.get("/tiles/", params={"precision": 2, "prefix": "abc"})).status_code == 422
+    assert (await client.get("/tiles/", params={"precision": 2, "prefix": "u4p"})).status_code == 400
+    assert (await client.get("/tiles/", params={"min_latitude": 1})).status_code == 400
+
+@pytest.mark.asyncio
+async def test_tiles_match_rebuild(client: AsyncClient):
+    # Every write made by the previous tests kept the tiles up to date, so recomputing them changes nothing.
+    async with TestingSessionLocal() as db:
+        incremental = await tiles.get_tiles(db, precision=tiles.TILE_PRECISION)
+        await tiles.rebuild(db)
+        assert await tiles.get_tiles(db, precision=tiles.TILE_PRECISION) == incremental
+
+def test_tile_changes_skip_old_reviews():
+    today = datetime(2024, 6, 30).date()
+    changes = tiles.TileChanges(today)
+    changes.relation("u4pruydqq", datetime(2024, 6, 29, 12), -1)
+    changes.relation("u4pruydqq", datetime(2024, 6, 30, 9))
+    changes.relation("u4pruydqq", datetime(2024, 1, 1))
+    tile = "u4pruydqq"[:tiles.TILE_PRECISION]
+    assert dict(changes.counts) == {tile: [0, 1, 0]}
+    assert dict(changes.reviews) == {(tile, datetime(2024, 6, 29).date()): -1, (tile, today): 1}
+# endregion
+
+
+
+########################################################################################
+# region Shared cache
+########################################################################################
+
+def test_cache_backend_must_implement_every_method():
+    class IncompleteBackend(CacheBackend):
+        async def get_many(self, keys):
+            return [None] * len(keys)
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+    assert not MemoryBackend().shared
+
+@pytest.mark.asyncio
+async def test_redis_backend_commands_and_messages():
+    async with FakeRedis() as server:
+        backend = RedisBackend(server.url)
+        await backend.set_many({"a": b"1", "b": b"2"}, ttl=60)
+        assert await backend.get_many(["a", "missing", "b"]) == [b"1", None, b"2"]
+        await backend.delete(["a"])
+        assert await backend.get_many(["a"]) == [None]
+        with pytest.raises(CacheBackendError):
+            await backend.execute(("NOPE",))
+
+        received = []
+        subscribed = asyncio.Event()
+        listener = asyncio.ensure_future(backend.listen("changes", received.append, subscribed.set))
+        await subscribed.wait()
+        await backend.publish("changes", "hello")
+        while not received:
+            await asyncio.sleep(0.01)
+        assert received == [b"hello"]
+
+        # A dropped subscription is reported as a backend error, and commands reconnect.
+        server.drop_connections()
+        with pytest.raises(CacheBackendError):
+            await listener
+        assert await backend.get_many(["b"]) == [b"2"]
+        await backend.close()
+
+    with pytest.raises(CacheBackendError):
+        await RedisBackend("redis://127.0.0.1:1/0").get_many(["a"])
+
+@pytest.mark.asyncio
+async def test_shared_cache_between_workers(client: AsyncClient, query_budget):
+    async with FakeRedis() as server:
+        await cache.connect(server.url)
+        try:
+            location_id = (await client.post("/locations/", json={"latitude": 14.0, "longitude": 14.0})).json()["id"]
+            await client.get(f"/locations/{location_id}")
+            # A worker that never read the location finds it in the shared cache, without querying the database.
+            cache.clear()
+            with query_budget(0):
+                assert (await client.get(f"/locations/{location_id}")).json()["id"] == location_id
+            assert cache.locations.stats()["shared_hits"] == 1
+
+            # Writes are announced to the other workers.
+            messages = []
+            subscribed = asyncio.Event()
+            other_worker = RedisBackend(server.url)
+            listener = asyncio.ensure_future(other_worker.listen(cache.CACHE_CHANNEL, lambda message: messages.append(json.loads(message)), subscribed.set))
+            await subscribed.wait()
+            await client.delete(f"/locations/{location_id}")
+            while not any(message["kind"] == "table" for message in messages):
+                await asyncio.sleep(0.01)
+            assert {"kind": "location", "id": location_id} in [{"kind": message["kind"], "id": message.get("id")} for message in messages]
+            assert all(key.decode().split(":")[-1] != str(location_id) for key in server.data)
+            listener.cancel()
+            await other_worker.close()
+        finally:
+            await cache.close()
+
+@pytest.mark.asyncio
+async def test_resubscribe_reloads_queue_and_index(client: AsyncClient, monkeypatch):
+    monkeypatch.setattr(cache, "RECONNECT_DELAY_SECONDS", 0.01)
+    monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+    async with FakeRedis() as server:
+        await cache.connect(server.url)
+        try:
+            while not server.subscribers():
+                await asyncio.sleep(0.01)
+            # Changes whose messages were lost during an outage leave the worker behind the database.
+            recommendation_queue.apply_message({"op": "upsert", "relations": [[434343, 1, 1, None]]})
+            category_search.index.apply_message({"op": "upsert", "categories": [[434343, "Lost Outage Category", "2024-01-01T00:00:00"]]})
+
+            async def reloaded():
+                while 434343 in recommendation_queue or not recommendation_queue.ready or category_search.index.search("lost outage", 1):
+                    await asyncio.sleep(0.01)
+
+            server.drop_connections()
+            await asyncio.wait_for(reloaded(), 5)
+            assert recommendation_queue.fresh(1)
+        finally:
+            await cache.close()
+
+@pytest.mark.asyncio
+async def test_messages_from_other_workers(client: AsyncClient):
+    location = schemas.Location(id=424242, latitude=1.0, longitude=2.0, created_at=datetime(2024, 1, 1))
+    cache.locations.local.set(location.id, location)
+    cache.dispatch(json.dumps({"sender": "other", "kind": "location", "id": location.id}).encode())
+    assert cache.locations.local.get(location.id, None) is None
+
+    version = etags.version("categories")
+    cache.dispatch(json.dumps({"sender": "other", "kind": "table", "table": "categories"}).encode())
+    assert etags.version("categories") == version + 1
+    # Messages of this worker come back from the channel and are ignored.
+    cache.dispatch(json.dumps({"sender": cache.SENDER, "kind": "table", "table": "categories"}).encode())
+    assert etags.version("categories") == version + 1
+
+    assert recommendation_queue.ready
+    upsert = {"sender": "other", "kind": "queue", "op": "upsert", "relations": [[424242, 1, 1, None]]}
+    cache.dispatch(json.dumps(upsert).encode())
+    assert 424242 in [relation.id for relation in recommendation_queue.never_reviewed(100000)]
+    lease = {"sender": "other", "kind": "queue", "op": "lease", "ids": [424242], "until": str(datetime.utcnow() + timedelta(minutes=5))}
+    cache.dispatch(json.dumps(lease).encode())
+    assert 424242 not in [relation.id for relation in recommendation_queue.never_reviewed(100000)]
+    cache.dispatch(json.dumps({"sender": "other", "kind": "queue", "op": "remove", "ids": [424242]}).encode())
+    assert 424242 not in [relation.id for relation in recommendation_queue.fresh(100000)]
+# endregion
+
+
+########################################################################################
+# region Benchmarks
+########################################################################################
+
+@pytest.mark.asyncio
+async def test_benchmark_seed_and_run(client: AsyncClient):
+    async with TestingSessionLocal() as db:
+        counts = await seed.seed(db, locations=40, categories=5, relations=100, never_reviewed=0.5, chunk_size=30)
+        bounds = await runner.dataset_bounds(db)
+    assert counts["locations"] == 40 and counts["categories"] == 5 and counts["location_category_reviewed"] == 100
+    assert 0 < counts["reviews"] < 100
+    assert bounds["points"]
+
+    scenarios = [scenario for scenario in runner.SCENARIOS if not scenario.name.endswith(".export")]
+    report = await runner.run(client, bounds, scenarios, requests=4, concurrency=2)
+    assert set(report["scenarios"]) == {scenario.name for scenario in scenarios}
+    for name, result in report["scenarios"].items():
+        assert result["requests"] == 4
+        assert result["errors"] == 0, name
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"] <= result["latency_ms"]["max"]
+
+    slower = json.loads(json.dumps(report))
+    slower["scenarios"]["locations.list"]["latency_ms"]["p95"] = report["scenarios"]["locations.list"]["latency_ms"]["p95"] * 2 + 1
+    assert runner.compare(report, report) == []
+    assert runner.compare(slower, report) == [f"locations.list: p95 {report['scenarios']['locations.list']['latency_ms']['p95']:.1f} ms -> "
+                                              f"{slower['scenarios']['locations.list']['latency_ms']['p95']:.1f} ms"]
+
+@pytest.mark.asyncio
+async def test_list_fast_path_matches_legacy_serialization(client: AsyncClient):
+    async with TestingSessionLocal() as db:
+        report = await benchmark_serialization.compare_lists(db, limit=50, repeat=1)
+    assert set(report) == {"locations", "categories", "relations"}
+    assert all(result["rows"] > 0 and result["fast_ms"] > 0 for result in report.values())
+
+@pytest.mark.asyncio
+async def test_startup_benchmark():
+    report = await benchmark_startup.measure(test_engine, repeat=1)
+    assert set(report) == {"import app.main", "import app.cli", "schema check", "legacy create_all", "queue warm",
+                           "category index warm"}
+    assert all(step["median_ms"] > 0 for step in report.values())
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert runner.percentile(values, 50) == 50
+    assert runner.percentile(values, 95) == 95
+    assert runner.percentile(values, 99) == 99
+    assert runner.percentile([7], 99) == 7
+    assert runner.percentile([], 50) == 0.0
+# endregion